@@ -2,7 +2,7 @@
 import os
 import sqlite3
 from datetime import date, datetime, timedelta
-from typing import List, Dict, Optional, Set
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 DB_PATH = os.getenv("ATT_DB", "/var/lib/attendance/attendance.db")
 
@@ -80,46 +80,125 @@ def parse_weekdays(weekdays_text: str) -> Set[int]:
 # Core: resolve shifts for a user + date
 # ----------------------------
 def get_user_schedule_template_id(employee_id: str) -> Optional[int]:
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT schedule_template_id FROM users WHERE employee_id = ?",
-        (employee_id,)
-    ).fetchone()
-    conn.close()
-    if not row:
+    # Served from the versioned schedule cache (no SQL when warm)
+    from services.schedule_cache import get_snapshot
+    return get_snapshot().user_template_ids.get(str(employee_id))
+
+
+def get_template_rules(template_id: int) -> List[Dict]:
+    """Rules ordered by priority, id."""
+    from services.schedule_cache import get_snapshot
+    return get_snapshot().rules_by_template.get(int(template_id), [])
+
+
+def get_rule_shifts(rule_id: int) -> List[Dict]:
+    """Shifts ordered by start_time, end_time, id."""
+    from services.schedule_cache import get_snapshot
+    return get_snapshot().shifts_by_rule.get(int(rule_id), [])
+
+
+# ----------------------------
+# Compiled templates
+# A template is compiled once per schedule-cache version into
+# 7 per-weekday tuples of ready-made shift dicts. Rules are matched
+# with weekday bitmasks; shift times are kept as minute offsets
+# (end > start, +1440 for overnight) for arithmetic callers.
+# ----------------------------
+class CompiledShift(NamedTuple):
+    rule_id: int
+    shift_id: int
+    start_min: Optional[int]
+    end_min: Optional[int]
+    grace_minutes: int
+    break_minutes: int
+    start_time: str
+    end_time: str
+
+
+class CompiledTemplate(NamedTuple):
+    template_id: int
+    # (bitmask, shifts) per rule, in priority order
+    rules: Tuple[Tuple[int, Tuple[CompiledShift, ...]], ...]
+    # weekday (Mon=0) -> matching shifts, in rule then shift order
+    by_weekday: Tuple[Tuple[CompiledShift, ...], ...]
+    # weekday -> output dicts (get_expected_shifts_for_user shape)
+    expected: Tuple[Tuple[Dict, ...], ...]
+
+
+def weekday_mask(weekdays_text: str) -> int:
+    """parse_weekdays() as a bitmask (bit 0 = Monday)."""
+    mask = 0
+    for d in parse_weekdays(weekdays_text):
+        mask |= 1 << d
+    return mask
+
+
+def _minutes(hhmm) -> Optional[int]:
+    try:
+        h, m = str(hhmm).split(":")[:2]
+        return int(h) * 60 + int(m)
+    except (TypeError, ValueError):
         return None
-    tid = row["schedule_template_id"]
-    return int(tid) if tid is not None else None
-
-
-def get_template_rules(template_id: int) -> List[sqlite3.Row]:
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT id, template_id, weekdays, priority
-        FROM schedule_rules
-        WHERE template_id = ?
-        ORDER BY priority ASC, id ASC
-        """,
-        (template_id,)
-    ).fetchall()
-    conn.close()
-    return rows
-
-
-def get_rule_shifts(rule_id: int) -> List[sqlite3.Row]:
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT id, rule_id, start_time, end_time, grace_minutes, break_minutes
-        FROM schedule_shifts
-        WHERE rule_id = ?
-        ORDER BY start_time ASC, end_time ASC, id ASC
-        """,
-        (rule_id,)
-    ).fetchall()
-    conn.close()
-    return rows
+
+
+def compile_template(snap, template_id: int) -> CompiledTemplate:
+    rules = []
+    for r in snap.rules_by_template.get(int(template_id), []):
+        shifts = []
+        for sh in snap.shifts_by_rule.get(int(r["id"]), []):
+            start_min = _minutes(sh["start_time"])
+            end_min = _minutes(sh["end_time"])
+            if start_min is not None and end_min is not None and end_min <= start_min:
+                end_min += 24 * 60  # overnight
+            shifts.append(CompiledShift(
+                rule_id=int(r["id"]),
+                shift_id=int(sh["id"]),
+                start_min=start_min,
+                end_min=end_min,
+                grace_minutes=int(sh["grace_minutes"] or 0),
+                break_minutes=int(sh["break_minutes"] or 0),
+                start_time=sh["start_time"],
+                end_time=sh["end_time"],
+            ))
+        rules.append((weekday_mask(r["weekdays"]), tuple(shifts)))
+
+    by_weekday = tuple(
+        tuple(sh for mask, shifts in rules if mask >> wd & 1 for sh in shifts)
+        for wd in range(7)
+    )
+    expected = tuple(
+        tuple(
+            {
+                "template_id": int(template_id),
+                "rule_id": sh.rule_id,
+                "shift_id": sh.shift_id,
+                "start_time": sh.start_time,
+                "end_time": sh.end_time,
+                "grace_minutes": sh.grace_minutes,
+                "break_minutes": sh.break_minutes,
+            }
+            for sh in day
+        )
+        for day in by_weekday
+    )
+    return CompiledTemplate(int(template_id), tuple(rules), by_weekday, expected)
+
+
+def get_compiled_template(template_id: int, snap=None) -> CompiledTemplate:
+    """
+    Compiled template, cached until the next schedule edit. The memo
+    lives on the schedule snapshot, so a template is only ever stored
+    with the version it was compiled from.
+    """
+    from services.schedule_cache import get_snapshot
+
+    snap = snap or get_snapshot()
+    tid = int(template_id)
+    ct = snap.compiled_templates.get(tid)
+    if ct is None:
+        ct = compile_template(snap, tid)
+        snap.compiled_templates[tid] = ct
+    return ct
 
 
 def get_expected_shifts_for_user(employee_id: str, day: date) -> List[Dict]:
@@ -144,28 +223,30 @@ def get_expected_shifts_for_user(employee_id: str, day: date) -> List[Dict]:
     if not template_id:
         return []
 
-    weekday = day.weekday()  # Mon=0 ... Sun=6
-
-    matched = []
-    rules = get_template_rules(template_id)
-    for r in rules:
-        wset = parse_weekdays(r["weekdays"])
-        if weekday not in wset:
-            continue
+    # Mon=0 ... Sun=6
+    return [dict(sh) for sh in get_compiled_template(template_id).expected[day.weekday()]]
 
-        shifts = get_rule_shifts(r["id"])
-        for sh in shifts:
-            matched.append({
-                "template_id": template_id,
-                "rule_id": int(r["id"]),
-                "shift_id": int(sh["id"]),
-                "start_time": sh["start_time"],
-                "end_time": sh["end_time"],
-                "grace_minutes": int(sh["grace_minutes"] or 0),
-                "break_minutes": int(sh["break_minutes"] or 0),
-            })
 
-    return matched
+def get_expected_shifts_for_users(
+    employee_ids: Iterable[str],
+    days: Iterable[date],
+) -> Dict[Tuple[str, date], List[Dict]]:
+    """
+    Batch form of get_expected_shifts_for_user() (e.g. a department's
+    week): {(employee_id, day): [shift, ...]}. Employees without an
+    advanced schedule get [] for every day. No SQL when the cache is warm.
+    """
+    from services.schedule_cache import get_snapshot
+
+    snap = get_snapshot()
+    days = list(days)
+    out: Dict[Tuple[str, date], List[Dict]] = {}
+    for emp in employee_ids:
+        template_id = snap.user_template_ids.get(str(emp))
+        expected = get_compiled_template(template_id, snap).expected if template_id else None
+        for d in days:
+            out[(emp, d)] = [dict(sh) for sh in expected[d.weekday()]] if expected else []
+    return out
 
 
 # ----------------------------
@@ -193,29 +274,24 @@ def build_weekly_grid(template_id: int):
     """
     Returns a structure suitable for a weekly grid UI.
     """
-    conn = get_conn()
-
-    rules = conn.execute(
-        """
-        SELECT r.id, r.weekdays, s.start_time, s.end_time
-        FROM schedule_rules r
-        JOIN schedule_shifts s ON s.rule_id = r.id
-        WHERE r.template_id = ?
-        ORDER BY r.priority, s.start_time
-        """,
-        (template_id,),
-    ).fetchall()
+    from services.schedule_cache import get_snapshot
 
-    conn.close()
+    snap = get_snapshot()
+    rules = [
+        (r["priority"], sh["start_time"], r["weekdays"], sh["end_time"])
+        for r in snap.rules_by_template.get(int(template_id), [])
+        for sh in snap.shifts_by_rule.get(int(r["id"]), [])
+    ]
+    rules.sort(key=lambda x: (x[0], x[1]))
 
     grid = {d: [] for d in WEEKDAYS}
 
-    for r in rules:
-        days = parse_weekdays(r["weekdays"])
+    for _priority, start_time, weekdays, end_time in rules:
+        days = parse_weekdays(weekdays)
         for idx, label in enumerate(WEEKDAYS):
             if idx in days:
                 grid[label].append(
-                    f'{r["start_time"]} – {r["end_time"]}'
+                    f'{start_time} – {end_time}'
                 )
 
     return grid
@@ -1,6 +1,7 @@
-from datetime import datetime
 from collections import defaultdict
 
+from services.timestamps import parse_iso
+
 
 def fetch_raw_events(conn, start_date, end_date):
     """
@@ -27,7 +28,9 @@ def fetch_raw_events(conn, start_date, end_date):
     grouped = defaultdict(lambda: defaultdict(list))
 
     for employee_id, device_id, ts, direction in cur.fetchall():
-        dt = datetime.fromisoformat(ts)
+        dt = parse_iso(ts)
+        if dt is None:
+            continue
 
         grouped[str(employee_id)][dt.date()].append({
             "employee_id": str(employee_id),
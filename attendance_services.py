@@ -1,7 +1,7 @@
 # attendance_services.py
 from datetime import datetime, timedelta, date
-from dateutil import parser
 from db import get_conn, get_setting
+from services.timestamps import parse_iso
 from translations import LANG
 
 def normalize_ts(ts: str) -> str:
@@ -84,10 +84,11 @@ def get_first_in_last_out(start: datetime, end: datetime):
     conn.close()
 
     result = {}
+    # Parsed in/out per (emp, day): never re-parse the stored strings
+    bounds = {}
     for emp, name, ts, evtype in rows:
-        try:
-            dt = parser.parse(ts)
-        except Exception:
+        dt = parse_iso(ts)
+        if dt is None:
             continue
 
         day = dt.date().isoformat()
@@ -96,25 +97,29 @@ def get_first_in_last_out(start: datetime, end: datetime):
             result[emp] = {"name": name, "days": {}, "total_hours": 0.0}
         if day not in result[emp]["days"]:
             result[emp]["days"][day] = {"in": None, "out": None, "hours": 0.0}
+            bounds[(emp, day)] = [None, None]
 
         rec = result[emp]["days"][day]
+        b = bounds[(emp, day)]
 
         if evtype == "IN":
-            if rec["in"] is None or dt < parser.parse(rec["in"]):
+            if b[0] is None or dt < b[0]:
+                b[0] = dt
                 rec["in"] = dt.isoformat()
         elif evtype == "OUT":
-            if rec["out"] is None or dt > parser.parse(rec["out"]):
+            if b[1] is None or dt > b[1]:
+                b[1] = dt
                 rec["out"] = dt.isoformat()
 
     for emp, data in result.items():
         total = 0.0
         for day, rec in data["days"].items():
-            if rec["in"] and rec["out"]:
+            t1, t2 = bounds[(emp, day)]
+            if t1 is not None and t2 is not None:
                 try:
-                    t1 = parser.parse(rec["in"])
-                    t2 = parser.parse(rec["out"])
                     hrs = max(0.0, (t2 - t1).total_seconds() / 3600.0)
-                except Exception:
+                except TypeError:
+                    # naive vs offset-aware mix
                     hrs = 0.0
             else:
                 hrs = 0.0
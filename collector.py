@@ -16,6 +16,7 @@ from flask import g
 # IMPORTANT:
 # Use the application's DB path consistently (ATT_DB) via db.py
 from db import get_conn as _get_conn
+from services.timestamps import parse_iso, normalize_ts as _normalize_ts
 
 # --------------------------------------------------
 # Config
@@ -34,10 +35,7 @@ def get_conn():
 # Timestamp normalization
 # --------------------------------------------------
 def normalize_ts(ts: str) -> str:
-    dt = dtparser.parse(ts)
-    if dt.tzinfo:
-        dt = dt.astimezone().replace(tzinfo=None)
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+    return _normalize_ts(ts)
 
 
 # --------------------------------------------------
@@ -150,6 +148,7 @@ def store_events(device_id, events):
     conn = get_conn()
     cur = conn.cursor()
     inserted = 0
+    new_rows = []
 
     for e in events:
         if not e.get("employee_id") or not e.get("timestamp"):
@@ -166,11 +165,23 @@ def store_events(device_id, events):
             )
             if cur.rowcount:
                 inserted += 1
+                new_rows.append({
+                    "id": cur.lastrowid,
+                    "device_id": device_id,
+                    "employee_id": e["employee_id"],
+                    "name": e.get("name"),
+                    "timestamp": norm_ts,
+                })
         except Exception:
             continue
 
     conn.commit()
     conn.close()
+
+    # Push to open dashboard / daily pages
+    from services.live_events import notify_events
+    notify_events(new_rows)
+
     return inserted
 
 
@@ -328,9 +339,12 @@ def export_fifo_excel(output_path, start_date, end_date, week_dates=None):
     for r in rows:
         emp = r["employee_id"]
         data.setdefault(emp, {"name": r["name"], "days": {}})
+        # Wall clock as punched (offset values keep their own clock)
+        first_in = parse_iso(r["first_in"])
+        last_out = parse_iso(r["last_out"])
         data[emp]["days"][r["day"]] = {
-            "in": dtparser.parse(r["first_in"]).strftime("%H:%M") if r["first_in"] else "",
-            "out": dtparser.parse(r["last_out"]).strftime("%H:%M") if r["last_out"] else "",
+            "in": first_in.strftime("%H:%M") if first_in else "",
+            "out": last_out.strftime("%H:%M") if last_out else "",
         }
 
     T = getattr(g, "T", {}) or {}
@@ -3,13 +3,16 @@ REST API for PiServer Attendance System
 Provides endpoints for external integrations
 """
 
-from flask import Blueprint, jsonify, request, g
+from flask import Blueprint, Response, jsonify, request, g
 from functools import wraps
 from datetime import datetime, date, timedelta
+import json
 import secrets
 
 from db import get_conn
 from authz import login_required
+from services import api_keys, attendance_range, change_feed, event_ingest
+from services.http_cache import conditional, today_window
 
 bp = Blueprint("api", __name__, url_prefix="/api/v1")
 
@@ -27,22 +30,16 @@ def api_key_required(f):
         if not api_key:
             return jsonify({"error": "API key required"}), 401
         
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Check if API key exists and is active
-        key_data = cur.execute(
-            "SELECT * FROM api_keys WHERE key = ? AND active = 1",
-            (api_key,)
-        ).fetchone()
-        
-        conn.close()
+        # Cached lookup (hashed key, TTL); usage is written in batches
+        key_data = api_keys.lookup(api_key)
         
         if not key_data:
             return jsonify({"error": "Invalid API key"}), 401
         
+        api_keys.record_use(key_data['id'])
+        
         # Store key info in g for use in endpoint
-        g.api_key = dict(key_data)
+        g.api_key = key_data
         
         return f(*args, **kwargs)
     return decorated_function
@@ -52,6 +49,20 @@ def api_key_required(f):
 # API Endpoints
 # =============================================================================
 
+def _range_window():
+    """Events window of start_date / end_date (ValueError when invalid)."""
+    return (date.fromisoformat(request.args.get('start_date', '')),
+            date.fromisoformat(request.args.get('end_date', '')))
+
+
+def _month_window():
+    """Events window of year / month (ValueError when invalid)."""
+    from calendar import monthrange
+    year = int(request.args.get('year', date.today().year))
+    month = int(request.args.get('month', date.today().month))
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
 @bp.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
@@ -64,6 +75,7 @@ def health_check():
 
 @bp.route("/users", methods=["GET"])
 @api_key_required
+@conditional("users")
 def get_users():
     """Get all users"""
     conn = get_conn()
@@ -91,6 +103,7 @@ def get_users():
 
 @bp.route("/users/<employee_id>", methods=["GET"])
 @api_key_required
+@conditional("users", "events", days=today_window)
 def get_user(employee_id):
     """Get specific user details"""
     conn = get_conn()
@@ -130,6 +143,7 @@ def get_user(employee_id):
 
 @bp.route("/attendance/today", methods=["GET"])
 @api_key_required
+@conditional("users", "events", days=today_window)
 def get_today_attendance():
     """Get today's attendance summary"""
     today = date.today().isoformat()
@@ -180,8 +194,17 @@ def get_today_attendance():
 
 @bp.route("/attendance/range", methods=["GET"])
 @api_key_required
+@conditional("users", "events", days=_range_window)
 def get_attendance_range():
-    """Get attendance for a date range"""
+    """
+    Get attendance for a date range, one row per employee and day in
+    (date, employee_id) order.
+
+    JSON pages: ?limit= (default 500, max 5000) and ?cursor= from the
+    previous page's "next" (null on the last page).
+    NDJSON stream of the whole range (or the rest after ?cursor=):
+    Accept: application/x-ndjson or ?format=ndjson
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
@@ -189,37 +212,46 @@ def get_attendance_range():
         return jsonify({"error": "start_date and end_date parameters required"}), 400
     
     try:
-        # Validate dates
-        datetime.fromisoformat(start_date)
-        datetime.fromisoformat(end_date)
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    conn = get_conn()
-    cur = conn.cursor()
+    cursor = request.args.get('cursor') or None
+    streaming = (
+        request.args.get('format') == 'ndjson'
+        or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+        == 'application/x-ndjson'
+    )
+    
+    if streaming:
+        try:
+            after = attendance_range.decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def generate():
+            for row in attendance_range.iter_rows(start, end, after):
+                yield json.dumps(row) + "\n"
+        
+        return Response(generate(), mimetype="application/x-ndjson")
     
-    attendance_data = cur.execute("""
-        SELECT
-            DATE(e.timestamp) as date,
-            e.employee_id,
-            u.name,
-            MIN(e.timestamp) as first_in,
-            MAX(e.timestamp) as last_out,
-            COUNT(*) as event_count
-        FROM events e
-        LEFT JOIN users u ON u.employee_id = e.employee_id
-        WHERE DATE(e.timestamp) BETWEEN ? AND ?
-        GROUP BY date, e.employee_id
-        ORDER BY date, u.name
-    """, (start_date, end_date)).fetchall()
+    try:
+        limit = int(request.args.get('limit', attendance_range.PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
     
-    conn.close()
+    try:
+        rows, next_cursor = attendance_range.page(start, end, limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     return jsonify({
         "start_date": start_date,
         "end_date": end_date,
-        "attendance": [dict(a) for a in attendance_data],
-        "count": len(attendance_data)
+        "attendance": rows,
+        "count": len(rows),
+        "next": next_cursor
     })
 
 
@@ -276,6 +308,16 @@ def create_event():
         conn.commit()
         event_id = cur.lastrowid
         conn.close()
+
+        from services.live_events import notify_events
+        notify_events([{
+            "id": event_id,
+            "device_id": data.get('device_id', 0),
+            "employee_id": data['employee_id'],
+            "name": user['name'],
+            "timestamp": data['timestamp'],
+            "direction": data['direction'],
+        }])
         
         return jsonify({
             "success": True,
@@ -288,8 +330,55 @@ def create_event():
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/events/bulk", methods=["POST"])
+@api_key_required
+def create_events_bulk():
+    """
+    Create many attendance events in one transaction (offline buffers).
+
+    Body: a JSON array (or {"events": [...]}) or NDJSON
+    (Content-Type: application/x-ndjson), each item shaped like
+    POST /events plus an optional "client_event_id". Resending an item
+    with the same client_event_id returns the stored event instead of
+    inserting it again; reusing one for a different event is an error.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line_no, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                return jsonify({"error": f"Invalid JSON on line {line_no}"}), 400
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({"error": "JSON array of events required"}), 400
+    
+    if not items:
+        return jsonify({"error": "No events supplied"}), 400
+    if len(items) > event_ingest.MAX_BATCH:
+        return jsonify({"error": f"At most {event_ingest.MAX_BATCH} events per request"}), 413
+    
+    results = event_ingest.ingest(g.api_key['id'], items)
+    
+    counts = {"created": 0, "duplicate": 0, "error": 0}
+    for r in results:
+        counts[r['status']] += 1
+    
+    return jsonify({
+        "created": counts['created'],
+        "duplicates": counts['duplicate'],
+        "errors": counts['error'],
+        "results": results
+    })
+
+
 @bp.route("/reports/monthly", methods=["GET"])
 @api_key_required
+@conditional("users", "events", "schedules", days=_month_window)
 def get_monthly_report():
     """Get monthly attendance report"""
     year = request.args.get('year', date.today().year)
@@ -308,8 +397,8 @@ def get_monthly_report():
     # Calculate date range
     from calendar import monthrange
     days_in_month = monthrange(year, month)[1]
-    start_date = f"{year}-{month:02d}-01"
-    end_date = f"{year}-{month:02d}-{days_in_month}"
+    start_date = date(year, month, 1)
+    end_date = date(year, month, days_in_month)
     
     conn = get_conn()
     cur = conn.cursor()
@@ -322,38 +411,41 @@ def get_monthly_report():
         ORDER BY name
     """).fetchall()
     
-    # Get attendance data
-    attendance = cur.execute("""
-        SELECT
-            employee_id,
-            DATE(timestamp) as date,
-            MIN(timestamp) as first_in,
-            MAX(timestamp) as last_out,
-            COUNT(*) as events
-        FROM events
-        WHERE DATE(timestamp) BETWEEN ? AND ?
-        GROUP BY employee_id, date
-    """, (start_date, end_date)).fetchall()
-    
     conn.close()
     
+    # Precomputed per-employee month / day rollups
+    from services.dashboard_stats import day_rows, monthly_stats
+    emp_ids = [emp['employee_id'] for emp in employees if emp['employee_id'] is not None]
+    monthly = {r['employee_id']: r for r in monthly_stats(year, month, emp_ids)}
+    
     # Organize data by employee
     report_data = {}
     for emp in employees:
         emp_id = emp['employee_id']
+        stats = monthly.get(str(emp_id), {})
         report_data[emp_id] = {
             "employee_id": emp_id,
             "name": emp['name'],
-            "days_attended": 0,
+            "days_attended": stats.get('attended_days', 0),
             "days_absent": 0,
+            "late_days": stats.get('late_days', 0),
+            "early_days": stats.get('early_days', 0),
+            "missed_days": stats.get('missed_days', 0),
+            "worked_seconds": stats.get('worked_seconds', 0),
             "attendance": []
         }
     
-    for att in attendance:
-        emp_id = att['employee_id']
-        if emp_id in report_data:
-            report_data[emp_id]['days_attended'] += 1
-            report_data[emp_id]['attendance'].append(dict(att))
+    by_str_id = {str(emp_id): emp_id for emp_id in report_data}
+    for att in day_rows(start_date, end_date, emp_ids):
+        emp_id = by_str_id.get(att['employee_id'])
+        if emp_id is not None:
+            report_data[emp_id]['attendance'].append({
+                "employee_id": att['employee_id'],
+                "date": att['day'],
+                "first_in": att['first_event'],
+                "last_out": att['last_event'],
+                "events": att['event_count'],
+            })
     
     # Calculate absences
     for emp_id in report_data:
@@ -370,8 +462,41 @@ def get_monthly_report():
     })
 
 
+@bp.route("/changes", methods=["GET"])
+@api_key_required
+def get_changes():
+    """
+    Changes since a cursor, oldest first (incremental sync).
+
+    ?since=<cursor from "next"> (omit for the start of the log,
+    "latest" for the current position only), ?limit= (default 500,
+    max 5000). Keep calling with "next" while "has_more" is true.
+    410 when the cursor is older than the retained log. To resync,
+    take since=latest BEFORE the full copy, then continue from that
+    cursor; a cursor taken after the copy misses what changed during it.
+    """
+    try:
+        since = change_feed.parse_cursor(request.args.get('since'))
+        limit = int(request.args.get('limit', change_feed.PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "Invalid since or limit"}), 400
+    
+    try:
+        rows, next_cursor, more = change_feed.changes(since, limit)
+    except change_feed.CursorExpired:
+        return jsonify({"error": "Cursor expired, full resync required"}), 410
+    
+    return jsonify({
+        "changes": rows,
+        "count": len(rows),
+        "next": next_cursor,
+        "has_more": more
+    })
+
+
 @bp.route("/devices", methods=["GET"])
 @api_key_required
+@conditional("devices")
 def get_devices():
     """Get all registered devices"""
     conn = get_conn()
@@ -408,11 +533,14 @@ def list_api_keys():
     if g.account.get('role') != 'admin':
         return jsonify({"error": "Admin access required"}), 403
     
-    conn = get_conn()
+    # Pending usage first, so last_used / request_count are current
+    api_keys.flush_usage()
+    
+    conn = api_keys._conn()
     cur = conn.cursor()
     
     keys = cur.execute("""
-        SELECT id, name, key, active, created_at, last_used
+        SELECT id, name, key, active, created_at, last_used, request_count
         FROM api_keys
         ORDER BY created_at DESC
     """).fetchall()
@@ -435,7 +563,7 @@ def create_api_key():
     # Generate secure random key
     api_key = secrets.token_urlsafe(32)
     
-    conn = get_conn()
+    conn = api_keys._conn()
     cur = conn.cursor()
     
     cur.execute("""
@@ -446,6 +574,7 @@ def create_api_key():
     conn.commit()
     key_id = cur.lastrowid
     conn.close()
+    api_keys.invalidate()
     
     return jsonify({
         "id": key_id,
@@ -473,6 +602,7 @@ def delete_api_key(key_id):
         return jsonify({"error": "API key not found"}), 404
     
     conn.close()
+    api_keys.invalidate()
     
     return jsonify({"message": "API key deleted"})
 
@@ -489,7 +619,8 @@ CREATE TABLE IF NOT EXISTS api_keys (
     key TEXT UNIQUE NOT NULL,
     active INTEGER DEFAULT 1,
     created_at TEXT NOT NULL,
-    last_used TEXT
+    last_used TEXT,
+    request_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE INDEX idx_api_keys_key ON api_keys(key);
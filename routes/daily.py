@@ -8,6 +8,7 @@ from datetime import datetime, time
 from db import get_conn, list_devices
 
 from authz import login_required, role_required
+from services.http_cache import arg_day_window, conditional
 
 bp = Blueprint("daily", __name__, url_prefix="/daily")
 
@@ -75,6 +76,7 @@ def query_events_daily(day_str: str, user: str | None = None, device: str | None
 @bp.route("/", methods=["GET"], endpoint="daily")
 @login_required
 @role_required("viewer", "manager", "admin")
+@conditional("events", "devices", "settings", days=arg_day_window("date"), html=True)
 def daily_view():
     T = g.T
     user = request.args.get("user") or None
@@ -116,4 +118,6 @@ def daily_view():
         daily_date=day.isoformat(),
         week_start=None,
         week_end=None,
+        # New punches are pushed to today's page
+        live=day == datetime.now().date(),
     )
@@ -9,6 +9,7 @@ import io
 from db import list_devices
 from services.query_helpers import query_events_range
 from services.user_helpers import list_users
+from services.timestamps import parse_iso
 
 from authz import login_required, role_required
 
@@ -93,9 +94,8 @@ def daily_audit():
         ts_str = r[4]
         device_name = r[6] if len(r) > 6 else "-"
 
-        try:
-            ts = datetime.fromisoformat(ts_str)
-        except Exception:
+        ts = parse_iso(ts_str)
+        if ts is None:
             continue
 
         # ✅ Filter by LOCAL date here
@@ -137,6 +137,18 @@ def daily_audit_export():
     if not selected_date:
         return "Invalid date", 400
 
+    return Response(
+        build_audit_csv(selected_date, user, device),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition":
+            f"attachment; filename=audit_{selected_date.isoformat()}.csv"
+        },
+    )
+
+
+def build_audit_csv(selected_date, user=None, device=None):
+    """Audit CSV text for one local date (optionally one user / device)."""
     query_start = datetime.combine(selected_date - timedelta(days=1), time.min)
     query_end   = datetime.combine(selected_date + timedelta(days=1), time.max)
 
@@ -152,8 +164,8 @@ def daily_audit_export():
     writer.writerow(["Employee ID", "Employee Name", "Timestamp", "Device"])
 
     for r in rows:
-        ts = datetime.fromisoformat(r[4])
-        if ts.date() != selected_date:
+        ts = parse_iso(r[4])
+        if ts is None or ts.date() != selected_date:
             continue
 
         writer.writerow([
@@ -163,11 +175,4 @@ def daily_audit_export():
             r[6] if len(r) > 6 else "-",
         ])
 
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={
-            "Content-Disposition":
-            f"attachment; filename=audit_{selected_date.isoformat()}.csv"
-        },
-    )
+    return output.getvalue()
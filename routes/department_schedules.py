@@ -6,6 +6,7 @@ Allows bulk assignment of schedules to entire departments
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g
 from db import get_conn
 from authz import login_required
+from services.schedule_cache import bump_schedule_version
 
 bp = Blueprint("department_schedules", __name__, url_prefix="/departments")
 
@@ -104,6 +105,7 @@ def assign_schedule(dept_id):
         """, (dept_id, schedule_id, effective_date or None, end_date or None))
         
         conn.commit()
+        bump_schedule_version()
         
         # Get counts
         emp_count = cur.execute("""
@@ -145,6 +147,7 @@ def remove_schedule(dept_id, assignment_id):
         """, (assignment_id, dept_id))
         
         conn.commit()
+        bump_schedule_version()
         flash("Schedule assignment removed", "success")
         
     except Exception as e:
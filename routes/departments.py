@@ -6,6 +6,7 @@ Handles department CRUD, hierarchy, and employee assignments
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g
 from db import get_conn
 from authz import login_required
+from services.schedule_cache import bump_schedule_version
 import json
 
 bp = Blueprint("departments", __name__, url_prefix="/departments")
@@ -268,6 +269,8 @@ def assign_employees(dept_id):
         """, [dept_id] + employee_ids)
         
         conn.commit()
+        # Department schedules resolve through users.department_id
+        bump_schedule_version()
         
         return jsonify({
             "success": True,
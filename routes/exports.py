@@ -0,0 +1,214 @@
+# routes/exports.py
+"""
+Background export API (services/export_jobs.py).
+
+    POST /exports/<kind>?<same args as the direct export>
+         -> 202 {"job_id", "status", "progress", "status_url", ...}
+    GET  /exports/jobs/<job_id>           -> job status / progress
+    GET  /exports/jobs/<job_id>/download  -> finished file
+
+Kinds mirror the synchronous exports:
+
+    payroll            /payroll/export
+    fifo               /reports/export_fifo
+    audit              /audit/daily/export
+    weekly_hours_pdf   /users/users/<employee_id>/weekly-hours/pdf
+                       (employee_id passed as an argument)
+    weekly_hours_bulk  /users/weekly-hours/bulk
+"""
+
+from flask import Blueprint, abort, g, jsonify, request, send_file, session, url_for
+
+from authz import login_required
+from services import export_jobs
+from services.xlsx_export import XLSX_MIMETYPE
+
+bp = Blueprint("exports", __name__, url_prefix="/exports")
+
+
+# --------------------------------------------------
+# Kinds: args -> (params, render, suffix)
+# --------------------------------------------------
+def _payroll(args):
+    from routes.payroll import build_payroll_export, period_from_args
+
+    user = (args.get("user") or "").strip()
+    _, week_start, week_end, week_dates = period_from_args(args)
+
+    def render(path, progress):
+        xl = build_payroll_export(week_start, week_end, week_dates, user=user, progress=progress)
+        xl.save(path)
+        return f"weekly_payroll_{week_start}_to_{week_end}.xlsx", XLSX_MIMETYPE
+
+    params = {"week_start": week_start, "week_end": week_end, "user": user}
+    return params, render, ".xlsx"
+
+
+def _fifo(args):
+    from routes.reports import fifo_period
+    from services.reports import build_fifo_export
+
+    start, end = fifo_period(args)
+
+    def render(path, progress):
+        build_fifo_export(start.isoformat(), end.isoformat()).save(path)
+        return "fifo_attendance.xlsx", XLSX_MIMETYPE
+
+    return {"start": start, "end": end}, render, ".xlsx"
+
+
+def _audit(args):
+    from routes.daily_audit import _parse_date, build_audit_csv
+
+    selected_date = _parse_date(args.get("date"))
+    if not selected_date:
+        abort(400, "Invalid date")
+    user = args.get("user") or None
+    device = args.get("device") or None
+
+    def render(path, progress):
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            fh.write(build_audit_csv(selected_date, user, device))
+        return f"audit_{selected_date.isoformat()}.csv", "text/csv"
+
+    params = {"date": selected_date, "user": user, "device": device}
+    return params, render, ".csv"
+
+
+def _weekly_hours_pdf(args):
+    from datetime import datetime
+    from dateutil import parser as dtparser
+    from routes.payroll import daterange, week_end_for, week_start_for
+    from routes.users import render_weekly_hours_pdf
+
+    employee_id = (args.get("employee_id") or "").strip()
+    if not employee_id:
+        abort(400, "employee_id required")
+
+    week_type = args.get("week_type", "mon_sat")
+    week_param = args.get("week")
+    week_start = (
+        dtparser.parse(week_param).date()
+        if week_param else week_start_for(datetime.now().date(), week_type)
+    )
+    week_end = week_end_for(week_start, week_type)
+    week_dates = daterange(week_start, week_end)
+
+    def render(path, progress):
+        render_weekly_hours_pdf(path, employee_id, week_start, week_end, week_dates)
+        return f"weekly_hours_{employee_id}_{week_start}.pdf", "application/pdf"
+
+    params = {"employee_id": employee_id, "week_start": week_start, "week_end": week_end}
+    return params, render, ".pdf"
+
+
+def _weekly_hours_bulk(args):
+    from services import hours_sheets
+    from routes.users import _bulk_args, render_bulk_weekly_hours
+
+    department_id, fmt, week_start, week_end, week_dates = _bulk_args(args)
+
+    def render(path, progress):
+        render_bulk_weekly_hours(
+            path, department_id, fmt, week_start, week_end, week_dates, progress=progress
+        )
+        return (
+            hours_sheets.bulk_filename(week_start, fmt, department_id),
+            "application/zip" if fmt == "zip" else "application/pdf",
+        )
+
+    params = {
+        "department_id": department_id,
+        "format": fmt,
+        "week_start": week_start,
+        "week_end": week_end,
+    }
+    return params, render, f".{fmt}"
+
+
+# kind -> (builder, roles allowed or None for any logged-in account)
+KINDS = {
+    "payroll": (_payroll, ("viewer", "manager", "admin")),
+    "fifo": (_fifo, None),
+    "audit": (_audit, ("admin", "supervisor")),  # routes.daily_audit.ALLOWED_ROLES
+    "weekly_hours_pdf": (_weekly_hours_pdf, None),
+    "weekly_hours_bulk": (_weekly_hours_bulk, ("admin", "manager")),
+}
+
+
+def _check_access(kind):
+    spec = KINDS.get(kind)
+    if spec is None:
+        abort(404)
+    roles = spec[1]
+    if roles and session.get("role") not in roles:
+        abort(403)
+    return spec
+
+
+def _job_json(job):
+    out = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "expires_at": job["expires_at"],
+        "status_url": url_for("exports.job_status", job_id=job["id"]),
+    }
+    if job["status"] == "done":
+        out["download_url"] = url_for("exports.job_download", job_id=job["id"])
+        out["download_name"] = job["download_name"]
+    return out
+
+
+# --------------------------------------------------
+# Routes
+# --------------------------------------------------
+@bp.route("/<kind>", methods=["POST"])
+@login_required
+def submit_export(kind):
+    builder, _ = _check_access(kind)
+    params, render, suffix = builder(request.values)
+
+    job = export_jobs.submit(
+        kind,
+        params,
+        render,
+        lang=getattr(g, "lang", "en"),
+        suffix=suffix,
+        created_by=session.get("account_id"),
+    )
+    return jsonify(_job_json(job)), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    job = export_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    _check_access(job["kind"])
+    return jsonify(_job_json(job))
+
+
+@bp.route("/jobs/<job_id>/download", methods=["GET"])
+@login_required
+def job_download(job_id):
+    job = export_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    _check_access(job["kind"])
+
+    path = export_jobs.artifact(job)
+    if path is None:
+        return jsonify(_job_json(job)), 409
+
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=job["download_name"],
+        mimetype=job["mimetype"],
+    )
@@ -0,0 +1,62 @@
+# routes/live.py
+"""
+Live updates for open pages (services/live_events.py).
+
+    GET /live/stream?view=dashboard
+        -> text/event-stream; "counters" events with today's dashboard
+           numbers
+    GET /live/stream?view=daily&date=YYYY-MM-DD[&user=][&device=]
+        -> text/event-stream; "punch" events for new rows of that day
+
+A "reload" event asks the page to reload (it fell too far behind).
+"""
+
+from datetime import date
+
+from flask import Blueprint, Response, abort, request, session
+
+from authz import login_required
+from services import live_events
+
+bp = Blueprint("live", __name__, url_prefix="/live")
+
+# Same roles as the pages themselves
+DAILY_ROLES = ("viewer", "manager", "admin")
+
+
+@bp.route("/stream", methods=["GET"])
+@login_required
+def stream():
+    view = request.args.get("view")
+    if view not in live_events.VIEWS:
+        abort(400)
+
+    if view == "dashboard":
+        sub = live_events.subscribe("dashboard", date.today().isoformat())
+    else:
+        if session.get("role") not in DAILY_ROLES:
+            abort(403)
+        day = request.args.get("date") or date.today().isoformat()
+        try:
+            day = date.fromisoformat(day).isoformat()
+        except ValueError:
+            abort(400)
+        sub = live_events.subscribe(
+            "daily",
+            day,
+            user=request.args.get("user") or None,
+            device=request.args.get("device") or None,
+        )
+
+    if sub is None:
+        return Response("Too many live connections", status=503, headers={"Retry-After": "30"})
+
+    return Response(
+        live_events.stream(sub),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Do not let a reverse proxy buffer the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -5,15 +5,14 @@ from dataclasses import dataclass, field
 from datetime import datetime, date, timedelta, time
 from typing import Dict, List, Optional
 
-from flask import Blueprint, render_template, request, send_file
+from flask import Blueprint, redirect, render_template, request, url_for
 from dateutil import parser as dtparser
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-
 from attendance.calc import calculate_daily_attendance
-from services.user_helpers import list_users
-from services.schedule_templates import get_user_schedule
+from services.schedule_engine import ScheduleGrid, configured_sources, resolve_schedules
+from services.timestamps import parse_local
+from services.payroll import cached_period_payroll
+from services import payroll_snapshots, payroll_table
 
 from authz import login_required, role_required
 
@@ -35,15 +34,7 @@ def get_conn():
 # Time helpers
 # --------------------------------------------------
 def parse_ts(ts: str) -> Optional[datetime]:
-    if not ts:
-        return None
-    try:
-        dt = dtparser.parse(ts)
-        if dt.tzinfo:
-            dt = dt.astimezone().replace(tzinfo=None)
-        return dt
-    except Exception:
-        return None
+    return parse_local(ts)
 
 def fmt_hhmm(dt: Optional[datetime]) -> str:
     return dt.strftime("%H:%M") if dt else ""
@@ -117,15 +108,76 @@ WEEK_TYPES = {
     "sun_sat": {"start_weekday": 6, "length_days": 7},
 }
 
+# Longer pay periods (assembled from per-day rollups, see
+# services/payroll_rollups.py). "week" is the period start for these too.
+PERIOD_TYPES = ("biweekly", "semimonthly", "monthly", "custom")
+
+# First day of any bi-weekly pay period
+BIWEEKLY_ANCHOR = date.fromisoformat(os.getenv("ATT_PAYROLL_BIWEEKLY_ANCHOR", "2024-01-01"))
+MAX_CUSTOM_DAYS = 366
+
+def _month_end(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
 def week_start_for(day: date, week_type: str) -> date:
+    if week_type == "biweekly":
+        return day - timedelta(days=(day - BIWEEKLY_ANCHOR).days % 14)
+    if week_type == "semimonthly":
+        return day.replace(day=1 if day.day <= 15 else 16)
+    if week_type == "monthly":
+        return day.replace(day=1)
+    if week_type == "custom":
+        return day
     cfg = WEEK_TYPES.get(week_type, WEEK_TYPES["mon_sat"])
     return day - timedelta(days=(day.weekday() - cfg["start_weekday"]) % 7)
 
 def week_end_for(ws: date, week_type: str) -> date:
+    if week_type == "biweekly":
+        return ws + timedelta(days=13)
+    if week_type == "semimonthly":
+        return ws.replace(day=15) if ws.day <= 15 else _month_end(ws)
+    if week_type == "monthly":
+        return _month_end(ws)
+    if week_type == "custom":
+        return ws + timedelta(days=6)
     cfg = WEEK_TYPES.get(week_type, WEEK_TYPES["mon_sat"])
     return ws + timedelta(days=cfg["length_days"] - 1)
 
+def period_end(ws: date, week_type: str, end_param: Optional[str] = None) -> date:
+    """week_end_for(), or the requested end date of a custom period."""
+    if week_type == "custom" and end_param:
+        we = dtparser.parse(end_param).date()
+        return min(max(we, ws), ws + timedelta(days=MAX_CUSTOM_DAYS - 1))
+    return week_end_for(ws, week_type)
+
+def period_from_args(args, today: Optional[date] = None):
+    """(week_type, week_start, week_end, week_dates) from request args."""
+    week_type = args.get("week_type", "mon_sat")
+    today = today or datetime.now().date()
+
+    week_param = args.get("week")
+    week_start = (
+        dtparser.parse(week_param).date()
+        if week_param
+        else week_start_for(today, week_type)
+    )
+    if week_type in PERIOD_TYPES:
+        week_start = week_start_for(week_start, week_type)
+    week_end = period_end(week_start, week_type, args.get("end"))
+    return week_type, week_start, week_end, daterange(week_start, week_end)
+
 def build_week_list(week_type: str, anchor: date, back=12, fwd=2):
+    if week_type == "custom":
+        return []
+    if week_type in PERIOD_TYPES:
+        base = week_start_for(anchor, week_type)
+        starts = [base]
+        for _ in range(back):
+            starts.insert(0, week_start_for(starts[0] - timedelta(days=1), week_type))
+        for _ in range(fwd):
+            starts.append(week_end_for(starts[-1], week_type) + timedelta(days=1))
+        return [(ws, week_end_for(ws, week_type)) for ws in starts]
+
     base = week_start_for(anchor, week_type)
     out = []
     for i in range(-back, fwd + 1):
@@ -144,12 +196,82 @@ class EmpRec:
     total_regular: float = 0.0
     total_ot: float = 0.0
     total_all: float = 0.0
+    # Overtime policy breakdown (services/overtime.py), hours
+    overtime_policy: Optional[str] = None
+    ot_daily: float = 0.0
+    ot_weekly: float = 0.0
+    ot_weekend: float = 0.0
+    ot_holiday: float = 0.0
+    paid_hours: Optional[float] = None
     # is_active is injected later in payroll_page/export
 
 def _emp_sort_key(eid: str):
     return int(eid) if eid.isdigit() else eid
 
-def compute_payroll(rows: List[sqlite3.Row], week_dates: List[date]):
+def payroll_day(evs: List[dict], schedule: Optional[dict]):
+    """
+    One employee-day: (day dict, regular hours, overtime hours).
+    Days are independent of each other; period totals are the sum
+    of the unrounded hours in date order.
+    """
+    att = calculate_daily_attendance(evs)
+
+    if not att:
+        return {
+            "in": "",
+            "out": "",
+            "hours": "00:00",
+            "ot": "00:00",
+            "hours_dec": 0.0,
+            "ot_dec": 0.0,
+            "flags": [],
+            "worked_sec": 0,
+        }, 0.0, 0.0
+
+    worked_sec = att["worked_seconds"]
+    flags = list(att.get("flags", []))
+
+    # -----------------------------
+    # Schedule resolution (preloaded)
+    # -----------------------------
+    if schedule is None:
+        # Truly no schedule assigned
+        regular_sec = worked_sec
+        ot_sec = 0
+        flags.append("no_schedule")
+    else:
+        sched_sec = scheduled_seconds(schedule)
+
+        if sched_sec is None:
+            # Schedule exists but malformed
+            regular_sec = worked_sec
+            ot_sec = 0
+            flags.append("invalid_schedule")
+        else:
+            regular_sec = min(worked_sec, sched_sec)
+            ot_sec = max(worked_sec - sched_sec, 0)
+            if ot_sec > 0:
+                flags.append("overtime")
+
+    rhrs = regular_sec / 3600
+    ohrs = ot_sec / 3600
+
+    return {
+        "in": fmt_hhmm(att["in"]),
+        "out": fmt_hhmm(att["out"]),
+        "hours": dec_hours_to_hhmm(rhrs),
+        "ot": dec_hours_to_hhmm(ohrs),
+        "hours_dec": round(rhrs, 2),
+        "ot_dec": round(ohrs, 2),
+        "flags": flags,
+        "worked_sec": worked_sec,
+    }, rhrs, ohrs
+
+def compute_payroll(
+    rows: List[sqlite3.Row],
+    week_dates: List[date],
+    schedules: Optional[ScheduleGrid] = None,
+):
     events_by_emp: Dict[str, Dict[date, List[dict]]] = {}
 
     # -----------------------------
@@ -170,6 +292,15 @@ def compute_payroll(rows: List[sqlite3.Row], week_dates: List[date]):
 
     results: List[EmpRec] = []
 
+    # -----------------------------
+    # Schedules: one batched resolve for every employee-day
+    # (schedule engine, served from the schedule cache)
+    # -----------------------------
+    # A failed resolve must not be stored as "no schedule" for everyone
+    # in the payroll cache, so errors propagate.
+    if schedules is None:
+        schedules = resolve_schedules(events_by_emp.keys(), week_dates, configured_sources())
+
     # -----------------------------
     # Payroll per employee
     # -----------------------------
@@ -187,66 +318,12 @@ def compute_payroll(rows: List[sqlite3.Row], week_dates: List[date]):
         ot_total = 0.0
 
         for d in week_dates:
-            evs = daymap.get(d, [])
-            att = calculate_daily_attendance(evs)
-
-            if not att:
-                emp.days[d.isoformat()] = {
-                    "in": "",
-                    "out": "",
-                    "hours": "00:00",
-                    "ot": "00:00",
-                    "hours_dec": 0.0,
-                    "ot_dec": 0.0,
-                    "flags": [],
-                }
-                continue
-
-            worked_sec = att["worked_seconds"]
-            flags = list(att.get("flags", []))
-
-            # -----------------------------
-            # Schedule resolution (FIXED)
-            # -----------------------------
-            try:
-                schedule = get_user_schedule(emp_id, d.weekday())
-            except Exception:
-                schedule = None
-
-            if schedule is None:
-                # Truly no schedule assigned
-                regular_sec = worked_sec
-                ot_sec = 0
-                flags.append("no_schedule")
-            else:
-                sched_sec = scheduled_seconds(schedule)
-
-                if sched_sec is None:
-                    # Schedule exists but malformed
-                    regular_sec = worked_sec
-                    ot_sec = 0
-                    flags.append("invalid_schedule")
-                else:
-                    regular_sec = min(worked_sec, sched_sec)
-                    ot_sec = max(worked_sec - sched_sec, 0)
-                    if ot_sec > 0:
-                        flags.append("overtime")
-
-            rhrs = regular_sec / 3600
-            ohrs = ot_sec / 3600
+            day, rhrs, ohrs = payroll_day(daymap.get(d, []), schedules.get(emp_id, d))
 
             reg_total += rhrs
             ot_total += ohrs
 
-            emp.days[d.isoformat()] = {
-                "in": fmt_hhmm(att["in"]),
-                "out": fmt_hhmm(att["out"]),
-                "hours": dec_hours_to_hhmm(rhrs),
-                "ot": dec_hours_to_hhmm(ohrs),
-                "hours_dec": round(rhrs, 2),
-                "ot_dec": round(ohrs, 2),
-                "flags": flags,
-            }
+            emp.days[d.isoformat()] = day
 
         emp.total_regular = round(reg_total, 2)
         emp.total_ot = round(ot_total, 2)
@@ -264,108 +341,162 @@ def compute_payroll(rows: List[sqlite3.Row], week_dates: List[date]):
 @login_required
 @role_required("viewer", "manager", "admin")
 def payroll_page():
-    week_type = request.args.get("week_type", "mon_sat")
     user = request.args.get("user") or ""
 
     today = datetime.now().date()
+    week_type, week_start, week_end, week_dates = period_from_args(request.args, today)
     week_list = build_week_list(week_type, today)
+    closed_period = payroll_snapshots.get_period(week_start, week_end)
 
-    week_param = request.args.get("week")
-    week_start = (
-        dtparser.parse(week_param).date()
-        if week_param
-        else week_start_for(today, week_type)
+    # Rows are fetched page by page from payroll_rows() by the
+    # virtualized table: the page itself does not depend on headcount
+    return render_template(
+        "payroll.html",
+        week_type=week_type,
+        week_list=week_list,
+        selected_week=week_start,
+        week_start=week_start,
+        week_end=week_end,
+        week_dates=week_dates,
+        selected_user=user,
+        departments=payroll_table.list_departments(),
+        closed_period=closed_period,
+        drifted=bool(closed_period) and payroll_snapshots.has_drift(closed_period),
     )
 
-    week_end = week_end_for(week_start, week_type)
-    week_dates = daterange(week_start, week_end)
 
-    q_start = datetime.combine(week_start - timedelta(days=1), time.min)
-    q_end = datetime.combine(week_end + timedelta(days=1), time.max)
+# --------------------------------------------------
+# Closed periods (services/payroll_snapshots.py)
+# --------------------------------------------------
+def _period_redirect(week_type, week_start, week_end, endpoint="payroll.payroll_page"):
+    return redirect(url_for(
+        endpoint,
+        week=week_start.isoformat(),
+        week_type=week_type,
+        end=week_end.isoformat() if week_type == "custom" else None,
+    ))
+
+
+@bp.route("/close", methods=["POST"])
+@login_required
+@role_required("manager", "admin")
+def close_period():
+    from flask import flash, g, session
 
-    conn = get_conn()
-    cur = conn.cursor()
+    week_type, week_start, week_end, week_dates = period_from_args(request.form)
+    try:
+        payroll_snapshots.close_period(
+            week_start,
+            week_end,
+            week_dates,
+            closed_by=session.get("username"),
+            note=(request.form.get("note") or "").strip() or None,
+        )
+        flash(g.T.get("period_closed", "Period closed"), "success")
+    except ValueError as e:
+        flash(str(e), "danger")
+    return _period_redirect(week_type, week_start, week_end)
 
-    # -------------------------------------------------
-    # 1. Fetch EVENTS ONLY (no logic change)
-    # -------------------------------------------------
-    sql = """
-        SELECT e.employee_id, u.name, e.timestamp
-        FROM events e
-        JOIN users u ON u.employee_id = e.employee_id
-        WHERE datetime(substr(e.timestamp,1,19))
-              BETWEEN datetime(?) AND datetime(?)
-    """
-    params = [
-        q_start.strftime("%Y-%m-%d %H:%M:%S"),
-        q_end.strftime("%Y-%m-%d %H:%M:%S"),
-    ]
 
-    if user:
-        sql += " AND e.employee_id = ?"
-        params.append(user)
-
-    rows = cur.execute(sql, params).fetchall()
-
-    # -------------------------------------------------
-    # 2. Build ACTIVE MAP (single query, safe)
-    # -------------------------------------------------
-    active_map = {
-        str(r["employee_id"]): int(r["is_active"] or 0)
-        for r in cur.execute(
-            "SELECT employee_id, is_active FROM users"
-        ).fetchall()
-        if r["employee_id"] is not None
-    }
+@bp.route("/reopen", methods=["POST"])
+@login_required
+@role_required("admin")
+def reopen_period():
+    from flask import flash, g
 
-    conn.close()
+    week_type, week_start, week_end, _ = period_from_args(request.form)
+    if payroll_snapshots.reopen_period(week_start, week_end):
+        flash(g.T.get("period_reopened", "Period reopened"), "success")
+    return _period_redirect(week_type, week_start, week_end)
 
-    # -------------------------------------------------
-    # 3. Compute payroll (NOW NORMALIZED)
-    # -------------------------------------------------
-    payroll_data = compute_payroll(rows, week_dates)
 
-    # -------------------------------------------------
-    # 4. Inject is_active into payroll objects
-    # -------------------------------------------------
-    for emp in payroll_data:
-        emp.is_active = active_map.get(str(emp.employee_id), 1)
+@bp.route("/reconcile", methods=["GET"])
+@login_required
+@role_required("viewer", "manager", "admin")
+def reconcile_period():
+    """Late changes to a closed period: live recomputation vs snapshot."""
+    from flask import jsonify
+
+    week_type, week_start, week_end, week_dates = period_from_args(request.args)
+    diff = payroll_snapshots.reconcile(week_start, week_end, week_dates)
+
+    if request.args.get("format") == "json":
+        if diff is None:
+            return jsonify({"error": "Period is not closed"}), 404
+        return jsonify(diff)
+
+    if diff is None:
+        return _period_redirect(week_type, week_start, week_end)
 
-    # -------------------------------------------------
-    # 5. Render
-    # -------------------------------------------------
     return render_template(
-        "payroll.html",
-        payroll_data=payroll_data,
+        "payroll_reconcile.html",
+        diff=diff,
         week_type=week_type,
-        week_list=week_list,
-        selected_week=week_start,
         week_start=week_start,
         week_end=week_end,
-        week_dates=week_dates,
-        users=list_users(),
-        selected_user=user,
     )
 
+
+@bp.route("/api/rows", methods=["GET"])
+@login_required
+@role_required("viewer", "manager", "admin")
+def payroll_rows():
+    """
+    Keyset-paged payroll rows (JSON).
+
+    Period args as the page (week, week_type, end) plus:
+      user, department_id, flag, q   filters
+      sort   name | employee_id | total_regular | total_ot | total_all
+      order  asc | desc
+      limit  page size (max payroll_table.MAX_PAGE_SIZE)
+      after  the previous response's "next" cursor
+    """
+    from flask import jsonify
+
+    args = request.args
+    _, week_start, week_end, week_dates = period_from_args(args)
+
+    department_id = args.get("department_id") or None
+    try:
+        if department_id is not None:
+            department_id = int(department_id)
+        page = payroll_table.payroll_page_rows(
+            week_start,
+            week_end,
+            week_dates,
+            user=(args.get("user") or "").strip() or None,
+            department_id=department_id,
+            flag=args.get("flag") or None,
+            q=args.get("q") or None,
+            sort=args.get("sort", "employee_id"),
+            desc=args.get("order") == "desc",
+            limit=int(args.get("limit", payroll_table.PAGE_SIZE)),
+            after=args.get("after") or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(page)
+
 @bp.route("/export", methods=["GET"])
 def payroll_export():
-    from flask import send_file, g, request
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill
-    from datetime import datetime, timedelta, time
-    from dateutil import parser as dtparser
-
-    week_type = request.args.get("week_type", "mon_sat")
     user = (request.args.get("user") or "").strip()
+    _, week_start, week_end, week_dates = period_from_args(request.args)
 
-    today = datetime.now().date()
-    week_param = request.args.get("week")
-    week_start = dtparser.parse(week_param).date() if week_param else week_start_for(today, week_type)
-    week_end = week_end_for(week_start, week_type)
-    week_dates = daterange(week_start, week_end)
+    xl = build_payroll_export(week_start, week_end, week_dates, user=user)
+    return xl.send(f"weekly_payroll_{week_start}_to_{week_end}.xlsx")
 
-    q_start = datetime.combine(week_start - timedelta(days=1), time.min)
-    q_end = datetime.combine(week_end + timedelta(days=1), time.max)
+
+def build_payroll_export(week_start, week_end, week_dates, user="", progress=None):
+    """
+    Payroll workbook (XlsxStream) for a period. Needs an app context
+    for g.T; progress(fraction) is called as rows are written.
+    """
+    from flask import g
+    from openpyxl.utils import get_column_letter
+    from services.xlsx_export import (
+        DURATION, HEADER, INACTIVE, INACTIVE_DURATION, XlsxStream,
+    )
 
     conn = get_conn()
     cur = conn.cursor()
@@ -384,41 +515,19 @@ def payroll_export():
 
     users_sql += " ORDER BY CAST(employee_id AS INTEGER) ASC"
     user_rows = cur.execute(users_sql, users_params).fetchall()
-
-    # --------------------------------------------------
-    # 2) Pull events in range (as before)
-    # --------------------------------------------------
-    events_sql = """
-        SELECT
-            e.employee_id,
-            u.name,
-            e.timestamp
-        FROM events e
-        JOIN users u ON u.employee_id = e.employee_id
-        WHERE datetime(substr(e.timestamp,1,19))
-              BETWEEN datetime(?) AND datetime(?)
-    """
-
-    events_params = [
-        q_start.strftime("%Y-%m-%d %H:%M:%S"),
-        q_end.strftime("%Y-%m-%d %H:%M:%S"),
-    ]
-
-    if user:
-        events_sql += " AND employee_id = ?"
-        events_params.append(user)
-
-    event_rows = cur.execute(events_sql, events_params).fetchall()
     conn.close()
 
     # --------------------------------------------------
-    # 3) Compute payroll ONLY for people with events
+    # 2) Pull events in range + compute payroll ONLY
+    #    for people with events (sharded when large)
     # --------------------------------------------------
-    computed = compute_payroll(event_rows, week_dates)
+    computed = cached_period_payroll(week_start, week_end, week_dates, user=user)
+    if progress:
+        progress(0.3)
     computed_map = {str(emp.employee_id): emp for emp in computed}
 
     # --------------------------------------------------
-    # 4) Build final ordered list: ALL users
+    # 3) Build final ordered list: ALL users
     # --------------------------------------------------
     final_list = []
     for ur in user_rows:
@@ -457,108 +566,64 @@ def payroll_export():
         final_list.append(emp)
 
     # --------------------------------------------------
-    # 5) Excel generation (with freeze panes + header colors)
+    # 4) Excel generation (streaming write-only workbook,
+    #    freeze panes + header colors)
     # --------------------------------------------------
-    wb = Workbook()
-    ws = wb.active
-
-    raw_title = g.T.get("payroll_title", "Payroll")
-    ws.title = raw_title.replace("/", "-").replace("\\", "-")[:31]
-
-    bold = Font(bold=True)
-    center = Alignment(horizontal="center", vertical="center")
-    header_fill = PatternFill("solid", fgColor="E9ECEF")   # light gray
-    inactive_fill = PatternFill("solid", fgColor="FDECEA") # light red
+    xl = XlsxStream(g.T.get("payroll_title", "Payroll"))
 
     # Freeze first 2 rows and first 2 columns
-    ws.freeze_panes = "C3"
-
-    # Header Row 1
-    ws.append([g.T.get("employee_id", "Employee ID"),
-               g.T.get("name", "Employee Name")])
-
-    # Style A1/B1
-    for c in (1, 2):
-        ws.cell(row=1, column=c).font = bold
-        ws.cell(row=1, column=c).alignment = center
-        ws.cell(row=1, column=c).fill = header_fill
+    xl.freeze("C3")
+    # Optional: column widths for readability
+    xl.width("A", 14)
+    xl.width("B", 28)
 
+    # Header Row 1: one merged 5-column block per day
+    header1 = [
+        xl.cell(g.T.get("employee_id", "Employee ID"), HEADER),
+        xl.cell(g.T.get("name", "Employee Name"), HEADER),
+    ]
     col = 3
     for d in week_dates:
-        ws.merge_cells(start_row=1, start_column=col, end_row=1, end_column=col + 4)
-        cell = ws.cell(row=1, column=col, value=d.strftime("%a %d/%m"))
-        cell.font = bold
-        cell.alignment = center
-        cell.fill = header_fill
-        # Ensure merged header region also gets fill
-        for cc in range(col, col + 5):
-            ws.cell(row=1, column=cc).fill = header_fill
+        xl.merge(f"{get_column_letter(col)}1:{get_column_letter(col + 4)}1")
+        header1.append(xl.cell(d.strftime("%a %d/%m"), HEADER))
+        # Merged header region also gets the fill
+        header1.extend(xl.cell(None, HEADER) for _ in range(4))
         col += 5
+    xl.append(header1)
 
     # Header Row 2
-    ws.append(["", ""])
-    # Style A2/B2
-    for c in (1, 2):
-        ws.cell(row=2, column=c).font = bold
-        ws.cell(row=2, column=c).alignment = center
-        ws.cell(row=2, column=c).fill = header_fill
-
-    col = 3
+    labels = [
+        g.T.get("in", "IN"),
+        g.T.get("out", "OUT"),
+        g.T.get("hours", "Hrs"),
+        g.T.get("overtime", "OT"),
+        "Flags",
+    ]
+    header2 = [xl.cell("", HEADER), xl.cell("", HEADER)]
     for _ in week_dates:
-        labels = [
-            g.T.get("in", "IN"),
-            g.T.get("out", "OUT"),
-            g.T.get("hours", "Hrs"),
-            g.T.get("overtime", "OT"),
-            "Flags",
-        ]
-        for i, label in enumerate(labels):
-            c = ws.cell(row=2, column=col + i, value=label)
-            c.font = bold
-            c.alignment = center
-            c.fill = header_fill
-        col += 5
-
-    # Data rows
-    row_idx = 3
-    for emp in final_list:
-        ws.cell(row=row_idx, column=1, value=emp.employee_id)
-        ws.cell(row=row_idx, column=2, value=emp.name)
-
-        col = 3
+        header2.extend(xl.cell(label, HEADER) for label in labels)
+    xl.append(header2)
+
+    # Data rows (inactive users highlighted)
+    for i, emp in enumerate(final_list):
+        if progress:
+            progress(0.3 + 0.6 * i / len(final_list))
+        inactive = int(getattr(emp, "is_active", 1)) == 0
+        text = INACTIVE if inactive else None
+        dur = INACTIVE_DURATION if inactive else DURATION
+
+        row = [xl.cell(emp.employee_id, text), xl.cell(emp.name, text)]
         for d in week_dates:
             rec = emp.days.get(d.isoformat()) if getattr(emp, "days", None) else None
-            ws.cell(row=row_idx, column=col,     value=rec["in"] if rec else "")
-            ws.cell(row=row_idx, column=col + 1, value=rec["out"] if rec else "")
-            ws.cell(row=row_idx, column=col + 2, value=timedelta(hours=(rec["hours_dec"] if rec else 0.0)))
-            ws.cell(row=row_idx, column=col + 3, value=timedelta(hours=(rec["ot_dec"] if rec else 0.0)))
-            ws.cell(row=row_idx, column=col + 4, value=", ".join(rec["flags"]) if rec and rec.get("flags") else "")
-            col += 5
-
-        ws.cell(row=row_idx, column=col,     value=timedelta(hours=float(getattr(emp, "total_regular", 0.0))))
-        ws.cell(row=row_idx, column=col + 1, value=timedelta(hours=float(getattr(emp, "total_ot", 0.0))))
-        ws.cell(row=row_idx, column=col + 2, value=timedelta(hours=float(getattr(emp, "total_all", 0.0))))
-
-        # Highlight ONLY inactive users
-        if int(getattr(emp, "is_active", 1)) == 0:
-            last_col = col + 2
-            for cc in range(1, last_col + 1):
-                ws.cell(row=row_idx, column=cc).fill = inactive_fill
-
-        row_idx += 1
-
-    # Format timedelta cells as [h]:mm
-    for col_cells in ws.iter_cols():
-        for cell in col_cells:
-            if isinstance(cell.value, timedelta):
-                cell.number_format = "[h]:mm"
-
-    # Optional: column widths for readability
-    ws.column_dimensions["A"].width = 14
-    ws.column_dimensions["B"].width = 28
-
-    fname = f"weekly_payroll_{week_start}_to_{week_end}.xlsx"
-    path = f"/tmp/{fname}"
-    wb.save(path)
-
-    return send_file(path, as_attachment=True, download_name=fname)
+            row.append(xl.cell(rec["in"] if rec else "", text))
+            row.append(xl.cell(rec["out"] if rec else "", text))
+            row.append(xl.cell(timedelta(hours=(rec["hours_dec"] if rec else 0.0)), dur))
+            row.append(xl.cell(timedelta(hours=(rec["ot_dec"] if rec else 0.0)), dur))
+            row.append(xl.cell(", ".join(rec["flags"]) if rec and rec.get("flags") else "", text))
+
+        row.append(xl.cell(timedelta(hours=float(getattr(emp, "total_regular", 0.0))), dur))
+        row.append(xl.cell(timedelta(hours=float(getattr(emp, "total_ot", 0.0))), dur))
+        row.append(xl.cell(timedelta(hours=float(getattr(emp, "total_all", 0.0))), dur))
+        xl.append(row)
+
+    return xl
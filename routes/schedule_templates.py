@@ -4,9 +4,12 @@ import os
 
 from db import get_conn
 from authz import login_required, role_required
+from services.schedule_cache import bump_schedule_version
 from services.schedule_templates import (
     list_templates,
     assign_template_to_user,
+    mark_templates_stale,
+    rebuild_stale_template_days,
 )
 
 DB_PATH = os.getenv("ATT_DB", "/var/lib/attendance/attendance.db")
@@ -55,6 +58,7 @@ def create_template():
     template_id = cur.lastrowid
     conn.commit()
     conn.close()
+    bump_schedule_version()
 
     return redirect(
         url_for("schedule_templates.edit_template", template_id=template_id)
@@ -86,6 +90,7 @@ def edit_template(template_id):
             ),
         )
         conn.commit()
+        bump_schedule_version()
 
     template = cur.execute(
         "SELECT * FROM schedule_templates WHERE id = ?",
@@ -156,8 +161,9 @@ def add_rule(template_id):
     conn.commit()
     conn.close()
 
-    from services.schedule_templates import rebuild_template_days
-    rebuild_template_days(template_id)
+    # Explicit mark: the triggers may not be installed yet
+    mark_templates_stale([template_id])
+    rebuild_stale_template_days()
 
     flash("Rule added.", "success")
     return redirect(
@@ -176,14 +182,13 @@ def delete_rule(rule_id):
     ).fetchone()
 
     if row:
-        template_id = row["template_id"]
-
         conn.execute("DELETE FROM schedule_shifts WHERE rule_id = ?", (rule_id,))
         conn.execute("DELETE FROM schedule_rules WHERE id = ?", (rule_id,))
         conn.commit()
 
-        from services.schedule_templates import rebuild_template_days
-        rebuild_template_days(template_id)
+        # Explicit mark: the triggers may not be installed yet
+        mark_templates_stale([row["template_id"]])
+        rebuild_stale_template_days()
 
     conn.close()
 
@@ -227,8 +232,9 @@ def add_shift(rule_id):
 
     conn.commit()
 
-    from services.schedule_templates import rebuild_template_days
-    rebuild_template_days(row["template_id"])
+    # Explicit mark: the triggers may not be installed yet
+    mark_templates_stale([row["template_id"]])
+    rebuild_stale_template_days()
 
     conn.close()
 
@@ -255,11 +261,16 @@ def delete_shift(shift_id):
         conn.execute("DELETE FROM schedule_shifts WHERE id = ?", (shift_id,))
         conn.commit()
 
-        from services.schedule_templates import rebuild_template_days
-        rebuild_template_days(template_id)
-
+        # Explicit mark: the triggers may not be installed yet
+        mark_templates_stale([row["template_id"]])
+        rebuild_stale_template_days()
 
     conn.close()
+
+    if not row:
+        flash("Shift not found", "danger")
+        return redirect(url_for("schedule_templates.templates_page"))
+
     return redirect(
         url_for("schedule_templates.edit_template", template_id=row["template_id"])
     )
@@ -297,6 +308,7 @@ def assign_template():
 
     conn.commit()
     conn.close()
+    bump_schedule_version()
 
     flash("Schedule assigned", "success")
     return redirect(url_for("schedule_templates.templates_page"))
@@ -361,6 +373,7 @@ def assign_template_bulk():
 
     conn.commit()
     conn.close()
+    bump_schedule_version()
 
     flash("Templates assigned", "success")
     return redirect(url_for("schedule_templates.templates_page"))
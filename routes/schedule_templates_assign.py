@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 
 from db import get_conn
 from authz import login_required, role_required
+from services.schedule_cache import bump_schedule_version
 from services.schedule_templates import list_templates
 
 bp = Blueprint(
@@ -97,6 +98,7 @@ def assign_bulk():
         )
         conn.commit()
         conn.close()
+        bump_schedule_version()
         flash(f"Cleared template for {len(user_ids)} user(s).", "success")
         return redirect(url_for("schedule_templates_assign.schedules_assign_ui"))
 
@@ -112,6 +114,7 @@ def assign_bulk():
 
     conn.commit()
     conn.close()
+    bump_schedule_version()
 
     flash(f"Assigned template to {len(user_ids)} user(s).", "success")
     return redirect(url_for("schedule_templates_assign.schedules_assign_ui"))
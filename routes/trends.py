@@ -0,0 +1,69 @@
+# routes/trends.py
+"""
+Attendance trend series (services/attendance_trends.py).
+
+    GET  /trends/series?scope=company|department|device&id=<scope id>
+                       &start=YYYY-MM-DD&end=YYYY-MM-DD
+                       &granularity=day|week|month
+         -> {"points": [{"period", "expected", "attended", "late",
+                         "attendance_rate", "late_rate", "ot_hours", ...}]}
+         (device points have no expected / attendance_rate)
+    POST /trends/rebuild?start=&end=   (admin) rebuild a range after
+         schedule / department edits
+
+Without start / end the last 365 days are returned.
+"""
+
+from datetime import date, timedelta
+
+from flask import Blueprint, jsonify, request
+
+from authz import login_required, role_required
+from services import attendance_trends
+
+bp = Blueprint("trends", __name__, url_prefix="/trends")
+
+# Longest range a single request may ask for
+MAX_RANGE_DAYS = 3 * 366
+
+
+def _range(args):
+    """(start, end) from args; raises ValueError."""
+    end = date.fromisoformat(args["end"]) if args.get("end") else date.today()
+    start = date.fromisoformat(args["start"]) if args.get("start") else end - timedelta(days=364)
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"range is limited to {MAX_RANGE_DAYS} days")
+    return start, end
+
+
+@bp.route("/series", methods=["GET"])
+@login_required
+@role_required("manager", "admin")
+def trend_series():
+    args = request.args
+    try:
+        start, end = _range(args)
+        data = attendance_trends.series(
+            args.get("scope", "company"),
+            args.get("id", ""),
+            start,
+            end,
+            args.get("granularity", "day"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(data)
+
+
+@bp.route("/rebuild", methods=["POST"])
+@login_required
+@role_required("admin")
+def trend_rebuild():
+    try:
+        start, end = _range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    days = attendance_trends.rebuild(start, end)
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(), "rebuilt_days": days})
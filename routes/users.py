@@ -1,7 +1,8 @@
+import io
 import sqlite3
 import os
 import shutil
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, g
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, g, abort
 from db import get_conn, list_devices
 from dateutil import parser as dtparser
 from datetime import datetime, timedelta, time
@@ -14,10 +15,7 @@ from routes.payroll import (
     build_week_list,
 )
 
-from reportlab.lib.pagesizes import A5
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
-
+from services import hours_sheets, overtime, payroll_cache, payroll_snapshots
 from services.users import (
     list_users,
     get_next_employee_id,
@@ -370,11 +368,54 @@ def users_delete(employee_id):
     cur.execute("DELETE FROM device_users WHERE employee_id = ?", (employee_id,))
     conn.commit()
     conn.close()
+    # Template assignments resolve through users.employee_id
+    from services.schedule_cache import bump_schedule_version
+    bump_schedule_version()
     return redirect(url_for("users.users_list"))
 
 # --------------------------------------------------
 # Weekly hours (HTML)
 # --------------------------------------------------
+def _weekly_report(employee_id, week_start, week_end, week_dates):
+    """One employee's payroll for the week, via the payroll cache."""
+    frozen = payroll_snapshots.snapshot_payroll(week_start, week_end, user=employee_id)
+    if frozen is not None:
+        # Closed period
+        return frozen[0] if frozen else None
+
+    def compute():
+        q_start = datetime.combine(week_start - timedelta(days=1), time.min)
+        q_end = datetime.combine(week_end + timedelta(days=1), time.max)
+
+        conn = get_conn()
+        cur = conn.cursor()
+
+        rows = cur.execute(
+            """
+            SELECT employee_id, name, timestamp
+            FROM events
+            WHERE employee_id = ?
+              AND datetime(substr(timestamp,1,19))
+                  BETWEEN datetime(?) AND datetime(?)
+            """,
+            (
+                employee_id,
+                q_start.strftime("%Y-%m-%d %H:%M:%S"),
+                q_end.strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        ).fetchall()
+
+        conn.close()
+
+        return compute_payroll(rows, week_dates)
+
+    payroll_data = overtime.apply_policies(
+        payroll_cache.get_or_compute("user_hours", week_start, week_end, employee_id, compute),
+        week_dates,
+    )
+    return payroll_data[0] if payroll_data else None
+
+
 @bp.route("/users/<employee_id>/weekly-hours")
 def user_weekly_hours(employee_id):
     week_type = request.args.get("week_type", "mon_sat")
@@ -390,31 +431,7 @@ def user_weekly_hours(employee_id):
     week_list = build_week_list(week_type, today)
     week_dates = daterange(week_start, week_end)
 
-    q_start = datetime.combine(week_start - timedelta(days=1), time.min)
-    q_end = datetime.combine(week_end + timedelta(days=1), time.max)
-
-    conn = get_conn()
-    cur = conn.cursor()
-
-    rows = cur.execute(
-        """
-        SELECT employee_id, name, timestamp
-        FROM events
-        WHERE employee_id = ?
-          AND datetime(substr(timestamp,1,19))
-              BETWEEN datetime(?) AND datetime(?)
-        """,
-        (
-            employee_id,
-            q_start.strftime("%Y-%m-%d %H:%M:%S"),
-            q_end.strftime("%Y-%m-%d %H:%M:%S"),
-        ),
-    ).fetchall()
-
-    conn.close()
-
-    payroll_data = compute_payroll(rows, week_dates)
-    report = payroll_data[0] if payroll_data else None
+    report = _weekly_report(employee_id, week_start, week_end, week_dates)
 
     return render_template(
         "user_weekly_hours.html",
@@ -432,18 +449,6 @@ def user_weekly_hours(employee_id):
 # --------------------------------------------------
 @bp.route("/users/<employee_id>/weekly-hours/pdf", methods=["GET"])
 def user_weekly_hours_pdf(employee_id):
-    T = g.T
-
-    WEEKDAYS = [
-        T.get("monday", "Monday"),
-        T.get("tuesday", "Tuesday"),
-        T.get("wednesday", "Wednesday"),
-        T.get("thursday", "Thursday"),
-        T.get("friday", "Friday"),
-        T.get("saturday", "Saturday"),
-        T.get("sunday", "Sunday"),
-    ]
-
     week_type = request.args.get("week_type", "mon_sat")
     week_param = request.args.get("week")
 
@@ -455,91 +460,81 @@ def user_weekly_hours_pdf(employee_id):
     week_end = week_end_for(week_start, week_type)
     week_dates = daterange(week_start, week_end)
 
-    q_start = datetime.combine(week_start - timedelta(days=1), time.min)
-    q_end = datetime.combine(week_end + timedelta(days=1), time.max)
+    buf = io.BytesIO()
+    render_weekly_hours_pdf(buf, employee_id, week_start, week_end, week_dates)
+    buf.seek(0)
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    rows = cur.execute(
-        """
-        SELECT employee_id, name, timestamp
-        FROM events
-        WHERE employee_id = ?
-          AND datetime(substr(timestamp,1,19))
-              BETWEEN datetime(?) AND datetime(?)
-        """,
-        (
-            employee_id,
-            q_start.strftime("%Y-%m-%d %H:%M:%S"),
-            q_end.strftime("%Y-%m-%d %H:%M:%S"),
-        ),
-    ).fetchall()
+    return send_file(
+        buf,
+        as_attachment=True,
+        download_name=hours_sheets.sheet_filename(employee_id, week_start),
+        mimetype="application/pdf",
+    )
 
-    conn.close()
 
-    payroll_data = compute_payroll(rows, week_dates)
-    report = payroll_data[0] if payroll_data else None
+def render_weekly_hours_pdf(target, employee_id, week_start, week_end, week_dates):
+    """
+    Write one employee's A5 weekly hours / signature sheet to target
+    (path or binary file). Needs an app context for g.T.
+    """
+    report = _weekly_report(employee_id, week_start, week_end, week_dates)
     emp_name = report.name if report and report.name else employee_id
+    hours_sheets.render_sheet(target, g.T, emp_name, report, week_start, week_end, week_dates)
+
+
+def _bulk_args(args):
+    """(department_id, fmt, week_start, week_end, week_dates) from request args."""
+    week_type = args.get("week_type", "mon_sat")
+    week_param = args.get("week")
+    week_start = (
+        dtparser.parse(week_param).date()
+        if week_param else week_start_for(datetime.now().date(), week_type)
+    )
+    week_end = week_end_for(week_start, week_type)
+
+    fmt = args.get("format", "zip")
+    if fmt not in hours_sheets.FORMATS:
+        abort(400, "format must be zip or pdf")
+
+    department_id = args.get("department_id") or None
+    if department_id is not None:
+        try:
+            department_id = int(department_id)
+        except ValueError:
+            abort(400, "Invalid department_id")
+
+    return department_id, fmt, week_start, week_end, daterange(week_start, week_end)
+
 
-    path = f"/tmp/weekly_hours_{employee_id}_{week_start}.pdf"
-    c = canvas.Canvas(path, pagesize=A5)
-    width, height = A5
-    y = height - 15 * mm
-
-    logo = "/opt/attendance/static/company_logo.png"
-    if os.path.exists(logo):
-        c.drawImage(logo, 15 * mm, y - 10 * mm, width=30 * mm, preserveAspectRatio=True)
-    y -= 15 * mm
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(15 * mm, y, T.get("weekly_hours_report", "Weekly Hours Report"))
-    y -= 6 * mm
-
-    c.setFont("Helvetica", 9)
-    c.drawString(15 * mm, y, f"{T.get('employee','Employee')}: {emp_name}")
-    y -= 5 * mm
-    c.drawString(15 * mm, y, f"{T.get('period','Period')}: {week_start} Ã¢ÂÂ {week_end}")
-    y -= 8 * mm
-
-    c.setFont("Helvetica-Bold", 8)
-    c.drawString(15 * mm, y, T.get("day", "Day"))
-    c.drawString(45 * mm, y, T.get("first_in", "In"))
-    c.drawString(65 * mm, y, T.get("last_out", "Out"))
-    c.drawString(85 * mm, y, T.get("hours", "Hours"))
-    c.drawString(105 * mm, y, T.get("overtime", "OT"))
-    y -= 4 * mm
-
-    c.setFont("Helvetica", 8)
-    for d in week_dates:
-        rec = report.days.get(d.isoformat()) if report else None
-        label = f"{WEEKDAYS[d.weekday()]} {d.strftime('%d/%m')}"
-        c.drawString(15 * mm, y, label)
-        c.drawString(45 * mm, y, rec["in"] if rec else "")
-        c.drawString(65 * mm, y, rec["out"] if rec else "")
-        c.drawRightString(100 * mm, y, rec["hours"] if rec else "00:00")
-        c.drawRightString(120 * mm, y, rec["ot"] if rec else "00:00")
-        y -= 4 * mm
-
-    y -= 6 * mm
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(15 * mm, y, f"{T.get('regular_hours','Regular')}: {report.total_regular if report else 0}")
-    y -= 4 * mm
-    c.drawString(15 * mm, y, f"{T.get('overtime_hours','Overtime')}: {report.total_ot if report else 0}")
-    y -= 4 * mm
-    c.drawString(15 * mm, y, f"{T.get('total_hours','Total')}: {report.total_all if report else 0}")
-
-    y -= 10 * mm
-    c.setFont("Helvetica", 8)
-    c.drawString(15 * mm, y, T.get("employee_signature", "Employee signature"))
-    c.line(15 * mm, y - 2 * mm, 80 * mm, y - 2 * mm)
-    c.drawString(90 * mm, y, T.get("date", "Date"))
-    c.line(90 * mm, y - 2 * mm, 120 * mm, y - 2 * mm)
-
-    c.showPage()
-    c.save()
-
-    return send_file(path, as_attachment=True)
+def render_bulk_weekly_hours(target, department_id, fmt, week_start, week_end, week_dates,
+                             progress=None):
+    """
+    Signature sheets of every active employee (of one department):
+    a ZIP of PDFs or one merged PDF. Needs an app context for g.T.
+    Returns the number of sheets.
+    """
+    sheets = hours_sheets.collect_sheets(week_start, week_end, week_dates, department_id)
+    write = hours_sheets.write_zip if fmt == "zip" else hours_sheets.write_merged_pdf
+    write(target, dict(g.T), sheets, week_start, week_end, week_dates, progress=progress)
+    return len(sheets)
+
+
+@bp.route("/weekly-hours/bulk", methods=["GET"])
+@login_required
+@role_required("admin", "manager")
+def bulk_weekly_hours():
+    department_id, fmt, week_start, week_end, week_dates = _bulk_args(request.args)
+
+    buf = io.BytesIO()
+    render_bulk_weekly_hours(buf, department_id, fmt, week_start, week_end, week_dates)
+    buf.seek(0)
+
+    return send_file(
+        buf,
+        as_attachment=True,
+        download_name=hours_sheets.bulk_filename(week_start, fmt, department_id),
+        mimetype="application/zip" if fmt == "zip" else "application/pdf",
+    )
 
 # --------------------------------------------------
 # Toggle active / inactive
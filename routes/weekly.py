@@ -9,15 +9,31 @@ from attendance_services import build_week_list, get_week_bounds_from_type
 from services.query_helpers import query_events_range
 from attendance.calc import calculate_daily_attendance
 from services.user_helpers import list_users
+from services.timestamps import parse_iso
 
 from authz import login_required, role_required
+from services.http_cache import conditional
 
 bp = Blueprint("weekly", __name__, url_prefix="/weekly")
 
 
+def _week_window():
+    """Events window of the requested week (same resolution as the view)."""
+    week_param = request.args.get("week")
+    try:
+        selected_date = datetime.fromisoformat(week_param).date() if week_param else None
+    except ValueError:
+        selected_date = None
+    return get_week_bounds_from_type(
+        selected_date or datetime.now().date(),
+        request.args.get("week_type", "mon_fri"),
+    )
+
+
 @bp.route("/", methods=["GET"])
 @login_required
 @role_required("viewer", "manager", "admin")
+@conditional("events", "users", "devices", "settings", days=_week_window, html=True)
 def weekly_view():
     T = g.T
 
@@ -59,9 +75,8 @@ def weekly_view():
         if not emp_id or not ts_str:
             continue
 
-        try:
-            ts = datetime.fromisoformat(ts_str[:19])
-        except Exception:
+        ts = parse_iso(ts_str[:19])
+        if ts is None:
             continue
 
         day = ts.date()
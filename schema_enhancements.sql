@@ -99,6 +99,7 @@ CREATE TABLE IF NOT EXISTS overtime_policies (
     daily_multiplier REAL DEFAULT 1.5,        -- 1.5x for daily OT
     weekly_multiplier REAL DEFAULT 1.5,       -- 1.5x for weekly OT
     weekend_multiplier REAL DEFAULT 2.0,      -- 2x for weekends
+    weekend_days TEXT,                        -- e.g. '5,6' (Mon=0); NULL = ATT_OVERTIME_WEEKEND_DAYS
     holiday_multiplier REAL DEFAULT 2.5,      -- 2.5x for holidays
     auto_approve_under_hours REAL,            -- Auto-approve OT under X hours
     requires_approval INTEGER DEFAULT 1,
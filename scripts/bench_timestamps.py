@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: services.timestamps vs dateutil.
+
+    python3 scripts/bench_timestamps.py [--rows 50000] [--distinct 5000]
+
+Simulates a payroll pass: many rows, a limited set of distinct
+timestamp strings (punches repeat across queries / re-renders).
+"""
+import os
+import sys
+
+# -------------------------------------------------
+# Ensure project root is on PYTHONPATH
+# -------------------------------------------------
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from dateutil import parser as dtparser
+
+from services import timestamps
+
+
+def dateutil_local(ts):
+    dt = dtparser.parse(ts)
+    if dt.tzinfo:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def make_samples(rows, distinct):
+    base = datetime(2026, 1, 5, 6, 0, 0)
+    pool = []
+    for i in range(distinct):
+        dt = base + timedelta(seconds=random.randint(0, 7 * 86400))
+        if i % 2:
+            pool.append(dt.strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            pool.append(dt.strftime("%Y-%m-%dT%H:%M:%S") + "-06:00")
+    return [random.choice(pool) for _ in range(rows)]
+
+
+def bench(label, fn, samples):
+    t0 = time.perf_counter()
+    for s in samples:
+        fn(s)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms   {elapsed / len(samples) * 1e6:7.2f} us/row")
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--distinct", type=int, default=5000)
+    args = ap.parse_args()
+
+    random.seed(42)
+    samples = make_samples(args.rows, args.distinct)
+
+    # Sanity: both paths agree
+    for s in samples[:1000]:
+        assert timestamps.parse_local(s) == dateutil_local(s), s
+
+    timestamps.clear_cache()
+    base = bench("dateutil.parser.parse", dateutil_local, samples)
+
+    timestamps.clear_cache()
+    cold = bench("parse_local (cold cache)", timestamps.parse_local, samples)
+    warm = bench("parse_local (warm cache)", timestamps.parse_local, samples)
+
+    print()
+    print(f"speedup cold:     {base / cold:6.1f}x")
+    print(f"speedup warm:     {base / warm:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Rebuild schedule_template_days after bulk rule / shift imports.
+
+    python3 scripts/rebuild_template_days.py          # stale templates only
+    python3 scripts/rebuild_template_days.py --all    # every template
+
+Templates are marked stale by triggers on schedule_rules /
+schedule_shifts; all of them are rebuilt in one transaction.
+"""
+import os
+import sys
+
+# -------------------------------------------------
+# Ensure project root is on PYTHONPATH
+# -------------------------------------------------
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse
+
+from services.schedule_templates import (
+    rebuild_all_template_days,
+    rebuild_stale_template_days,
+)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--all", action="store_true", help="rebuild every template")
+    args = ap.parse_args()
+
+    if args.all:
+        count = rebuild_all_template_days()
+    else:
+        count = rebuild_stale_template_days()
+
+    print(f"Rebuilt {count} template(s).")
+
+
+if __name__ == "__main__":
+    main()
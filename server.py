@@ -35,6 +35,10 @@ sys.path.insert(0, BASE_DIR)
 #from scripts.bootstrap_db import main as bootstrap_db
 #bootstrap_db()
 
+# Change log triggers: every events / users writer is logged from here on
+from services import change_feed
+change_feed.install()
+
 # --------------------------------------------------
 # Flask app setup
 # --------------------------------------------------
@@ -130,9 +134,18 @@ register(daily_audit_bp, "routes.daily_audit")
 from routes.reports import bp as reports_bp
 register(reports_bp, "routes.reports")
 
+from routes.exports import bp as exports_bp
+register(exports_bp, "routes.exports")
+
 from routes.dashboard import bp as dashboard_bp
 register(dashboard_bp, "routes.dashboard")
 
+from routes.live import bp as live_bp
+register(live_bp, "routes.live")
+
+from routes.trends import bp as trends_bp
+register(trends_bp, "routes.trends")
+
 from routes.auth import bp as auth_bp
 register(auth_bp, "routes.auth")
 
@@ -0,0 +1,200 @@
+# services/api_keys.py
+"""
+API key authentication cache and usage accounting.
+
+Lookups are cached in memory by SHA-256 of the key (plain keys are
+never held), for CACHE_TTL seconds. Unknown keys are cached too, so
+retries with a bad key do not reach the database either. The admin
+create / delete endpoints call invalidate(), which bumps the
+"api_keys" data version; every process compares that version (one
+stat() call) before trusting its cache.
+
+Usage is counted in memory per key id and written in one batch every
+USAGE_FLUSH_SECONDS (and at exit):
+
+    api_keys.last_used       latest use
+    api_keys.request_count   requests since the key was created
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from db import get_conn
+from services import data_versions
+
+DOMAIN = "api_keys"
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+CACHE_TTL = int(os.getenv("ATT_API_KEY_CACHE_TTL", "300"))
+CACHE_MAX = 4096
+USAGE_FLUSH_SECONDS = int(os.getenv("ATT_API_USAGE_FLUSH", "60"))
+
+_tables_ready = False
+
+_lock = threading.Lock()
+# sha256(key) -> (key row dict or None, expires at)
+_cache: Dict[str, tuple] = {}
+_cache_version = -1
+# key id -> [requests, last used]
+_usage: Dict[int, list] = {}
+_flusher: Optional[threading.Thread] = None
+
+
+def ensure_api_key_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            key TEXT UNIQUE NOT NULL,
+            active INTEGER DEFAULT 1,
+            created_at TEXT NOT NULL,
+            last_used TEXT,
+            request_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(api_keys)").fetchall()}
+    if "request_count" not in cols:
+        cur.execute("ALTER TABLE api_keys ADD COLUMN request_count INTEGER NOT NULL DEFAULT 0")
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_api_key_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------
+# Lookup
+# --------------------------------------------------
+def lookup(api_key: str) -> Optional[dict]:
+    """Active key row for api_key (a copy), or None."""
+    global _cache_version
+
+    digest = _digest(api_key)
+    now = time.monotonic()
+    version = data_versions.current(DOMAIN)
+
+    with _lock:
+        if version != _cache_version:
+            _cache.clear()
+            _cache_version = version
+        hit = _cache.get(digest)
+        if hit is not None and hit[1] > now:
+            return dict(hit[0]) if hit[0] else None
+
+    conn = _conn()
+    try:
+        row = conn.execute(
+            "SELECT * FROM api_keys WHERE key = ? AND active = 1", (api_key,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    info = dict(row) if row else None
+    if info:
+        # Only the digest stays in memory
+        info.pop("key", None)
+
+    with _lock:
+        if len(_cache) >= CACHE_MAX:
+            expired = [k for k, (_, exp) in _cache.items() if exp <= now]
+            # Otherwise the oldest quarter (insertion order)
+            for k in expired or list(_cache)[:CACHE_MAX // 4]:
+                del _cache[k]
+        _cache[digest] = (info, now + CACHE_TTL)
+    return dict(info) if info else None
+
+
+def invalidate():
+    """Drop cached lookups in every process (after key create / delete)."""
+    with _lock:
+        _cache.clear()
+    data_versions.bump(DOMAIN)
+
+
+# --------------------------------------------------
+# Usage
+# --------------------------------------------------
+def record_use(key_id: int):
+    """Count one request for key_id (written by the next flush)."""
+    now = datetime.now().isoformat(timespec="seconds")
+    with _lock:
+        entry = _usage.get(key_id)
+        if entry is None:
+            _usage[key_id] = [1, now]
+        else:
+            entry[0] += 1
+            entry[1] = now
+    _start_flusher()
+
+
+def flush_usage() -> int:
+    """Write pending usage in one transaction. Returns keys written."""
+    with _lock:
+        pending = list(_usage.items())
+        _usage.clear()
+    if not pending:
+        return 0
+
+    conn = None
+    try:
+        conn = _conn()
+        conn.executemany(
+            """
+            UPDATE api_keys
+            SET request_count = request_count + ?,
+                last_used = MAX(COALESCE(last_used, ''), ?)
+            WHERE id = ?
+            """,
+            [(count, last_used, key_id) for key_id, (count, last_used) in pending],
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[api_keys] usage flush failed: {e}")
+        # Keep the counts for the next flush
+        with _lock:
+            for key_id, (count, last_used) in pending:
+                entry = _usage.setdefault(key_id, [0, last_used])
+                entry[0] += count
+                entry[1] = max(entry[1], last_used)
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+    return len(pending)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(USAGE_FLUSH_SECONDS)
+        flush_usage()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name="api-key-usage", daemon=True)
+    _flusher.start()
+    atexit.register(flush_usage)
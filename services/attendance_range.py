@@ -0,0 +1,148 @@
+# services/attendance_range.py
+"""
+Attendance rows (one per employee-day) over a date range, read in
+keyset order for the API.
+
+Rows come from attendance_day_rollups (services/dashboard_stats.py),
+whose primary key is (day, employee_id), so every page is an index
+range read that starts right after the previous page's last key:
+
+    WHERE (day, employee_id) > (:day, :employee_id)
+    ORDER BY day, employee_id
+
+The range is walked CHUNK_DAYS days at a time (each chunk's rollups are
+refreshed just before it is read) and BATCH_ROWS rows per query, with
+the connection closed between batches. A page or a full NDJSON stream
+therefore holds at most one batch in memory and never keeps a read
+open while the client is slow, whatever the size of the range.
+
+Cursors are opaque to clients: urlsafe base64 of [day, employee_id].
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from datetime import date, timedelta
+from typing import Iterator, Optional, Sequence, Tuple
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Days refreshed / read per step, rows per query
+CHUNK_DAYS = 7
+BATCH_ROWS = 1000
+
+
+# --------------------------------------------------
+# Cursor
+# --------------------------------------------------
+def encode_cursor(key: Sequence[str]) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[str, str]:
+    """Raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, str) for k in key)):
+        raise ValueError("Invalid cursor")
+    try:
+        date.fromisoformat(key[0])
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+    return key[0], key[1]
+
+
+# --------------------------------------------------
+# Rows
+# --------------------------------------------------
+def _batch(conn, lo: str, hi: str, after: Tuple[str, str]) -> list:
+    rows = conn.execute(
+        """
+        SELECT day, employee_id, first_event, last_event, event_count
+        FROM attendance_day_rollups
+        WHERE day BETWEEN ? AND ? AND (day, employee_id) > (?, ?)
+        ORDER BY day, employee_id
+        LIMIT ?
+        """,
+        (lo, hi, after[0], after[1], BATCH_ROWS),
+    ).fetchall()
+    if not rows:
+        return []
+
+    ids = sorted({r["employee_id"] for r in rows})
+    names = dict(conn.execute(
+        f"""
+        SELECT employee_id, MAX(name) FROM users
+        WHERE employee_id IN ({",".join("?" * len(ids))})
+        GROUP BY employee_id
+        """,
+        ids,
+    ).fetchall())
+    return [
+        {
+            "date": r["day"],
+            "employee_id": r["employee_id"],
+            "name": names.get(r["employee_id"]),
+            "first_in": r["first_event"],
+            "last_out": r["last_event"],
+            "event_count": r["event_count"],
+        }
+        for r in rows
+    ]
+
+
+def iter_rows(start: date, end: date, after: Optional[Tuple[str, str]] = None) -> Iterator[dict]:
+    """
+    Rows of [start, end] in (date, employee_id) order, after the key
+    `after` when given (a decoded cursor).
+    """
+    from services.dashboard_stats import _conn, refresh
+
+    key = after or ("", "")
+    day = start
+    if after:
+        day = max(start, date.fromisoformat(after[0]))
+
+    while day <= end:
+        chunk_end = min(day + timedelta(days=CHUNK_DAYS - 1), end)
+        refresh(day, chunk_end)
+        lo, hi = day.isoformat(), chunk_end.isoformat()
+        while True:
+            conn = _conn()
+            try:
+                rows = _batch(conn, lo, hi, key)
+            finally:
+                conn.close()
+            for row in rows:
+                yield row
+            if len(rows) < BATCH_ROWS:
+                break
+            key = (rows[-1]["date"], rows[-1]["employee_id"])
+        day = chunk_end + timedelta(days=1)
+
+
+def page(start: date, end: date, limit: int = PAGE_SIZE,
+         cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    """
+    (rows, next cursor) for one page; the cursor is None on the last
+    page. Raises ValueError on a bad cursor.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    rows = []
+    more = False
+    for row in iter_rows(start, end, after):
+        if len(rows) == limit:
+            more = True
+            break
+        rows.append(row)
+
+    next_cursor = encode_cursor((rows[-1]["date"], rows[-1]["employee_id"])) if more else None
+    return rows, next_cursor
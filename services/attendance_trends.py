@@ -0,0 +1,434 @@
+# services/attendance_trends.py
+"""
+Long-range attendance trends as compact daily time series.
+
+    attendance_trend_days    (scope, scope_id, day) -> expected,
+                             attended (of them scheduled), punches,
+                             late, early, missed, presence seconds,
+                             overtime hours
+    attendance_trend_built   day -> events version / TREND_FORMAT it was
+                             built at
+
+Scopes:
+
+    company      scope_id ''
+    department   scope_id = users.department_id (membership at build time)
+    device       scope_id = device of the employee-day's first punch
+
+A trend day is assembled once from the per-day rollups that already
+exist (dashboard_stats: attendance flags, payroll_rollups: worked time
+and schedule overtime) and is only rebuilt when events of its
+Monday-based week, up to the next day, move (a back-dated punch also
+rebuilds the rest of its week, whose weekly overtime depends on it).
+Schedule, overtime policy, user or department edits do not rewrite
+history; rebuild() does that on request.
+
+Overtime is the payroll figure: the schedule split, or for employees
+with an overtime policy the same services.overtime.split_hours() split
+payroll applies, with weekly thresholds counted in Monday-based weeks
+(the default mon_sat pay period).
+
+expected = active employees with a resolved schedule on the day, as of
+the build; attendance rate = scheduled attended / expected. Device
+points have no expected headcount (employees are not assigned to
+devices), so they carry neither expected nor attendance_rate.
+
+series() answers any range and granularity (day / week / month) with
+one primary-key range read of a single scope, so its cost follows the
+number of days asked for, not the volume of events behind them.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import get_conn
+from services import data_versions
+
+_tables_ready = False
+
+SCOPES = ("company", "department", "device")
+GRANULARITIES = ("day", "week", "month")
+
+# Days assembled per transaction on a cold range
+BUILD_CHUNK_DAYS = 31
+
+# Bump when a trend day is computed differently (old days are rebuilt)
+#   2: overtime policies applied
+TREND_FORMAT = 2
+
+# Period key of a day per granularity (weeks start on Monday)
+_PERIOD_SQL = {
+    "day": "day",
+    "week": "date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days')",
+    "month": "substr(day, 1, 7) || '-01'",
+}
+
+_METRICS = (
+    "expected", "attended", "attended_scheduled", "punches",
+    "late", "early", "missed", "worked_sec", "ot_hours",
+)
+
+
+def ensure_trend_tables(cur):
+    data_versions.ensure_event_version_tables(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_trend_days (
+            scope              TEXT NOT NULL,
+            scope_id           TEXT NOT NULL,
+            day                TEXT NOT NULL,
+            expected           INTEGER NOT NULL DEFAULT 0,
+            attended           INTEGER NOT NULL DEFAULT 0,
+            attended_scheduled INTEGER NOT NULL DEFAULT 0,
+            punches            INTEGER NOT NULL DEFAULT 0,
+            late               INTEGER NOT NULL DEFAULT 0,
+            early              INTEGER NOT NULL DEFAULT 0,
+            missed             INTEGER NOT NULL DEFAULT 0,
+            worked_sec         REAL NOT NULL DEFAULT 0,
+            ot_hours           REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, scope_id, day)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_trend_built (
+            day            TEXT PRIMARY KEY,
+            events_version INTEGER NOT NULL,
+            format         INTEGER NOT NULL DEFAULT 1,
+            built_at       TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(attendance_trend_built)").fetchall()}
+    if "format" not in cols:
+        cur.execute("ALTER TABLE attendance_trend_built ADD COLUMN format INTEGER NOT NULL DEFAULT 1")
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_trend_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+# --------------------------------------------------
+# Staleness
+# --------------------------------------------------
+def _wanted(conn, start: date, end: date) -> Dict[str, int]:
+    """
+    day -> events version it must be built at: events from the Monday
+    of its week (weekly overtime thresholds carry over from earlier
+    days) through the next day, with a day of margin before.
+    """
+    first = start - timedelta(days=start.weekday() + 1)
+    per_day = dict(conn.execute(
+        "SELECT day, version FROM event_day_versions WHERE day BETWEEN ? AND ?",
+        (first.isoformat(), (end + timedelta(days=1)).isoformat()),
+    ).fetchall())
+    return {
+        d.isoformat(): sum(
+            per_day.get((d + timedelta(days=k)).isoformat(), 0)
+            for k in range(-d.weekday() - 1, 2)
+        )
+        for d in _days(start, end)
+    }
+
+
+def _stale_runs(conn, wanted: Dict[str, int]) -> List[Tuple[date, date]]:
+    days = sorted(wanted)
+    have = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute(
+            "SELECT day, events_version, format FROM attendance_trend_built WHERE day BETWEEN ? AND ?",
+            (days[0], days[-1]),
+        ).fetchall()
+    }
+
+    runs: List[Tuple[date, date]] = []
+    for ds in days:
+        if have.get(ds) == (wanted[ds], TREND_FORMAT):
+            continue
+        d = date.fromisoformat(ds)
+        if runs and runs[-1][1] == d - timedelta(days=1) and (d - runs[-1][0]).days < BUILD_CHUNK_DAYS:
+            runs[-1] = (runs[-1][0], d)
+        else:
+            runs.append((d, d))
+    return runs
+
+
+# --------------------------------------------------
+# Build
+# --------------------------------------------------
+def _active_departments(conn) -> Dict[str, Optional[str]]:
+    """Active employee_id -> department id ('' when none); schema tolerant."""
+    try:
+        rows = conn.execute("""
+            SELECT employee_id, MAX(department_id) AS department_id FROM users
+            WHERE COALESCE(is_active, 1) = 1 AND employee_id IS NOT NULL
+            GROUP BY employee_id
+        """).fetchall()
+    except sqlite3.OperationalError:
+        # No departments schema
+        rows = conn.execute("""
+            SELECT employee_id, NULL AS department_id FROM users
+            WHERE COALESCE(is_active, 1) = 1 AND employee_id IS NOT NULL
+            GROUP BY employee_id
+        """).fetchall()
+    return {
+        str(r["employee_id"]): ("" if r["department_id"] is None else str(r["department_id"]))
+        for r in rows
+    }
+
+
+def _policy_overtime(conn, start: date, end: date, employee_ids) -> Dict[Tuple[str, str], float]:
+    """
+    (day, employee_id) -> overtime hours for employees with an overtime
+    policy, split like payroll (services.overtime.apply_policies).
+    Payroll rollups must be fresh from the Monday on / before start.
+    """
+    from services import overtime
+
+    if not overtime.ENABLED:
+        return {}
+    user_policy, holidays, user_dept = overtime.load_policies(sorted(employee_ids))
+    if not user_policy:
+        return {}
+
+    emps = sorted(user_policy)
+    emp_index = {e: i for i, e in enumerate(emps)}
+    week_start = start - timedelta(days=start.weekday())
+    dates = _days(week_start, end)
+    day_index = {d.isoformat(): j for j, d in enumerate(dates)}
+
+    worked = np.zeros((len(emps), len(dates)))
+    for chunk in range(0, len(emps), 500):
+        batch = emps[chunk:chunk + 500]
+        for r in conn.execute(
+            f"""
+            SELECT day, employee_id, day_json FROM payroll_day_rollups
+            WHERE day BETWEEN ? AND ? AND employee_id IN ({",".join("?" * len(batch))})
+            """,
+            (week_start.isoformat(), end.isoformat(), *batch),
+        ):
+            worked[emp_index[r["employee_id"]], day_index[r["day"]]] = (
+                json.loads(r["day_json"]).get("worked_sec") or 0
+            )
+
+    holiday = overtime.holiday_mask(holidays, dates, [user_dept.get(e) for e in emps])
+    split = overtime.split_hours(worked, dates, [user_policy[e] for e in emps], holiday)
+
+    first = (start - week_start).days
+    return {
+        (dates[j].isoformat(), emp): float(split["overtime"][i, j])
+        for i, emp in enumerate(emps)
+        for j in range(first, len(dates))
+        if worked[i, j] > 0
+    }
+
+
+def _build(conn, start: date, end: date, wanted: Dict[str, int]):
+    from services import dashboard_stats, payroll_rollups
+
+    # Source rollups for the run (no-ops when already fresh); payroll
+    # from the week start, for weekly overtime thresholds
+    dashboard_stats.refresh(start, end)
+    payroll_rollups.refresh(start - timedelta(days=start.weekday()), end)
+
+    lo, hi = start.isoformat(), end.isoformat()
+    days = _days(start, end)
+
+    rows = conn.execute(
+        """
+        SELECT r.day, r.employee_id, r.event_count, r.late, r.early, r.missed, r.worked_sec,
+               (SELECT MIN(e.device_id) FROM events e
+                WHERE e.timestamp = r.first_event AND e.employee_id = r.employee_id) AS device_id
+        FROM attendance_day_rollups r
+        WHERE r.day BETWEEN ? AND ?
+        """,
+        (lo, hi),
+    ).fetchall()
+    overtime = {
+        (r["day"], r["employee_id"]): r["ot_hours"]
+        for r in conn.execute(
+            "SELECT day, employee_id, ot_hours FROM payroll_day_rollups WHERE day BETWEEN ? AND ? AND ot_hours > 0",
+            (lo, hi),
+        ).fetchall()
+    }
+    overtime.update(_policy_overtime(conn, start, end, {r["employee_id"] for r in rows}))
+    departments = _active_departments(conn)
+
+    series: Dict[Tuple[str, str, str], list] = {}
+
+    def add(scope, scope_id, day, values):
+        acc = series.setdefault((scope, scope_id, day), [0] * len(_METRICS))
+        for k, v in enumerate(values):
+            acc[k] += v
+
+    # expected: scheduled active employees per day
+    employee_ids = sorted(departments)
+    emp_index = {e: i for i, e in enumerate(employee_ids)}
+    day_index = {d.isoformat(): j for j, d in enumerate(days)}
+    _, _, has_sched = dashboard_stats.schedule_bounds(employee_ids, days)
+    for j, d in enumerate(days):
+        ds = d.isoformat()
+        add("company", "", ds, (int(has_sched[:, j].sum()),) + (0,) * (len(_METRICS) - 1))
+        for i, eid in enumerate(employee_ids):
+            if departments[eid]:
+                add("department", departments[eid], ds,
+                    (int(has_sched[i, j]),) + (0,) * (len(_METRICS) - 1))
+
+    for r in rows:
+        eid = r["employee_id"]
+        i = emp_index.get(eid)
+        scheduled = int(i is not None and has_sched[i, day_index[r["day"]]])
+        values = (
+            0, 1, scheduled, r["event_count"], r["late"], r["early"], r["missed"], r["worked_sec"],
+            overtime.get((r["day"], eid), 0.0),
+        )
+        add("company", "", r["day"], values)
+        if departments.get(eid):
+            add("department", departments[eid], r["day"], values)
+        if r["device_id"] is not None:
+            add("device", str(r["device_id"]), r["day"], values)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM attendance_trend_days WHERE day BETWEEN ? AND ?", (lo, hi))
+        conn.executemany(
+            f"""
+            INSERT INTO attendance_trend_days (scope, scope_id, day, {", ".join(_METRICS)})
+            VALUES (?, ?, ?, {", ".join("?" * len(_METRICS))})
+            """,
+            [(*key, *values) for key, values in series.items()],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO attendance_trend_built (day, events_version, format) VALUES (?, ?, ?)",
+            [(d.isoformat(), wanted[d.isoformat()], TREND_FORMAT) for d in days],
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def refresh(start: date, end: date) -> int:
+    """Build missing / stale trend days in [start, end]. Returns days built."""
+    if start > end:
+        return 0
+
+    conn = _conn()
+    try:
+        wanted = _wanted(conn, start, end)
+        built = 0
+        for run_start, run_end in _stale_runs(conn, wanted):
+            _build(conn, run_start, run_end, wanted)
+            built += (run_end - run_start).days + 1
+        return built
+    finally:
+        conn.close()
+
+
+def rebuild(start: date, end: date) -> int:
+    """Forget and rebuild [start, end] (after schedule / department edits)."""
+    conn = _conn()
+    try:
+        conn.execute(
+            "DELETE FROM attendance_trend_built WHERE day BETWEEN ? AND ?",
+            (start.isoformat(), end.isoformat()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return refresh(start, end)
+
+
+# --------------------------------------------------
+# Read
+# --------------------------------------------------
+def _period_starts(start: date, end: date, granularity: str) -> List[date]:
+    if granularity == "day":
+        return _days(start, end)
+    if granularity == "week":
+        d = start - timedelta(days=start.weekday())
+        out = []
+        while d <= end:
+            out.append(d)
+            d += timedelta(days=7)
+        return out
+    d = start.replace(day=1)
+    out = []
+    while d <= end:
+        out.append(d)
+        d = (d + timedelta(days=32)).replace(day=1)
+    return out
+
+
+def _point(scope: str, period: date, v: dict) -> dict:
+    attended = v["attended"]
+    expected = v["expected"]
+    point = {
+        "period": period.isoformat(),
+        **{k: v[k] for k in _METRICS if k != "worked_sec"},
+        "worked_hours": round(v["worked_sec"] / 3600, 2),
+        "ot_hours": round(v["ot_hours"], 2),
+        "attendance_rate": round(v["attended_scheduled"] / expected * 100, 1) if expected else None,
+        "late_rate": round(v["late"] / attended * 100, 1) if attended else None,
+    }
+    if scope == "device":
+        del point["expected"], point["attendance_rate"]
+    return point
+
+
+def series(scope: str, scope_id: str, start: date, end: date, granularity: str = "day") -> dict:
+    """
+    Time series of one scope over [start, end]. Raises ValueError on an
+    unknown scope / granularity or an inverted range.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if start > end:
+        raise ValueError("start must not be after end")
+    scope_id = "" if scope == "company" else str(scope_id or "")
+
+    refresh(start, end)
+
+    conn = _conn()
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT {_PERIOD_SQL[granularity]} AS period,
+                   {", ".join(f"SUM({m}) AS {m}" for m in _METRICS)}
+            FROM attendance_trend_days
+            WHERE scope = ? AND scope_id = ? AND day BETWEEN ? AND ?
+            GROUP BY period
+            """,
+            (scope, scope_id, start.isoformat(), end.isoformat()),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    by_period = {r["period"]: dict(r) for r in rows}
+    empty = dict.fromkeys(_METRICS, 0)
+    return {
+        "scope": scope,
+        "scope_id": scope_id or None,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "granularity": granularity,
+        "points": [
+            _point(scope, p, by_period.get(p.isoformat(), empty))
+            for p in _period_starts(start, end, granularity)
+        ],
+    }
@@ -0,0 +1,235 @@
+# services/change_feed.py
+"""
+Change log for incremental downstream sync (GET /api/v1/changes).
+
+    change_log   seq (monotonic) -> entity, entity id, op, employee_id,
+                 attendance day, changed_at
+
+Entries:
+
+    event       insert / update / delete of an events row (id = events.id;
+                employee_id / day are the row's values, an update that
+                moves a punch to another employee or day logs the old
+                pair too)
+    user        insert / update / delete of a users row (id = employee_id)
+    schedules   any schedule write (one entry per bump_schedule_version();
+                schedule data has many tables, so consumers re-read it)
+
+Events and users are logged by triggers, so every writer in every
+process is covered once the tables exist; server.py installs them at
+startup (install()), before the first request. SQLite serializes writers,
+so seq order is commit order and a reader never sees a later seq
+before an earlier one. Reading is a primary-key range scan from the
+cursor: sync cost follows the number of changes, not the data size.
+
+Entries older than RETENTION_DAYS are pruned; a cursor from before the
+oldest kept entry is reported as expired. To (re)sync fully, a client
+takes since=latest FIRST, then copies the data, then reads changes
+from that cursor: changes made during the copy are replayed rather
+than lost (replaying one already copied is harmless).
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from db import get_conn
+
+RETENTION_DAYS = int(os.getenv("ATT_CHANGE_LOG_DAYS", "90"))
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Seconds between retention passes (per process)
+PRUNE_INTERVAL = 3600
+
+# Attendance day of a stored timestamp (as /attendance/range reports it)
+_DAY = "CASE WHEN length({ts}) = 19 THEN substr({ts}, 1, 10) ELSE DATE({ts}) END"
+
+_tables_ready = False
+_last_prune = 0.0
+
+
+class CursorExpired(Exception):
+    """The cursor points before the oldest retained change."""
+
+
+def ensure_change_log_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity      TEXT NOT NULL,
+            entity_id   TEXT,
+            op          TEXT NOT NULL,
+            employee_id TEXT,
+            day         TEXT,
+            changed_at  TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_change_log_changed_at ON change_log (changed_at)")
+
+    log_event = """
+        INSERT INTO change_log (entity, entity_id, op, employee_id, day)
+        VALUES ('event', {row}.id, '{op}', {row}.employee_id, {day});
+    """
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_change_insert
+        AFTER INSERT ON events
+        BEGIN {log_event.format(row="NEW", op="insert", day=_DAY.format(ts="NEW.timestamp"))} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_change_delete
+        AFTER DELETE ON events
+        BEGIN {log_event.format(row="OLD", op="delete", day=_DAY.format(ts="OLD.timestamp"))} END
+    """)
+    # promoted / picture updates are not attendance changes
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_change_update
+        AFTER UPDATE OF device_id, employee_id, name, timestamp, direction ON events
+        BEGIN {log_event.format(row="NEW", op="update", day=_DAY.format(ts="NEW.timestamp"))} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_change_move
+        AFTER UPDATE OF employee_id, timestamp ON events
+        WHEN OLD.employee_id IS NOT NEW.employee_id
+          OR {_DAY.format(ts="OLD.timestamp")} IS NOT {_DAY.format(ts="NEW.timestamp")}
+        BEGIN {log_event.format(row="OLD", op="update", day=_DAY.format(ts="OLD.timestamp"))} END
+    """)
+
+    log_user = """
+        INSERT INTO change_log (entity, entity_id, op, employee_id)
+        VALUES ('user', {row}.employee_id, '{op}', {row}.employee_id);
+    """
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_insert
+        AFTER INSERT ON users
+        BEGIN {log_user.format(row="NEW", op="insert")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_delete
+        AFTER DELETE ON users
+        BEGIN {log_user.format(row="OLD", op="delete")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_update
+        AFTER UPDATE ON users
+        BEGIN {log_user.format(row="NEW", op="update")} END
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_change_log_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def install():
+    """Create the change log and its triggers (idempotent; call at startup)."""
+    _conn().close()
+
+
+# --------------------------------------------------
+# Write
+# --------------------------------------------------
+def record_schedules():
+    """Log one schedules change. Call AFTER the schedule write commits."""
+    try:
+        conn = _conn()
+        try:
+            conn.execute("INSERT INTO change_log (entity, op) VALUES ('schedules', 'update')")
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"[change_feed] could not log schedule change: {e}")
+
+
+def _prune(conn):
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    conn.execute(
+        "DELETE FROM change_log WHERE changed_at < datetime('now', ?)",
+        (f"-{RETENTION_DAYS} days",),
+    )
+    conn.commit()
+
+
+# --------------------------------------------------
+# Read
+# --------------------------------------------------
+def _head(conn) -> int:
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def parse_cursor(token: Optional[str]) -> Optional[int]:
+    """
+    Sequence number of a cursor; None for "latest". Raises ValueError
+    on a malformed cursor.
+    """
+    if token is None or token == "":
+        return 0
+    if token == "latest":
+        return None
+    if not token.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(token)
+
+
+def changes(since: Optional[int], limit: int = PAGE_SIZE) -> Tuple[list, str, bool]:
+    """
+    (changes after since, next cursor, more pending). since=None starts
+    at the current head (nothing returned, just the cursor). Raises
+    CursorExpired when since is older than the retained log.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    conn = _conn()
+    try:
+        _prune(conn)
+        if since is None:
+            return [], str(_head(conn)), False
+
+        oldest = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+        first_kept = oldest if oldest is not None else _head(conn) + 1
+        if since + 1 < first_kept:
+            raise CursorExpired()
+
+        rows = conn.execute(
+            """
+            SELECT seq, entity, entity_id, op, employee_id, day, changed_at
+            FROM change_log
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+            """,
+            (since, limit + 1),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    out = [
+        {
+            "seq": r["seq"],
+            "entity": r["entity"],
+            "id": r["entity_id"],
+            "op": r["op"],
+            "employee_id": r["employee_id"],
+            "date": r["day"],
+            "changed_at": r["changed_at"],
+        }
+        for r in rows
+    ]
+    next_cursor = str(rows[-1]["seq"]) if rows else str(since)
+    return out, next_cursor, more
@@ -0,0 +1,499 @@
+# services/dashboard_stats.py
+"""
+Set-based dashboard attendance statistics.
+
+Two rollup tables, both caches of the events table:
+
+    attendance_day_rollups    (day, employee_id) -> punch count, first /
+                              last punch, late / early / missed flags,
+                              presence seconds
+    attendance_month_rollups  (month, employee_id) -> attended days,
+                              late / early / missed days, presence
+                              seconds, attendance rate
+
+attendance_rollup_days records the events and schedules versions each
+day was built at. refresh() rebuilds only days whose events moved
+(event_day_versions over day-1..day+1: DATE() moves offset timestamps
+to the UTC date, so a day can receive punches stored under a
+neighbouring date prefix) or whose schedules changed. A day rebuild
+applies the difference between the day's old and new rows to the
+month rows in the same transaction, so a month row is always the sum
+of its days without re-aggregating the month.
+
+Flags of an attended employee-day with a resolved schedule:
+
+    late    first punch clock > scheduled start
+    early   last punch clock  < scheduled end
+    missed  a single punch
+
+Days without a resolved schedule count as attended only. Presence
+seconds are last punch - first punch.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from calendar import monthrange
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from db import get_conn
+from services import data_versions
+from services.schedule_engine import configured_sources, resolve_schedules
+from services.timestamps import parse_iso
+
+_tables_ready = False
+
+# Longest run rebuilt in one pass (bounds memory on cold ranges)
+BUILD_CHUNK_DAYS = 31
+
+# Same day as DATE(timestamp), without date parsing for the
+# collector-normalized shape
+_DAY = "CASE WHEN length(timestamp) = 19 THEN substr(timestamp, 1, 10) ELSE DATE(timestamp) END"
+
+BUILD_SQL = f"""
+    SELECT
+        {_DAY} AS day,
+        employee_id,
+        COUNT(*) AS event_count,
+        MIN(timestamp) AS first_event,
+        MAX(timestamp) AS last_event
+    FROM events
+    WHERE timestamp >= ? AND timestamp < ?
+      AND {_DAY} BETWEEN ? AND ?
+      AND employee_id IS NOT NULL
+    GROUP BY employee_id, day
+"""
+
+
+def ensure_dashboard_tables(cur):
+    data_versions.ensure_event_version_tables(cur)
+    # Range prefilter for rebuilds (raw date prefix, one day of slack)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)")
+
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(attendance_day_rollups)").fetchall()}
+    if cols and "late" not in cols:
+        # Built before flags were stored: cache only, rebuilt on demand
+        cur.execute("DROP TABLE attendance_day_rollups")
+        cur.execute("DROP TABLE IF EXISTS attendance_rollup_days")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_day_rollups (
+            day         TEXT NOT NULL,
+            employee_id TEXT NOT NULL,
+            event_count INTEGER NOT NULL,
+            first_event TEXT NOT NULL,
+            last_event  TEXT NOT NULL,
+            first_sec   REAL,
+            last_sec    REAL,
+            late        INTEGER NOT NULL DEFAULT 0,
+            early       INTEGER NOT NULL DEFAULT 0,
+            missed      INTEGER NOT NULL DEFAULT 0,
+            worked_sec  REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, employee_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_rollup_days (
+            day               TEXT PRIMARY KEY,
+            events_version    INTEGER NOT NULL,
+            schedules_version INTEGER NOT NULL DEFAULT 0,
+            built_at          TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_month_rollups (
+            month           TEXT NOT NULL,      -- 'YYYY-MM'
+            employee_id     TEXT NOT NULL,
+            attended_days   INTEGER NOT NULL DEFAULT 0,
+            late_days       INTEGER NOT NULL DEFAULT 0,
+            early_days      INTEGER NOT NULL DEFAULT 0,
+            missed_days     INTEGER NOT NULL DEFAULT 0,
+            worked_sec      REAL NOT NULL DEFAULT 0,
+            attendance_rate REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, employee_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_dashboard_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+# --------------------------------------------------
+# Clock helpers
+# --------------------------------------------------
+def _clock(value) -> int:
+    """Schedule 'HH:MM' / 'HH:MM:SS' / time -> seconds; -1 when unusable."""
+    t = value if isinstance(value, time) else None
+    if isinstance(value, str) and value:
+        try:
+            t = datetime.strptime(value, "%H:%M" if len(value) == 5 else "%H:%M:%S").time()
+        except ValueError:
+            return -1
+    if t is None:
+        return -1
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def punch_clock(ts: str) -> Optional[float]:
+    """
+    Wall-clock seconds of a stored punch as written (offset values keep
+    their own clock); fractional seconds count as later. None when
+    unparsable.
+    """
+    if len(ts) == 19:
+        try:
+            return int(ts[11:13]) * 3600 + int(ts[14:16]) * 60 + int(ts[17:19])
+        except ValueError:
+            pass
+    dt = parse_iso(ts)
+    if dt is None:
+        return None
+    return dt.hour * 3600 + dt.minute * 60 + dt.second + (dt.microsecond > 0) * 0.5
+
+
+def event_day(ts: str) -> Optional[str]:
+    """Python side of _DAY: the dashboard day a stored punch counts on."""
+    if len(ts) == 19:
+        return ts[:10]
+    dt = parse_iso(ts)
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.date().isoformat()
+
+
+def _presence(first_event: str, last_event: str) -> float:
+    """Seconds from first to last punch (0 when unparsable)."""
+    first = parse_iso(first_event)
+    last = parse_iso(last_event)
+    if first is None or last is None:
+        return 0.0
+    if (first.tzinfo is None) != (last.tzinfo is None):
+        # Mixed shapes: compare wall clocks
+        first = first.replace(tzinfo=None)
+        last = last.replace(tzinfo=None)
+    return max((last - first).total_seconds(), 0.0)
+
+
+# --------------------------------------------------
+# Schedules
+# --------------------------------------------------
+def schedule_bounds(employee_ids: Sequence[str], dates: Sequence[date]):
+    """
+    Resolved schedules as employees x days matrices:
+    (start seconds, end seconds, has schedule); -1 = no usable time.
+    """
+    grid = resolve_schedules(employee_ids, dates, configured_sources())
+    shape = (len(employee_ids), len(dates))
+    start_m = np.full(shape, -1.0)
+    end_m = np.full(shape, -1.0)
+    has_sched = np.zeros(shape, dtype=bool)
+    bounds: Dict[int, tuple] = {}
+    for i, eid in enumerate(employee_ids):
+        for j, cell in enumerate(grid.row(eid)):
+            if not cell:
+                continue
+            # Cells are shared between employee-days: convert once
+            b = bounds.get(id(cell))
+            if b is None:
+                b = bounds[id(cell)] = (_clock(cell.get("start_time")), _clock(cell.get("end_time")))
+            start_m[i, j], end_m[i, j] = b
+            has_sched[i, j] = True
+    return start_m, end_m, has_sched
+
+
+# --------------------------------------------------
+# Rollups
+# --------------------------------------------------
+def _wanted(conn, start: date, end: date) -> Dict[str, Tuple[int, int]]:
+    """day -> (events version, schedules version) a fresh day must carry."""
+    per_day = dict(conn.execute(
+        "SELECT day, version FROM event_day_versions WHERE day BETWEEN ? AND ?",
+        ((start - timedelta(days=1)).isoformat(), (end + timedelta(days=1)).isoformat()),
+    ).fetchall())
+    schedules = data_versions.current("schedules")
+    return {
+        d.isoformat(): (
+            sum(per_day.get((d + timedelta(days=k)).isoformat(), 0) for k in (-1, 0, 1)),
+            schedules,
+        )
+        for d in _days(start, end)
+    }
+
+
+def _stale_runs(conn, wanted: Dict[str, Tuple[int, int]]) -> List[Tuple[date, date]]:
+    days = sorted(wanted)
+    have = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute(
+            """
+            SELECT day, events_version, schedules_version
+            FROM attendance_rollup_days WHERE day BETWEEN ? AND ?
+            """,
+            (days[0], days[-1]),
+        ).fetchall()
+    }
+
+    runs: List[Tuple[date, date]] = []
+    for ds in days:
+        if have.get(ds) == wanted[ds]:
+            continue
+        d = date.fromisoformat(ds)
+        if runs and runs[-1][1] == d - timedelta(days=1) and (d - runs[-1][0]).days < BUILD_CHUNK_DAYS:
+            runs[-1] = (runs[-1][0], d)
+        else:
+            runs.append((d, d))
+    return runs
+
+
+def _day_rows(conn, start: date, end: date) -> list:
+    """Fresh attendance_day_rollups rows for [start, end]."""
+    rows = conn.execute(
+        BUILD_SQL,
+        (
+            (start - timedelta(days=1)).isoformat(),
+            (end + timedelta(days=2)).isoformat(),
+            start.isoformat(),
+            end.isoformat(),
+        ),
+    ).fetchall()
+
+    dates = _days(start, end)
+    day_index = {d.isoformat(): j for j, d in enumerate(dates)}
+    employee_ids = list(dict.fromkeys(str(r["employee_id"]) for r in rows))
+    emp_index = {e: i for i, e in enumerate(employee_ids)}
+    start_m, end_m, has_sched = schedule_bounds(employee_ids, dates)
+
+    out = []
+    for r in rows:
+        eid = str(r["employee_id"])
+        i, j = emp_index[eid], day_index[r["day"]]
+        first = punch_clock(r["first_event"])
+        last = punch_clock(r["last_event"])
+
+        late = early = missed = 0
+        # Unparsable punches only count as attended
+        if has_sched[i, j] and first is not None and last is not None:
+            s, e = start_m[i, j], end_m[i, j]
+            late = int(s >= 0 and first > s)
+            early = int(e >= 0 and last < e)
+            missed = int(r["event_count"] == 1)
+
+        out.append((
+            r["day"], eid, r["event_count"], r["first_event"], r["last_event"],
+            first, last, late, early, missed,
+            _presence(r["first_event"], r["last_event"]),
+        ))
+    return out
+
+
+def _month_deltas(old_rows, new_rows) -> Dict[Tuple[str, str], list]:
+    """(month, employee_id) -> [attended, late, early, missed, worked] change."""
+    deltas: Dict[Tuple[str, str], list] = {}
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        for day, eid, late, early, missed, worked in rows:
+            d = deltas.setdefault((day[:7], eid), [0, 0, 0, 0, 0.0])
+            d[0] += sign
+            d[1] += sign * late
+            d[2] += sign * early
+            d[3] += sign * missed
+            d[4] += sign * worked
+    return {k: v for k, v in deltas.items() if any(v)}
+
+
+def _build(conn, start: date, end: date, wanted: Dict[str, Tuple[int, int]]):
+    out = _day_rows(conn, start, end)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Read under the write lock: concurrent builders see each other
+        old = conn.execute(
+            """
+            SELECT day, employee_id, late, early, missed, worked_sec
+            FROM attendance_day_rollups WHERE day BETWEEN ? AND ?
+            """,
+            (start.isoformat(), end.isoformat()),
+        ).fetchall()
+        deltas = _month_deltas(
+            [tuple(r) for r in old],
+            [(r[0], r[1], r[7], r[8], r[9], r[10]) for r in out],
+        )
+
+        conn.execute(
+            "DELETE FROM attendance_day_rollups WHERE day BETWEEN ? AND ?",
+            (start.isoformat(), end.isoformat()),
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO attendance_day_rollups
+                (day, employee_id, event_count, first_event, last_event, first_sec, last_sec,
+                 late, early, missed, worked_sec)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            out,
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO attendance_rollup_days (day, events_version, schedules_version)
+            VALUES (?, ?, ?)
+            """,
+            [(d.isoformat(), *wanted[d.isoformat()]) for d in _days(start, end)],
+        )
+
+        conn.executemany(
+            """
+            INSERT INTO attendance_month_rollups
+                (month, employee_id, attended_days, late_days, early_days, missed_days, worked_sec)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (month, employee_id) DO UPDATE SET
+                attended_days = attended_days + excluded.attended_days,
+                late_days     = late_days + excluded.late_days,
+                early_days    = early_days + excluded.early_days,
+                missed_days   = missed_days + excluded.missed_days,
+                worked_sec    = worked_sec + excluded.worked_sec
+            """,
+            [(month, eid, *d) for (month, eid), d in deltas.items()],
+        )
+        for month in sorted({month for month, _ in deltas}):
+            year, mon = map(int, month.split("-"))
+            conn.execute(
+                "DELETE FROM attendance_month_rollups WHERE month = ? AND attended_days <= 0",
+                (month,),
+            )
+            conn.execute(
+                "UPDATE attendance_month_rollups SET attendance_rate = attended_days * 100.0 / ? WHERE month = ?",
+                (monthrange(year, mon)[1], month),
+            )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def refresh(start: date, end: date) -> int:
+    """Rebuild stale days in [start, end]. Returns the number of days rebuilt."""
+    conn = _conn()
+    try:
+        wanted = _wanted(conn, start, end)
+        rebuilt = 0
+        for run_start, run_end in _stale_runs(conn, wanted):
+            _build(conn, run_start, run_end, wanted)
+            rebuilt += (run_end - run_start).days + 1
+        return rebuilt
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Statistics
+# --------------------------------------------------
+def _names(conn) -> Dict[str, str]:
+    return {
+        str(r["employee_id"]): r["name"]
+        for r in conn.execute(
+            "SELECT employee_id, MAX(name) AS name FROM users GROUP BY employee_id"
+        ).fetchall()
+        if r["employee_id"] is not None
+    }
+
+
+def day_totals(day: date) -> Dict[str, int]:
+    """Attended employees and late / early / missed counts of one day."""
+    refresh(day, day)
+    conn = _conn()
+    try:
+        r = conn.execute(
+            """
+            SELECT COUNT(*) AS attended,
+                   COALESCE(SUM(late), 0) AS late,
+                   COALESCE(SUM(early), 0) AS early,
+                   COALESCE(SUM(missed), 0) AS missed
+            FROM attendance_day_rollups WHERE day = ?
+            """,
+            (day.isoformat(),),
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(r)
+
+
+def monthly_stats(year: int, month: int, employee_ids: Optional[Sequence[str]] = None) -> List[dict]:
+    """
+    Per-employee month rows (employees with at least one attended day),
+    optionally limited to employee_ids.
+    """
+    refresh(date(year, month, 1), date(year, month, monthrange(year, month)[1]))
+
+    sql = """
+        SELECT employee_id, attended_days, late_days, early_days, missed_days,
+               worked_sec, attendance_rate
+        FROM attendance_month_rollups WHERE month = ?
+    """
+    params: list = [f"{year:04d}-{month:02d}"]
+    if employee_ids is not None:
+        ids = [str(e) for e in employee_ids]
+        if not ids:
+            return []
+        sql += f" AND employee_id IN ({','.join('?' * len(ids))})"
+        params += ids
+
+    conn = _conn()
+    try:
+        names = _names(conn)
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    return [
+        {
+            "employee_id": r["employee_id"],
+            "name": names.get(r["employee_id"]) or r["employee_id"],
+            "attended_days": r["attended_days"],
+            "late_days": r["late_days"],
+            "early_days": r["early_days"],
+            "missed_days": r["missed_days"],
+            "worked_seconds": r["worked_sec"],
+            "attendance_rate": r["attendance_rate"],
+        }
+        for r in rows
+    ]
+
+
+def day_rows(start: date, end: date, employee_ids: Optional[Sequence[str]] = None) -> List[sqlite3.Row]:
+    """Per-(employee, day) rollups in [start, end], by employee and day."""
+    refresh(start, end)
+
+    sql = """
+        SELECT employee_id, day, event_count, first_event, last_event,
+               late, early, missed, worked_sec
+        FROM attendance_day_rollups WHERE day BETWEEN ? AND ?
+    """
+    params: list = [start.isoformat(), end.isoformat()]
+    if employee_ids is not None:
+        ids = [str(e) for e in employee_ids]
+        if not ids:
+            return []
+        sql += f" AND employee_id IN ({','.join('?' * len(ids))})"
+        params += ids
+    sql += " ORDER BY employee_id, day"
+
+    conn = _conn()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,196 @@
+# services/data_versions.py
+"""
+Cross-process data version counters.
+
+Each domain ("schedules", ...) is a small file next to the database.
+bump() appends one byte with O_APPEND (atomic across processes), so
+the version is simply the file size. current() is a single stat()
+call: gunicorn workers, cron scripts and the web app all see a bump
+immediately, without touching SQLite.
+
+Event, user and device versions live in SQLite instead (see
+ensure_event_version_tables): those tables have many writers in
+several processes, so triggers maintain them.
+
+Every version also has a modification time (file mtime, or the
+updated_at column the triggers set), for HTTP Last-Modified.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+from db import get_db_path
+
+
+def _versions_dir() -> str:
+    return os.getenv("ATT_VERSIONS_DIR") or f"{get_db_path()}.versions"
+
+
+def _path(domain: str) -> str:
+    return os.path.join(_versions_dir(), domain)
+
+
+def current(domain: str) -> int:
+    """Current version of a domain (0 if it was never bumped)."""
+    try:
+        return os.stat(_path(domain)).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def modified(domain: str) -> Optional[float]:
+    """Epoch seconds of the domain's last bump (None if never bumped)."""
+    try:
+        return os.stat(_path(domain)).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def bump(domain: str) -> int:
+    """Mark a domain as changed. Call AFTER the DB commit."""
+    path = _path(domain)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b".")
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"[data_versions] could not bump {domain}: {e}")
+    return current(domain)
+
+
+# --------------------------------------------------
+# SQL-side versions (maintained by triggers)
+#
+# Events are written by the collector, the API and maintenance
+# scripts, often from other processes. Triggers keep a per-day
+# counter, so readers can tell whether a date range changed without
+# every writer having to cooperate. Versions only ever increase:
+# SUM(version) over a range moves whenever any day in it changes.
+#
+# table_versions rows:
+#   users           employee_id / name changes (what derived
+#                   attendance data depends on)
+#   user_profiles   any change to a users row
+#   devices         device registry and fetch status changes
+# --------------------------------------------------
+_VERSION_TRIGGERS = (
+    "trg_events_insert_version", "trg_events_delete_version", "trg_events_update_version",
+    "trg_users_insert_version", "trg_users_delete_version", "trg_users_update_version",
+)
+
+
+def ensure_event_version_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS event_day_versions (
+            day        TEXT PRIMARY KEY,
+            version    INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name       TEXT PRIMARY KEY,
+            version    INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        ) WITHOUT ROWID
+    """)
+
+    # Older databases: add updated_at and replace the triggers that
+    # did not set it
+    for table in ("event_day_versions", "table_versions"):
+        cols = {r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+        if "updated_at" not in cols:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+            for name in _VERSION_TRIGGERS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    bump_day = """
+        INSERT INTO event_day_versions (day, version, updated_at)
+        VALUES (COALESCE(substr({row}.timestamp, 1, 10), ''), 1, datetime('now'))
+        ON CONFLICT(day) DO UPDATE SET version = version + 1, updated_at = datetime('now');
+    """
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_insert_version
+        AFTER INSERT ON events
+        BEGIN {bump_day.format(row="NEW")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_delete_version
+        AFTER DELETE ON events
+        BEGIN {bump_day.format(row="OLD")} END
+    """)
+    # promoted / picture updates do not change attendance
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_events_update_version
+        AFTER UPDATE OF employee_id, name, timestamp, direction ON events
+        BEGIN {bump_day.format(row="OLD")} {bump_day.format(row="NEW")} END
+    """)
+
+    bump_table = """
+        INSERT INTO table_versions (name, version, updated_at) VALUES ('{name}', 1, datetime('now'))
+        ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = datetime('now');
+    """
+    bump_users = bump_table.format(name="users") + bump_table.format(name="user_profiles")
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_version
+        AFTER INSERT ON users
+        BEGIN {bump_users} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_delete_version
+        AFTER DELETE ON users
+        BEGIN {bump_users} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_update_version
+        AFTER UPDATE OF employee_id, name ON users
+        BEGIN {bump_table.format(name="users")} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_profile_version
+        AFTER UPDATE ON users
+        BEGIN {bump_table.format(name="user_profiles")} END
+    """)
+
+    has_devices = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'devices'"
+    ).fetchone()
+    if has_devices:
+        bump_devices = bump_table.format(name="devices")
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_devices_insert_version
+            AFTER INSERT ON devices
+            BEGIN {bump_devices} END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_devices_delete_version
+            AFTER DELETE ON devices
+            BEGIN {bump_devices} END
+        """)
+        # last_seen_at heartbeats are not part of any listing
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_devices_update_version
+            AFTER UPDATE OF name, ip, active, last_fetch_at, last_fetch_count ON devices
+            BEGIN {bump_devices} END
+        """)
+
+
+def events_version(conn, start_day: str, end_day: str) -> int:
+    """Version of all events dated start_day..end_day ('YYYY-MM-DD')."""
+    row = conn.execute(
+        "SELECT COALESCE(SUM(version), 0) FROM event_day_versions WHERE day BETWEEN ? AND ?",
+        (start_day, end_day),
+    ).fetchone()
+    return int(row[0])
+
+
+def table_version(conn, name: str) -> int:
+    row = conn.execute(
+        "SELECT version FROM table_versions WHERE name = ?", (name,)
+    ).fetchone()
+    return int(row[0]) if row else 0
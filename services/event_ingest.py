@@ -0,0 +1,247 @@
+# services/event_ingest.py
+"""
+Batch event ingestion for API clients (terminals, the mobile app)
+uploading offline buffers.
+
+A batch is validated item by item, its employee ids are resolved with
+one query and every valid item is inserted in a single transaction.
+Each item gets its own status:
+
+    created     inserted now
+    duplicate   already stored (same client_event_id for this API key,
+                or the same device / employee / timestamp / direction)
+    error       rejected; "error" says why (a client_event_id reused
+                for a different event is a conflict, not a duplicate)
+
+Client event ids are remembered per API key:
+
+    api_event_ids   (api_key_id, client_event_id) -> events.id
+
+so a client can resend a whole buffer after a timeout and get the same
+event ids back without inserting anything twice.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from db import get_conn
+
+# Items accepted per request
+MAX_BATCH = 1000
+
+DIRECTIONS = ("in", "out")
+
+# SQLite host parameter budget per IN (...) query
+_IN_CHUNK = 500
+
+_tables_ready = False
+
+
+def ensure_ingest_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS api_event_ids (
+            api_key_id      INTEGER NOT NULL,
+            client_event_id TEXT NOT NULL,
+            event_id        INTEGER NOT NULL,
+            created_at      TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (api_key_id, client_event_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_ingest_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _chunks(values: Sequence, size: int = _IN_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+# --------------------------------------------------
+# Validation
+# --------------------------------------------------
+def _validate(item) -> Optional[str]:
+    """Error message for one item, or None when it can be inserted."""
+    if not isinstance(item, dict):
+        return "Item must be a JSON object"
+    for field in ("employee_id", "timestamp", "direction"):
+        if item.get(field) in (None, ""):
+            return f"Missing required field: {field}"
+    if item["direction"] not in DIRECTIONS:
+        return "direction must be 'in' or 'out'"
+    try:
+        datetime.fromisoformat(str(item["timestamp"]))
+    except ValueError:
+        return "Invalid timestamp format"
+    if not isinstance(item.get("device_id", 0), int):
+        return "device_id must be an integer"
+    client_id = item.get("client_event_id")
+    if client_id is not None and not isinstance(client_id, (str, int)):
+        return "client_event_id must be a string"
+    return None
+
+
+def _names(conn, employee_ids: Sequence[str]) -> Dict[str, str]:
+    names: Dict[str, str] = {}
+    for chunk in _chunks(list(employee_ids)):
+        names.update(conn.execute(
+            f"""
+            SELECT employee_id, MAX(name) FROM users
+            WHERE employee_id IN ({",".join("?" * len(chunk))})
+            GROUP BY employee_id
+            """,
+            chunk,
+        ).fetchall())
+    return names
+
+
+def _known_client_ids(conn, api_key_id: int, client_ids: Sequence[str]) -> Dict[str, int]:
+    known: Dict[str, int] = {}
+    for chunk in _chunks(list(client_ids)):
+        known.update(conn.execute(
+            f"""
+            SELECT client_event_id, event_id FROM api_event_ids
+            WHERE api_key_id = ? AND client_event_id IN ({",".join("?" * len(chunk))})
+            """,
+            (api_key_id, *chunk),
+        ).fetchall())
+    return known
+
+
+def _stored(conn, event_ids: Sequence[int]) -> Dict[int, tuple]:
+    """events.id -> (device_id, employee_id, timestamp, direction)."""
+    stored: Dict[int, tuple] = {}
+    for chunk in _chunks(list(event_ids)):
+        for r in conn.execute(
+            f"""
+            SELECT id, device_id, employee_id, timestamp, direction FROM events
+            WHERE id IN ({",".join("?" * len(chunk))})
+            """,
+            chunk,
+        ).fetchall():
+            stored[r["id"]] = (r["device_id"], str(r["employee_id"]), r["timestamp"], r["direction"])
+    return stored
+
+
+# --------------------------------------------------
+# Ingest
+# --------------------------------------------------
+def ingest(api_key_id: int, items: Sequence) -> List[dict]:
+    """
+    Store a batch of events for one API key. Returns one result per
+    item, in order: {"index", "status", "event_id", "client_event_id",
+    "error"} (event_id / error only when they apply).
+    """
+    results: List[dict] = []
+    valid = []
+    for index, item in enumerate(items):
+        error = _validate(item)
+        client_id = item.get("client_event_id") if isinstance(item, dict) else None
+        result = {"index": index, "status": "error" if error else None}
+        if client_id is not None:
+            result["client_event_id"] = str(client_id)
+        if error:
+            result["error"] = error
+        else:
+            valid.append((result, item))
+        results.append(result)
+
+    if not valid:
+        return results
+
+    new_rows = []
+    conn = _conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        names = _names(conn, sorted({str(item["employee_id"]) for _, item in valid}))
+        known = _known_client_ids(
+            conn, api_key_id,
+            sorted({r["client_event_id"] for r, _ in valid if "client_event_id" in r}),
+        )
+        stored = _stored(conn, sorted(set(known.values())))
+
+        for result, item in valid:
+            client_id = result.get("client_event_id")
+            employee_id = str(item["employee_id"])
+            key = (item.get("device_id", 0), employee_id, str(item["timestamp"]), item["direction"])
+            if client_id is not None and client_id in known:
+                event_id = known[client_id]
+                if stored.get(event_id, key) != key:
+                    result.update(
+                        status="error",
+                        error="client_event_id already used for a different event",
+                    )
+                else:
+                    result.update(status="duplicate", event_id=event_id)
+                continue
+
+            if employee_id not in names:
+                result.update(status="error", error="User not found")
+                continue
+
+            row = (
+                item.get("device_id", 0),
+                employee_id,
+                names[employee_id],
+                str(item["timestamp"]),
+                item["direction"],
+            )
+            cur = conn.execute(
+                """
+                INSERT OR IGNORE INTO events (device_id, employee_id, name, timestamp, direction)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                row,
+            )
+            if cur.rowcount:
+                event_id = cur.lastrowid
+                result.update(status="created", event_id=event_id)
+                new_rows.append({
+                    "id": event_id,
+                    "device_id": row[0],
+                    "employee_id": employee_id,
+                    "name": row[2],
+                    "timestamp": row[3],
+                    "direction": row[4],
+                })
+            else:
+                existing = conn.execute(
+                    """
+                    SELECT id FROM events
+                    WHERE device_id = ? AND employee_id = ? AND timestamp = ? AND direction = ?
+                    """,
+                    (row[0], row[1], row[3], row[4]),
+                ).fetchone()
+                event_id = existing["id"] if existing else None
+                result.update(status="duplicate", event_id=event_id)
+
+            if client_id is not None and event_id is not None:
+                conn.execute(
+                    "INSERT INTO api_event_ids (api_key_id, client_event_id, event_id) VALUES (?, ?, ?)",
+                    (api_key_id, client_id, event_id),
+                )
+                known[client_id] = event_id
+                stored[event_id] = key
+
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # Push to open dashboard / daily pages
+    from services.live_events import notify_events
+    notify_events(new_rows)
+
+    return results
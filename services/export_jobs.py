@@ -0,0 +1,363 @@
+# services/export_jobs.py
+"""
+Background export jobs.
+
+Large exports (payroll / FIFO XLSX, audit CSV, weekly-hours PDFs) are
+rendered off the request thread:
+
+    submit()    -> job row (export_jobs), rendered by a thread pool in
+                   the submitting process inside an app context
+                   (g.T / g.lang set from the job's language)
+    get_job()   -> status / progress, readable from any worker
+    artifact()  -> finished file, kept in export_dir() for TTL_SECONDS
+
+Jobs are deduplicated on (kind, params): while one is queued or
+running, identical submissions get the same job id (a partial unique
+index makes this hold across gunicorn workers too).
+
+While a job renders, a heartbeat thread touches it every
+HEARTBEAT_SECONDS, so renders that never report progress stay alive. A
+job whose worker died (restart, crash) stops updating; it is failed
+once it has been silent for STALE_SECONDS.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+from db import get_conn, get_db_path
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+EXPORT_WORKERS = int(os.getenv("ATT_EXPORT_WORKERS", "2"))
+TTL_SECONDS = int(os.getenv("ATT_EXPORT_TTL_HOURS", "24")) * 3600
+STALE_SECONDS = int(os.getenv("ATT_EXPORT_STALE_MINUTES", "30")) * 60
+HEARTBEAT_SECONDS = max(STALE_SECONDS // 4, 5)
+# Minimum interval between progress writes
+PROGRESS_INTERVAL = 0.5
+
+ACTIVE = ("queued", "running")
+
+# render(path, progress) -> (download_name, mimetype)
+Renderer = Callable[[str, Callable], Tuple[str, str]]
+
+_tables_ready = False
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def ensure_export_job_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id            TEXT PRIMARY KEY,
+            kind          TEXT NOT NULL,
+            params        TEXT NOT NULL,
+            dedupe_key    TEXT NOT NULL,
+            status        TEXT NOT NULL DEFAULT 'queued',
+            progress      REAL NOT NULL DEFAULT 0,
+            message       TEXT,
+            error         TEXT,
+            file_path     TEXT,
+            download_name TEXT,
+            mimetype      TEXT,
+            created_by    INTEGER,
+            created_at    TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at    TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at    TEXT
+        )
+    """)
+    # One active job per identical request
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_export_jobs_active
+        ON export_jobs(dedupe_key)
+        WHERE status IN ('queued', 'running')
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_export_jobs_expires
+        ON export_jobs(expires_at)
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_export_job_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def export_dir() -> str:
+    path = os.getenv("ATT_EXPORT_DIR") or f"{get_db_path()}.exports"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _executor() -> ThreadPoolExecutor:
+    # Created lazily: gunicorn forks workers after import
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(EXPORT_WORKERS, 1),
+                thread_name_prefix="export",
+            )
+        return _pool
+
+
+def dedupe_key(kind: str, params: dict) -> str:
+    raw = json.dumps([kind, params], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------
+# Housekeeping
+# --------------------------------------------------
+def _fail_stale(conn):
+    conn.execute(
+        """
+        UPDATE export_jobs
+        SET status = 'failed', error = 'worker stopped responding',
+            updated_at = datetime('now'),
+            expires_at = datetime('now', ?)
+        WHERE status IN ('queued', 'running')
+          AND updated_at < datetime('now', ?)
+        """,
+        (f"+{TTL_SECONDS} seconds", f"-{STALE_SECONDS} seconds"),
+    )
+
+
+def cleanup_expired() -> int:
+    """Delete expired jobs and their files. Returns the number removed."""
+    conn = _conn()
+    try:
+        rows = conn.execute(
+            """
+            SELECT id, file_path FROM export_jobs
+            WHERE expires_at IS NOT NULL AND expires_at < datetime('now')
+            """
+        ).fetchall()
+        for r in rows:
+            if r["file_path"]:
+                try:
+                    os.unlink(r["file_path"])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"[export_jobs] could not remove {r['file_path']}: {e}")
+        conn.executemany("DELETE FROM export_jobs WHERE id = ?", [(r["id"],) for r in rows])
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Worker side
+# --------------------------------------------------
+def _update(job_id: str, **fields):
+    sets = "".join(f"{k} = ?, " for k in fields)
+    conn = _conn()
+    try:
+        conn.execute(
+            f"UPDATE export_jobs SET {sets}updated_at = datetime('now') WHERE id = ?",
+            [*fields.values(), job_id],
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[export_jobs] could not update {job_id}: {e}")
+    finally:
+        conn.close()
+
+
+def _progress_callback(job_id: str):
+    last = [0.0]
+
+    def progress(fraction: float, message: Optional[str] = None):
+        now = time.monotonic()
+        if now - last[0] < PROGRESS_INTERVAL:
+            return
+        last[0] = now
+        fields = {"progress": round(max(0.0, min(float(fraction), 1.0)), 3)}
+        if message is not None:
+            fields["message"] = message
+        _update(job_id, **fields)
+
+    return progress
+
+
+def _heartbeat(job_id: str, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        _update(job_id)
+
+
+def _run(app, job_id: str, lang: str, render: Renderer, suffix: str):
+    from flask import g
+    from translations import LANG
+
+    path = os.path.join(export_dir(), f"{job_id}{suffix}")
+    tmp = f"{path}.part"
+    _update(job_id, status="running")
+
+    stop = threading.Event()
+    threading.Thread(
+        target=_heartbeat, args=(job_id, stop), name="export-heartbeat", daemon=True
+    ).start()
+    try:
+        try:
+            with app.app_context():
+                g.lang = lang
+                g.T = LANG.get(lang, LANG["en"])
+                download_name, mimetype = render(tmp, _progress_callback(job_id))
+        finally:
+            stop.set()
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[export_jobs] {job_id} failed: {e!r}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        conn = _conn()
+        try:
+            conn.execute(
+                """
+                UPDATE export_jobs
+                SET status = 'failed', error = ?, updated_at = datetime('now'),
+                    expires_at = datetime('now', ?)
+                WHERE id = ?
+                """,
+                (str(e) or e.__class__.__name__, f"+{TTL_SECONDS} seconds", job_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return
+
+    conn = _conn()
+    try:
+        conn.execute(
+            """
+            UPDATE export_jobs
+            SET status = 'done', progress = 1, message = NULL,
+                file_path = ?, download_name = ?, mimetype = ?,
+                updated_at = datetime('now'), expires_at = datetime('now', ?)
+            WHERE id = ?
+            """,
+            (path, download_name, mimetype, f"+{TTL_SECONDS} seconds", job_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+def submit(
+    kind: str,
+    params: dict,
+    render: Renderer,
+    lang: str = "en",
+    suffix: str = "",
+    created_by: Optional[int] = None,
+) -> dict:
+    """
+    Queue an export (call inside a request / app context).
+    Returns the job dict; an identical queued or running job is
+    returned instead of starting a new one.
+    """
+    from flask import current_app
+
+    key = dedupe_key(kind, {**params, "_lang": lang})
+    job_id = uuid.uuid4().hex
+
+    cleanup_expired()
+
+    conn = _conn()
+    try:
+        _fail_stale(conn)
+        cur = conn.execute(
+            """
+            INSERT OR IGNORE INTO export_jobs (id, kind, params, dedupe_key, created_by)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (job_id, kind, json.dumps(params, sort_keys=True, default=str), key, created_by),
+        )
+        conn.commit()
+        created = cur.rowcount == 1
+        if not created:
+            row = conn.execute(
+                """
+                SELECT id FROM export_jobs
+                WHERE dedupe_key = ? AND status IN ('queued', 'running')
+                """,
+                (key,),
+            ).fetchone()
+            if row is None:
+                # Finished between the insert and the lookup: start anew
+                conn.execute(
+                    """
+                    INSERT INTO export_jobs (id, kind, params, dedupe_key, created_by)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (job_id, kind, json.dumps(params, sort_keys=True, default=str), key, created_by),
+                )
+                conn.commit()
+                created = True
+            else:
+                job_id = row["id"]
+    finally:
+        conn.close()
+
+    if created:
+        app = current_app._get_current_object()
+        _executor().submit(_run, app, job_id, lang, render, suffix)
+
+    return get_job(job_id)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    conn = _conn()
+    try:
+        row = conn.execute(
+            "SELECT * FROM export_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row and row["status"] in ACTIVE:
+            _fail_stale(conn)
+            conn.commit()
+            row = conn.execute(
+                "SELECT * FROM export_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def artifact(job: dict) -> Optional[str]:
+    """Path of a finished, unexpired job's file (None otherwise)."""
+    if not job or job["status"] != "done" or not job["file_path"]:
+        return None
+    # Same clock and format as SQLite's datetime('now')
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    if job["expires_at"] and job["expires_at"] < now:
+        return None
+    if not os.path.exists(job["file_path"]):
+        return None
+    return job["file_path"]
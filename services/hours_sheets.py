@@ -0,0 +1,265 @@
+# services/hours_sheets.py
+"""
+Weekly hours / signature sheets (A5, one page per employee).
+
+Single sheets are drawn in-process. Bulk runs (a department or the
+whole company) compute the week once with cached_period_payroll()
+and render:
+
+    zip     one PDF per employee, rendered across a process pool
+            (contiguous employee chunks, reassembled in order)
+    pdf     one merged PDF, one page per employee; ReportLab embeds
+            the logo once for the whole document
+
+The logo is read once per process (keyed on its mtime).
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import sqlite3
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from reportlab.lib.pagesizes import A5
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from db import get_conn
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+LOGO_PATH = "/opt/attendance/static/company_logo.png"
+# 0 = one worker per CPU
+SHEET_WORKERS = int(os.getenv("ATT_PDF_WORKERS", "0")) or (os.cpu_count() or 1)
+# Below this many sheets the pool start-up costs more than it saves
+PARALLEL_MIN = int(os.getenv("ATT_PDF_PARALLEL_MIN", "100"))
+# Sheets per worker task
+CHUNK_SIZE = 50
+
+FORMATS = ("zip", "pdf")
+
+# (employee_id, name, EmpRec or None)
+Sheet = Tuple[str, str, object]
+
+
+@lru_cache(maxsize=4)
+def _logo_reader(path: str, mtime: float) -> ImageReader:
+    return ImageReader(path)
+
+
+def logo():
+    """Cached company logo (None when there is none)."""
+    try:
+        mtime = os.path.getmtime(LOGO_PATH)
+    except OSError:
+        return None
+    return _logo_reader(LOGO_PATH, mtime)
+
+
+# --------------------------------------------------
+# Drawing
+# --------------------------------------------------
+def draw_sheet(c, T: dict, emp_name: str, report, week_start: date, week_end: date,
+               week_dates: Sequence[date], logo_img=None):
+    """Draw one sheet as the current page of canvas c and end the page."""
+    WEEKDAYS = [
+        T.get("monday", "Monday"),
+        T.get("tuesday", "Tuesday"),
+        T.get("wednesday", "Wednesday"),
+        T.get("thursday", "Thursday"),
+        T.get("friday", "Friday"),
+        T.get("saturday", "Saturday"),
+        T.get("sunday", "Sunday"),
+    ]
+
+    width, height = A5
+    y = height - 15 * mm
+
+    if logo_img is not None:
+        c.drawImage(logo_img, 15 * mm, y - 10 * mm, width=30 * mm, preserveAspectRatio=True)
+    y -= 15 * mm
+
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(15 * mm, y, T.get("weekly_hours_report", "Weekly Hours Report"))
+    y -= 6 * mm
+
+    c.setFont("Helvetica", 9)
+    c.drawString(15 * mm, y, f"{T.get('employee','Employee')}: {emp_name}")
+    y -= 5 * mm
+    c.drawString(15 * mm, y, f"{T.get('period','Period')}: {week_start} Ã¢ÂÂ {week_end}")
+    y -= 8 * mm
+
+    c.setFont("Helvetica-Bold", 8)
+    c.drawString(15 * mm, y, T.get("day", "Day"))
+    c.drawString(45 * mm, y, T.get("first_in", "In"))
+    c.drawString(65 * mm, y, T.get("last_out", "Out"))
+    c.drawString(85 * mm, y, T.get("hours", "Hours"))
+    c.drawString(105 * mm, y, T.get("overtime", "OT"))
+    y -= 4 * mm
+
+    c.setFont("Helvetica", 8)
+    for d in week_dates:
+        rec = report.days.get(d.isoformat()) if report else None
+        label = f"{WEEKDAYS[d.weekday()]} {d.strftime('%d/%m')}"
+        c.drawString(15 * mm, y, label)
+        c.drawString(45 * mm, y, rec["in"] if rec else "")
+        c.drawString(65 * mm, y, rec["out"] if rec else "")
+        c.drawRightString(100 * mm, y, rec["hours"] if rec else "00:00")
+        c.drawRightString(120 * mm, y, rec["ot"] if rec else "00:00")
+        y -= 4 * mm
+
+    y -= 6 * mm
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(15 * mm, y, f"{T.get('regular_hours','Regular')}: {report.total_regular if report else 0}")
+    y -= 4 * mm
+    c.drawString(15 * mm, y, f"{T.get('overtime_hours','Overtime')}: {report.total_ot if report else 0}")
+    y -= 4 * mm
+    c.drawString(15 * mm, y, f"{T.get('total_hours','Total')}: {report.total_all if report else 0}")
+
+    y -= 10 * mm
+    c.setFont("Helvetica", 8)
+    c.drawString(15 * mm, y, T.get("employee_signature", "Employee signature"))
+    c.line(15 * mm, y - 2 * mm, 80 * mm, y - 2 * mm)
+    c.drawString(90 * mm, y, T.get("date", "Date"))
+    c.line(90 * mm, y - 2 * mm, 120 * mm, y - 2 * mm)
+
+    c.showPage()
+
+
+def render_sheet(target, T: dict, emp_name: str, report, week_start: date,
+                 week_end: date, week_dates: Sequence[date]):
+    """Write a single-sheet PDF to target (path or binary file)."""
+    c = canvas.Canvas(target, pagesize=A5)
+    draw_sheet(c, T, emp_name, report, week_start, week_end, week_dates, logo())
+    c.save()
+
+
+def sheet_filename(employee_id: str, week_start: date) -> str:
+    return f"weekly_hours_{employee_id}_{week_start}.pdf"
+
+
+def _render_chunk(job) -> List[Tuple[str, bytes]]:
+    """Worker: one PDF per sheet of the chunk -> [(filename, bytes)]."""
+    T, week_start, week_end, week_dates, sheets = job
+    logo_img = logo()
+    out = []
+    for employee_id, name, report in sheets:
+        buf = io.BytesIO()
+        c = canvas.Canvas(buf, pagesize=A5)
+        draw_sheet(c, T, name, report, week_start, week_end, week_dates, logo_img)
+        c.save()
+        out.append((sheet_filename(employee_id, week_start), buf.getvalue()))
+    return out
+
+
+# --------------------------------------------------
+# Bulk
+# --------------------------------------------------
+def list_sheet_employees(department_id: Optional[int] = None) -> List[Tuple[str, str]]:
+    """Active employees (of one department), in payroll order."""
+    from services.payroll import _emp_sort_key
+
+    sql = """
+        SELECT employee_id, name FROM users
+        WHERE COALESCE(is_active, 1) = 1
+          AND employee_id IS NOT NULL AND TRIM(employee_id) <> ''
+    """
+    params: list = []
+    if department_id is not None:
+        sql += " AND department_id = ?"
+        params.append(department_id)
+
+    conn = get_conn()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        # No departments schema: nobody belongs to a department
+        if department_id is not None:
+            return []
+        raise
+    finally:
+        conn.close()
+
+    seen: Dict[str, str] = {}
+    for r in rows:
+        emp = str(r["employee_id"]).strip()
+        seen.setdefault(emp, r["name"] or emp)
+    return [(emp, seen[emp]) for emp in sorted(seen, key=_emp_sort_key)]
+
+
+def collect_sheets(week_start: date, week_end: date, week_dates: Sequence[date],
+                   department_id: Optional[int] = None) -> List[Sheet]:
+    """One payroll pass for the week, matched to the selected employees."""
+    from services.payroll import cached_period_payroll
+
+    employees = list_sheet_employees(department_id)
+    if not employees:
+        return []
+
+    by_emp = {
+        e.employee_id: e
+        for e in cached_period_payroll(week_start, week_end, list(week_dates))
+    }
+
+    sheets = []
+    for employee_id, name in employees:
+        report = by_emp.get(employee_id)
+        sheets.append((employee_id, report.name if report and report.name else name, report))
+    return sheets
+
+
+def write_merged_pdf(target, T: dict, sheets: Sequence[Sheet], week_start: date,
+                     week_end: date, week_dates: Sequence[date],
+                     progress: Optional[Callable] = None):
+    c = canvas.Canvas(target, pagesize=A5)
+    logo_img = logo()
+    for i, (_, name, report) in enumerate(sheets):
+        draw_sheet(c, T, name, report, week_start, week_end, week_dates, logo_img)
+        if progress:
+            progress((i + 1) / len(sheets))
+    c.save()
+
+
+def write_zip(target, T: dict, sheets: Sequence[Sheet], week_start: date,
+              week_end: date, week_dates: Sequence[date],
+              progress: Optional[Callable] = None):
+    """ZIP of one PDF per employee (path or binary file)."""
+    week_dates = list(week_dates)
+    chunks = [sheets[i:i + CHUNK_SIZE] for i in range(0, len(sheets), CHUNK_SIZE)]
+    jobs = [(T, week_start, week_end, week_dates, chunk) for chunk in chunks]
+
+    # PDFs are already compressed
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_STORED) as zf:
+        def add(part):
+            for name, data in part:
+                zf.writestr(name, data)
+
+        done = 0
+        if len(sheets) < PARALLEL_MIN or SHEET_WORKERS < 2:
+            parts = map(_render_chunk, jobs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=min(SHEET_WORKERS, len(jobs)))
+            # map() yields in submission order == employee order
+            parts = pool.map(_render_chunk, jobs)
+        try:
+            for part in parts:
+                add(part)
+                done += len(part)
+                if progress:
+                    progress(done / len(sheets))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+
+def bulk_filename(week_start: date, fmt: str, department_id: Optional[int] = None) -> str:
+    scope = f"dept{department_id}" if department_id is not None else "all"
+    return f"weekly_hours_{scope}_{week_start}.{fmt}"
@@ -0,0 +1,186 @@
+# services/http_cache.py
+"""
+Conditional GET for API and report pages, from data versions.
+
+    @bp.route("/users")
+    @api_key_required
+    @conditional("users")
+    def get_users(): ...
+
+The ETag of a response is a hash of the request (path, query string,
+Accept, and for HTML pages the account / role / language), today's
+date and the versions of the domains the view reads:
+
+    events      event_day_versions over the view's day window (all days
+                when the view has none), one day of margin each side
+    users       table_versions 'user_profiles'
+    devices     table_versions 'devices'
+    schedules   data_versions file domain
+    settings    data_versions file domain (company name / logo)
+
+Those are a few primary-key reads and stat() calls, so a matching
+If-None-Match is answered with 304 before the view runs any report
+SQL. Last-Modified is the latest modification time among the domains.
+Only 200 responses are tagged; clients must revalidate every time
+(Cache-Control: no-cache).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import Response, g, make_response, request, session
+
+from db import get_conn
+from services import data_versions
+
+DOMAINS = ("events", "users", "devices", "schedules", "settings")
+
+# Change when response bodies change shape for the same data
+ETAG_FORMAT = 1
+
+_TABLE_NAMES = {"users": "user_profiles", "devices": "devices"}
+_FILE_DOMAINS = ("schedules", "settings")
+
+_tables_ready = False
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        data_versions.ensure_event_version_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _utc(ts: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc) if ts else None
+
+
+def versions(domains, days: Optional[Tuple[date, date]] = None):
+    """
+    ([version per domain], last modified) for domains; days limits the
+    events domain to a date window.
+    """
+    out = []
+    stamps = []
+
+    sql_domains = [d for d in domains if d not in _FILE_DOMAINS]
+    if sql_domains:
+        conn = _conn()
+        try:
+            for domain in sql_domains:
+                if domain == "events":
+                    if days:
+                        row = conn.execute(
+                            """
+                            SELECT COALESCE(SUM(version), 0), MAX(updated_at)
+                            FROM event_day_versions WHERE day BETWEEN ? AND ?
+                            """,
+                            ((days[0] - timedelta(days=1)).isoformat(),
+                             (days[1] + timedelta(days=1)).isoformat()),
+                        ).fetchone()
+                    else:
+                        row = conn.execute(
+                            "SELECT COALESCE(SUM(version), 0), MAX(updated_at) FROM event_day_versions"
+                        ).fetchone()
+                else:
+                    row = conn.execute(
+                        "SELECT version, updated_at FROM table_versions WHERE name = ?",
+                        (_TABLE_NAMES[domain],),
+                    ).fetchone() or (0, None)
+                out.append(int(row[0]))
+                stamps.append(_utc(row[1]))
+        finally:
+            conn.close()
+
+    for domain in domains:
+        if domain in _FILE_DOMAINS:
+            out.append(data_versions.current(domain))
+            mtime = data_versions.modified(domain)
+            stamps.append(datetime.fromtimestamp(mtime, timezone.utc) if mtime else None)
+
+    known = [s for s in stamps if s is not None]
+    return out, (max(known) if known else None)
+
+
+def _etag(domain_versions, days, html: bool) -> str:
+    key = [
+        ETAG_FORMAT,
+        # Defaults such as "this month" move with the date
+        date.today().isoformat(),
+        request.full_path,
+        request.headers.get("Accept", ""),
+        domain_versions,
+        [d.isoformat() for d in days] if days else None,
+    ]
+    if html:
+        key.append([session.get("account_id"), session.get("role"), getattr(g, "lang", None)])
+    return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+
+def conditional(*domains: str, days: Optional[Callable[[], Tuple[date, date]]] = None,
+                html: bool = False):
+    """
+    Decorator: ETag / Last-Modified from the versions of domains, 304 on
+    a matching If-None-Match. days() returns the events window of the
+    request; when it raises ValueError the view runs unconditionally
+    (and reports the bad parameters itself). html=True for pages that
+    depend on the logged-in account and language.
+    """
+    for domain in domains:
+        if domain not in DOMAINS:
+            raise ValueError(f"Unknown data domain: {domain}")
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            # Flashed messages must be rendered, not revalidated away
+            if request.method != "GET" or (html and session.get("_flashes")):
+                return fn(*args, **kwargs)
+            try:
+                window = days() if days else None
+            except ValueError:
+                return fn(*args, **kwargs)
+
+            domain_versions, last_modified = versions(domains, window)
+            etag = _etag(domain_versions, window, html)
+
+            if request.if_none_match.contains_weak(etag):
+                resp = Response(status=304)
+            else:
+                resp = fn(*args, **kwargs)
+                resp = make_response(resp)
+                if resp.status_code != 200:
+                    return resp
+
+            resp.set_etag(etag, weak=True)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            resp.headers["Cache-Control"] = "private, no-cache" if html else "no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+
+# --------------------------------------------------
+# Day windows of common parameters
+# --------------------------------------------------
+def today_window() -> Tuple[date, date]:
+    today = date.today()
+    return today, today
+
+
+def arg_day_window(name: str = "date") -> Callable[[], Tuple[date, date]]:
+    """Window of one ?name=YYYY-MM-DD day (today when absent)."""
+    def window():
+        value = request.args.get(name)
+        day = datetime.fromisoformat(value).date() if value else date.today()
+        return day, day
+    return window
@@ -0,0 +1,476 @@
+# services/live_events.py
+"""
+Live attendance updates for open dashboard / daily pages (Server-Sent
+Events, /live/stream).
+
+The ingest path (collector.store_events) calls notify_events() with
+the rows it actually inserted. In the process that listens on
+ATT_LIVE_ADDR they are dispatched directly; every other process
+(fetch_all_devices.py from cron, tools, further server processes)
+sends them there as small UDP datagrams, after serving its own open
+pages if it has any. Nothing polls the database: open pages cost one idle
+thread each, and an ingest batch is handled once for all of them.
+
+A batch updates:
+
+    punches     each new row goes to the daily pages whose filter
+                (local day / user / device) it matches
+    counters    today's dashboard counters (present, absent, late,
+                early leave, missed) are adjusted per punch and
+                pushed to dashboard pages
+
+Counters are seeded from the events table by the first dashboard
+subscriber of the day, together with the events high-water id, so a
+row that was already counted is skipped when its notification comes.
+A subscriber that finds the seed outdated (events, users or schedules
+written by something that does not notify) reseeds it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+from datetime import date, timedelta, timezone
+from typing import Dict, List, Optional
+
+from services import data_versions
+from services.timestamps import parse_iso
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+# Where the web server listens for notifications from other processes
+LIVE_ADDR = os.getenv("ATT_LIVE_ADDR", "127.0.0.1:5099")
+# Open streams per server process (each holds a request thread)
+MAX_CLIENTS = int(os.getenv("ATT_LIVE_MAX_CLIENTS", "100"))
+KEEPALIVE_SECONDS = int(os.getenv("ATT_LIVE_KEEPALIVE", "20"))
+# Browser reconnect delay
+RETRY_MS = 5000
+# Pending messages per stream before it is told to reload
+QUEUE_SIZE = 500
+# Rows per datagram (well below the UDP payload limit)
+DATAGRAM_ROWS = 100
+
+VIEWS = ("dashboard", "daily")
+
+_lock = threading.Lock()
+_subscribers: set = set()
+# _listening: this process owns LIVE_ADDR (set only after a bind)
+_listener_started = False
+_listening = False
+_counters: Optional["DayCounters"] = None
+# Punches dispatched while counters are being reseeded (None otherwise)
+_pending: Optional[List[dict]] = None
+_seed_lock = threading.Lock()
+_device_names: Dict[str, str] = {}
+
+
+def _addr():
+    host, _, port = LIVE_ADDR.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _local_day(ts: str) -> Optional[str]:
+    """Day of a punch as the daily view filters it: date(datetime(ts, 'localtime'))."""
+    dt = parse_iso(ts)
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        # SQLite reads naive values as UTC
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone().date().isoformat()
+
+
+def _device_name(device_id) -> Optional[str]:
+    if device_id is None:
+        return None
+    key = str(device_id)
+    if key not in _device_names:
+        from db import list_devices
+        _device_names.clear()
+        _device_names.update({str(d["id"]): d["name"] for d in list_devices()})
+    return _device_names.get(key)
+
+
+# --------------------------------------------------
+# Subscribers
+# --------------------------------------------------
+class Subscriber:
+    """One open page: a bounded queue of (event, data) and its filter."""
+
+    def __init__(self, view: str, day: str, user: Optional[str] = None,
+                 device: Optional[str] = None):
+        self.view = view
+        self.day = day
+        self.user = user
+        self.device = device
+        self.queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, punch: dict) -> bool:
+        if self.view != "daily" or punch["local_day"] != self.day:
+            return False
+        if self.user and punch["employee_id"] != self.user:
+            return False
+        if self.device and str(punch["device_id"]) != self.device:
+            return False
+        return True
+
+    def put(self, event: str, data: dict):
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            # Too far behind: the stream ends and the page reloads
+            self.overflowed = True
+
+
+def subscribe(view: str, day: str, user: Optional[str] = None,
+              device: Optional[str] = None) -> Optional[Subscriber]:
+    """Register an open page; None when the server is at MAX_CLIENTS."""
+    start_listener()
+
+    sub = Subscriber(view, day, user, device)
+    with _lock:
+        if len(_subscribers) >= MAX_CLIENTS:
+            return None
+        _subscribers.add(sub)
+
+    if view == "dashboard":
+        counters = _today_counters()
+        if counters is not None and counters.key == day:
+            sub.put("counters", counters.snapshot())
+    return sub
+
+
+def unsubscribe(sub: Subscriber):
+    with _lock:
+        _subscribers.discard(sub)
+
+
+def stream(sub: Subscriber):
+    """SSE body for one subscriber; unsubscribes when the client goes away."""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            if sub.overflowed:
+                yield "event: reload\ndata: {}\n\n"
+                return
+            try:
+                event, data = sub.queue.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                # Also how a closed connection is noticed
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+    finally:
+        unsubscribe(sub)
+
+
+# --------------------------------------------------
+# Today's dashboard counters
+# --------------------------------------------------
+class DayCounters:
+    """
+    Dashboard counters of one day, kept per employee as (punch count,
+    first / last punch) exactly like attendance_day_rollups, so the
+    late / early / missed rules match the dashboard's.
+    """
+
+    def __init__(self, day: date):
+        self.day = day
+        self.key = day.isoformat()
+        self._lock = threading.Lock()
+        self.per_emp: Dict[str, list] = {}
+        self.bounds: Dict[str, Optional[tuple]] = {}
+        self.expected = 0
+        self.attended = 0
+        self.late = 0
+        self.early = 0
+        self.missed = 0
+        self.high_water = 0
+        self.versions = None
+        self._load()
+
+    def _window(self):
+        return (self.day - timedelta(days=1)).isoformat(), (self.day + timedelta(days=1)).isoformat()
+
+    def _versions(self, conn) -> tuple:
+        return (
+            data_versions.events_version(conn, *self._window()),
+            data_versions.table_version(conn, "users"),
+            data_versions.current("schedules"),
+        )
+
+    def _load(self):
+        from services.dashboard_stats import BUILD_SQL, _conn
+
+        conn = _conn()
+        try:
+            # One read transaction: aggregates and high-water id agree
+            conn.execute("BEGIN")
+            rows = conn.execute(
+                BUILD_SQL,
+                (
+                    (self.day - timedelta(days=1)).isoformat(),
+                    (self.day + timedelta(days=2)).isoformat(),
+                    self.key,
+                    self.key,
+                ),
+            ).fetchall()
+            self.high_water = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            self.expected = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            self.versions = self._versions(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.per_emp = {
+            str(r["employee_id"]): [r["event_count"], r["first_event"], r["last_event"]]
+            for r in rows
+        }
+        self._load_bounds(list(self.per_emp))
+        self.attended = len(self.per_emp)
+        for eid in self.per_emp:
+            self._count(eid, 1)
+
+    def _load_bounds(self, employee_ids: List[str]):
+        from services.dashboard_stats import schedule_bounds
+
+        if not employee_ids:
+            return
+        start_m, end_m, has_sched = schedule_bounds(employee_ids, [self.day])
+        for i, eid in enumerate(employee_ids):
+            self.bounds[eid] = (float(start_m[i, 0]), float(end_m[i, 0])) if has_sched[i, 0] else None
+
+    def is_current(self) -> bool:
+        from services.dashboard_stats import _conn
+
+        conn = _conn()
+        try:
+            return self._versions(conn) == self.versions
+        finally:
+            conn.close()
+
+    def _count(self, eid: str, sign: int):
+        """Add (sign=1) or remove (sign=-1) one employee's flags."""
+        from services.dashboard_stats import punch_clock
+
+        bounds = self.bounds.get(eid)
+        if bounds is None:
+            return
+        count, first_event, last_event = self.per_emp[eid]
+        first = punch_clock(first_event)
+        last = punch_clock(last_event)
+        if first is None or last is None:
+            return
+        start, end = bounds
+        self.late += sign * (start >= 0 and first > start)
+        self.early += sign * (end >= 0 and last < end)
+        self.missed += sign * (count == 1)
+
+    def apply(self, rows: List[dict]) -> bool:
+        """Count new punches of this day. Returns whether anything changed."""
+        from services.dashboard_stats import _conn, event_day
+
+        with self._lock:
+            fresh = [
+                r for r in rows
+                if (r.get("id") or 0) > self.high_water
+                and r.get("employee_id") is not None
+                and event_day(r["timestamp"]) == self.key
+            ]
+            if not fresh:
+                return False
+
+            self._load_bounds([
+                eid for eid in dict.fromkeys(str(r["employee_id"]) for r in fresh)
+                if eid not in self.per_emp
+            ])
+            for r in fresh:
+                eid = str(r["employee_id"])
+                ts = r["timestamp"]
+                rec = self.per_emp.get(eid)
+                if rec is None:
+                    self.per_emp[eid] = [1, ts, ts]
+                    self.attended += 1
+                else:
+                    self._count(eid, -1)
+                    rec[0] += 1
+                    rec[1] = min(rec[1], ts)
+                    rec[2] = max(rec[2], ts)
+                self._count(eid, 1)
+            self.high_water = max(self.high_water, max(r["id"] for r in fresh))
+
+            # Our own writes moved the versions; keep them in step
+            conn = _conn()
+            try:
+                self.versions = self._versions(conn)
+            finally:
+                conn.close()
+            return True
+
+    def snapshot(self) -> dict:
+        expected = self.expected
+        return {
+            "date": self.key,
+            "expected": expected,
+            "attended": self.attended,
+            "present": self.attended,
+            "absent": max(expected - self.attended, 0),
+            "late": int(self.late),
+            "early_leave": int(self.early),
+            "missed": int(self.missed),
+            "attendance_rate": round((self.attended / expected) * 100, 1) if expected else 0,
+        }
+
+
+def _today_counters() -> Optional[DayCounters]:
+    """
+    Today's counters, (re)seeded when missing, outdated or from yesterday.
+    Seeding reads the database outside _lock, so dispatch is never
+    blocked by it; punches dispatched meanwhile are replayed onto the
+    new counters before they replace the old ones.
+    """
+    global _counters, _pending
+    today = date.today()
+
+    def usable(counters):
+        return counters is not None and counters.day == today and counters.is_current()
+
+    try:
+        if usable(_counters):
+            return _counters
+        with _seed_lock:
+            if usable(_counters):
+                return _counters
+            with _lock:
+                _pending = []
+            try:
+                fresh = DayCounters(today)
+                while True:
+                    with _lock:
+                        rows = _pending
+                        if not rows:
+                            _counters = fresh
+                            _pending = None
+                            return fresh
+                        _pending = []
+                    fresh.apply(rows)
+            finally:
+                with _lock:
+                    _pending = None
+    except sqlite3.Error as e:
+        print(f"[live] could not load dashboard counters: {e}")
+        return None
+
+
+# --------------------------------------------------
+# Dispatch
+# --------------------------------------------------
+def _dispatch(rows: List[dict]):
+    punches = [
+        {
+            "id": r.get("id"),
+            "employee_id": str(r["employee_id"]),
+            "name": r.get("name"),
+            "timestamp": r["timestamp"],
+            "direction": r.get("direction"),
+            "device_id": r.get("device_id"),
+            "device_name": _device_name(r.get("device_id")),
+            "local_day": _local_day(r["timestamp"]),
+        }
+        for r in rows
+        if r.get("employee_id") is not None and r.get("timestamp")
+    ]
+    if not punches:
+        return
+
+    with _lock:
+        subs = list(_subscribers)
+        counters = _counters
+        if _pending is not None:
+            _pending.extend(punches)
+
+    for sub in subs:
+        for p in punches:
+            if sub.wants(p):
+                sub.put("punch", p)
+
+    # Only kept up to date while someone has looked at today's dashboard
+    if counters is not None and counters.day == date.today() and counters.apply(punches):
+        snap = counters.snapshot()
+        for sub in subs:
+            if sub.view == "dashboard" and sub.day == counters.key:
+                sub.put("counters", snap)
+
+
+def notify_events(rows: List[dict]):
+    """
+    Called by the ingest path AFTER its commit, with the inserted rows
+    (id, device_id, employee_id, name, timestamp[, direction]). Never
+    raises: live updates must not fail an ingest.
+    """
+    if not rows:
+        return
+    try:
+        if _listening:
+            _dispatch(rows)
+        else:
+            # Pages open on this process, and the process that listens
+            if _subscribers:
+                _dispatch(rows)
+            _send(rows)
+    except Exception as e:
+        print(f"[live] notify failed: {e}")
+
+
+def _send(rows: List[dict]):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        addr = _addr()
+        for i in range(0, len(rows), DATAGRAM_ROWS):
+            payload = json.dumps(rows[i:i + DATAGRAM_ROWS], separators=(",", ":"), default=str)
+            sock.sendto(payload.encode("utf-8"), addr)
+    except OSError:
+        # No server listening: nobody to tell
+        pass
+    finally:
+        sock.close()
+
+
+# --------------------------------------------------
+# Listener (web server process)
+# --------------------------------------------------
+def _listen(sock: socket.socket):
+    while True:
+        try:
+            data, _ = sock.recvfrom(65535)
+            rows = json.loads(data)
+            if isinstance(rows, list):
+                _dispatch([r for r in rows if isinstance(r, dict)])
+        except Exception as e:
+            print(f"[live] bad notification: {e}")
+
+
+def start_listener():
+    """Receive other processes' notifications (once per process)."""
+    global _listener_started, _listening
+    with _lock:
+        if _listener_started:
+            return
+        _listener_started = True
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(_addr())
+    except OSError as e:
+        # Another process listens: keep forwarding our punches to it
+        print(f"[live] cannot listen on {LIVE_ADDR}: {e}")
+        sock.close()
+        return
+    _listening = True
+    threading.Thread(target=_listen, args=(sock,), name="live-events", daemon=True).start()
@@ -0,0 +1,270 @@
+# services/overtime.py
+"""
+Overtime policy engine (overtime_policies, users.overtime_policy_id,
+holidays).
+
+compute_payroll() splits each day at the scheduled length. Employees
+with an active overtime policy are re-split by the policy instead,
+for the whole period at once, as array operations over an
+employees x days matrix of worked seconds:
+
+  holiday  hours worked on a holiday          (holiday_multiplier)
+  weekend  hours worked on weekend days       (weekend_multiplier)
+  daily    other hours above daily_threshold  (daily_multiplier)
+  weekly   straight hours above weekly_threshold within each
+           7-day block of the period          (weekly_multiplier)
+  regular  the rest
+
+A NULL threshold disables that rule. The weekend is the policy's
+weekend_days ('5,6' = Sat, Sun; Monday = 0, like schedule_rules), or
+ATT_OVERTIME_WEEKEND_DAYS when it is NULL; Monday-Saturday workers
+get a policy with '6', '' means no weekend. Holidays match on date,
+or on month-day when recurring; applies_to_departments limits a holiday to
+those department ids. Approval settings (requires_approval,
+auto_approve_under_hours) belong to overtime requests and are not
+applied here.
+
+Employees without a policy keep the schedule-based split.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import date
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from db import get_conn
+
+ENABLED = os.getenv("ATT_OVERTIME_POLICIES", "1") != "0"
+
+# Weekend of policies without weekend_days (Sat, Sun by default)
+WEEKEND_DAYS = os.getenv("ATT_OVERTIME_WEEKEND_DAYS", "5,6")
+
+_columns_ready = False
+
+
+def _rows(conn, sql, params=()):
+    """Rows of an optional table ([] without the enhancements schema)."""
+    try:
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def ensure_overtime_columns(cur):
+    """Add weekend_days to overtime_policies tables created before it."""
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(overtime_policies)").fetchall()}
+    if cols and "weekend_days" not in cols:
+        cur.execute("ALTER TABLE overtime_policies ADD COLUMN weekend_days TEXT")
+
+
+def load_policies(employee_ids: Sequence[str]):
+    """
+    (policy per employee, holiday rows, department per employee) for
+    the employees of employee_ids that have an active policy.
+    """
+    global _columns_ready
+    conn = get_conn()
+    try:
+        if not _columns_ready:
+            ensure_overtime_columns(conn.cursor())
+            conn.commit()
+            _columns_ready = True
+
+        policies = {
+            int(r["id"]): dict(r)
+            for r in _rows(conn, """
+                SELECT id, name, daily_threshold_hours, weekly_threshold_hours,
+                       daily_multiplier, weekly_multiplier,
+                       weekend_multiplier, holiday_multiplier, weekend_days
+                FROM overtime_policies
+                WHERE COALESCE(is_active, 1) = 1
+            """)
+        }
+        if not policies:
+            return {}, [], {}
+
+        wanted = set(employee_ids)
+        user_policy = {}
+        user_dept = {}
+        for r in _rows(conn, """
+            SELECT employee_id, overtime_policy_id, department_id
+            FROM users
+            WHERE overtime_policy_id IS NOT NULL
+        """):
+            emp = str(r["employee_id"] or "").strip()
+            if emp in wanted and r["overtime_policy_id"] in policies:
+                user_policy[emp] = policies[r["overtime_policy_id"]]
+                user_dept[emp] = r["department_id"]
+
+        holidays = _rows(conn, "SELECT date, recurring, applies_to_departments FROM holidays")
+        return user_policy, holidays, user_dept
+    finally:
+        conn.close()
+
+
+def holiday_mask(holidays, dates: List[date], depts: List) -> np.ndarray:
+    """employees x days boolean matrix of holidays (depts: department per employee)."""
+    iso = np.array([d.isoformat() for d in dates])
+    md = np.array([d.isoformat()[5:] for d in dates])
+    dept_arr = np.array([str(d) if d is not None else "" for d in depts])
+
+    mask = np.zeros((len(depts), len(dates)), dtype=bool)
+    for h in holidays:
+        day = str(h["date"] or "")[:10]
+        if not day:
+            continue
+        hit = (md == day[5:]) if h["recurring"] else (iso == day)
+        if not hit.any():
+            continue
+        scope = [s.strip() for s in str(h["applies_to_departments"] or "").split(",") if s.strip()]
+        rows = np.isin(dept_arr, scope) if scope else np.ones(len(depts), dtype=bool)
+        mask |= rows[:, None] & hit[None, :]
+    return mask
+
+
+def _weekdays(value) -> List[int]:
+    """'5,6' -> [5, 6]; unknown entries are ignored."""
+    out = []
+    for part in str(value).split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) < 7:
+            out.append(int(part))
+    return out
+
+
+def _weekend_mask(policies: List[dict], dates: List[date]) -> np.ndarray:
+    """employees x days boolean matrix of the policies' weekend days."""
+    per_weekday = np.zeros((len(policies), 7), dtype=bool)
+    for i, p in enumerate(policies):
+        days = p.get("weekend_days")
+        per_weekday[i, _weekdays(WEEKEND_DAYS if days is None else days)] = True
+    return per_weekday[:, [d.weekday() for d in dates]]
+
+
+def _col(policies: List[dict], key: str, default: float) -> np.ndarray:
+    return np.array(
+        [default if p[key] is None else float(p[key]) for p in policies],
+        dtype=float,
+    )[:, None]
+
+
+# --------------------------------------------------
+# Engine
+# --------------------------------------------------
+def split_hours(
+    worked_sec: np.ndarray,
+    dates: List[date],
+    policies: List[dict],
+    holiday: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Policy split of an employees x days matrix of worked seconds.
+    Returns employees x days hour matrices (regular, daily, weekly,
+    weekend, holiday, overtime) and the weighted paid hours.
+    """
+    hours = worked_sec / 3600.0
+    n_emp, n_days = hours.shape
+
+    weekend = _weekend_mask(policies, dates) & ~holiday
+    holiday_h = np.where(holiday, hours, 0.0)
+    weekend_h = np.where(weekend, hours, 0.0)
+    normal = hours - holiday_h - weekend_h
+
+    daily_thr = _col(policies, "daily_threshold_hours", np.inf)
+    daily_ot = np.clip(normal - daily_thr, 0.0, None)
+    straight = normal - daily_ot
+
+    # Weekly threshold per 7-day block: cumulative straight hours
+    # within the block, overtime = growth of the part above threshold
+    weekly_thr = _col(policies, "weekly_threshold_hours", np.inf)[:, :, None]
+    blocks = -(-n_days // 7)
+    padded = np.zeros((n_emp, blocks * 7))
+    padded[:, :n_days] = straight
+    cum = padded.reshape(n_emp, blocks, 7).cumsum(axis=2)
+    over = np.clip(cum - weekly_thr, 0.0, None)
+    weekly_ot = np.diff(over, axis=2, prepend=0.0).reshape(n_emp, blocks * 7)[:, :n_days]
+
+    regular = straight - weekly_ot
+    overtime = daily_ot + weekly_ot + weekend_h + holiday_h
+    paid = (
+        regular
+        + daily_ot * _col(policies, "daily_multiplier", 1.0)
+        + weekly_ot * _col(policies, "weekly_multiplier", 1.0)
+        + weekend_h * _col(policies, "weekend_multiplier", 1.0)
+        + holiday_h * _col(policies, "holiday_multiplier", 1.0)
+    )
+
+    return {
+        "regular": regular,
+        "daily": daily_ot,
+        "weekly": weekly_ot,
+        "weekend": weekend_h,
+        "holiday": holiday_h,
+        "overtime": overtime,
+        "paid": paid,
+    }
+
+
+def apply_policies(results: List, week_dates: List[date]) -> List:
+    """
+    Re-split compute_payroll() results (EmpRec list, modified in place)
+    for employees with an overtime policy. Returns results.
+    """
+    if not ENABLED or not results or not week_dates:
+        return results
+
+    from routes.payroll import dec_hours_to_hhmm
+
+    user_policy, holidays, user_dept = load_policies([e.employee_id for e in results])
+    emps = [e for e in results if e.employee_id in user_policy]
+    if not emps:
+        return results
+
+    keys = [d.isoformat() for d in week_dates]
+    worked = np.array(
+        [[(e.days.get(k) or {}).get("worked_sec", 0) for k in keys] for e in emps],
+        dtype=float,
+    )
+    policies = [user_policy[e.employee_id] for e in emps]
+    holiday = holiday_mask(holidays, week_dates, [user_dept.get(e.employee_id) for e in emps])
+
+    split = split_hours(worked, week_dates, policies, holiday)
+
+    totals = {name: np.round(m.sum(axis=1), 2).tolist() for name, m in split.items()}
+    regular_dec = np.round(split["regular"], 2).tolist()
+    ot_dec = np.round(split["overtime"], 2).tolist()
+
+    # Write back (the arithmetic above is done; this only fills dicts)
+    for i, emp in enumerate(emps):
+        emp.total_regular = totals["regular"][i]
+        emp.total_ot = totals["overtime"][i]
+        emp.total_all = round(float(split["regular"][i].sum() + split["overtime"][i].sum()), 2)
+        emp.ot_daily = totals["daily"][i]
+        emp.ot_weekly = totals["weekly"][i]
+        emp.ot_weekend = totals["weekend"][i]
+        emp.ot_holiday = totals["holiday"][i]
+        emp.paid_hours = totals["paid"][i]
+        emp.overtime_policy = policies[i]["name"]
+
+        for j, k in enumerate(keys):
+            day = emp.days.get(k)
+            if not day or not day.get("worked_sec"):
+                continue
+            flags = [f for f in day["flags"] if f != "overtime"]
+            if ot_dec[i][j] > 0:
+                flags.append("overtime")
+            if holiday[i, j]:
+                flags.append("holiday")
+            day.update({
+                "hours": dec_hours_to_hhmm(split["regular"][i, j]),
+                "ot": dec_hours_to_hhmm(split["overtime"][i, j]),
+                "hours_dec": regular_dec[i][j],
+                "ot_dec": ot_dec[i][j],
+                "flags": flags,
+            })
+
+    return results
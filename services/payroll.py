@@ -0,0 +1,250 @@
+# services/payroll.py
+"""
+Payroll orchestration: event loading + serial / sharded execution.
+
+compute_payroll() (routes/payroll.py) is per-employee independent, so
+large periods are split into contiguous employee shards and computed
+across a process pool. Each worker loads its own slice of events;
+shards are merged back in shard order, which is the serial order.
+Periods of ROLLUP_MIN_DAYS or more are built from day rollups, whose
+large rebuilds use the same pool (services/payroll_rollups.py).
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from db import get_conn
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+# Parallel mode switches on above this many employee-days
+PARALLEL_THRESHOLD = int(os.getenv("ATT_PAYROLL_PARALLEL_THRESHOLD", "20000"))
+# 0 = one worker per CPU
+PAYROLL_WORKERS = int(os.getenv("ATT_PAYROLL_WORKERS", "0")) or (os.cpu_count() or 1)
+# Shards per worker (smaller shards balance uneven punch counts)
+SHARDS_PER_WORKER = 2
+# Keep IN (...) lists well under SQLite's variable limit
+IN_BATCH = 500
+# Periods longer than this are assembled from per-day rollups
+# (services/payroll_rollups.py) instead of scanning raw events
+ROLLUP_MIN_DAYS = int(os.getenv("ATT_PAYROLL_ROLLUP_MIN_DAYS", "8"))
+
+EVENTS_SQL = """
+    SELECT e.employee_id, u.name, e.timestamp
+    FROM events e
+    JOIN users u ON u.employee_id = e.employee_id
+    WHERE datetime(substr(e.timestamp,1,19))
+          BETWEEN datetime(?) AND datetime(?)
+"""
+
+# Deterministic row order: the serial and sharded paths must see
+# each employee's events in exactly the same sequence.
+EVENTS_ORDER = " ORDER BY e.employee_id, e.timestamp, e.id, u.id"
+
+
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+def _emp_sort_key(eid: str):
+    return int(eid) if eid.isdigit() else eid
+
+
+def query_window(week_start: date, week_end: date) -> Tuple[str, str]:
+    """
+    Event query bounds: one day of buffer on each side
+    (overnight shifts, offset timestamps).
+    """
+    q_start = datetime.combine(week_start - timedelta(days=1), time.min)
+    q_end = datetime.combine(week_end + timedelta(days=1), time.max)
+    return (
+        q_start.strftime("%Y-%m-%d %H:%M:%S"),
+        q_end.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def fetch_payroll_rows(
+    conn,
+    week_start: date,
+    week_end: date,
+    user: Optional[str] = None,
+    employee_ids: Optional[Sequence[str]] = None,
+):
+    q_start, q_end = query_window(week_start, week_end)
+
+    if employee_ids is None:
+        sql = EVENTS_SQL
+        params: list = [q_start, q_end]
+        if user:
+            sql += " AND e.employee_id = ?"
+            params.append(user)
+        return conn.execute(sql + EVENTS_ORDER, params).fetchall()
+
+    rows = []
+    for batch in _batches(employee_ids):
+        sql = (
+            EVENTS_SQL
+            + f" AND e.employee_id IN ({','.join('?' * len(batch))})"
+            + EVENTS_ORDER
+        )
+        rows.extend(conn.execute(sql, [q_start, q_end, *batch]).fetchall())
+    return rows
+
+
+def _batches(employee_ids: Sequence) -> List[List[str]]:
+    """
+    Split employee ids into IN (...) batches. Entries may be groups of
+    raw ids; a group is never split, so its rows keep the serial order.
+    """
+    out: List[List[str]] = []
+    cur: List[str] = []
+    for entry in employee_ids:
+        group = [entry] if isinstance(entry, str) else list(entry)
+        if cur and len(cur) + len(group) > IN_BATCH:
+            out.append(cur)
+            cur = []
+        cur.extend(group)
+    if cur:
+        out.append(cur)
+    return out
+
+
+def list_payroll_employees(conn, week_start: date, week_end: date) -> List[List[str]]:
+    """
+    Employees with at least one event in the query window, in payroll
+    output order. Each entry holds the raw employee_id values that
+    compute_payroll() folds into one employee (it strips whitespace).
+    """
+    q_start, q_end = query_window(week_start, week_end)
+    rows = conn.execute(
+        """
+        SELECT DISTINCT e.employee_id
+        FROM events e
+        JOIN users u ON u.employee_id = e.employee_id
+        WHERE datetime(substr(e.timestamp,1,19))
+              BETWEEN datetime(?) AND datetime(?)
+        """,
+        (q_start, q_end),
+    ).fetchall()
+
+    grouped = {}
+    for r in rows:
+        key = str(r[0] or "").strip()
+        if key:
+            grouped.setdefault(key, []).append(r[0])
+
+    return [grouped[k] for k in sorted(grouped, key=_emp_sort_key)]
+
+
+def _shards(items: list, n: int) -> list:
+    n = max(1, min(n, len(items)))
+    size, extra = divmod(len(items), n)
+    out = []
+    pos = 0
+    for i in range(n):
+        step = size + (1 if i < extra else 0)
+        out.append(items[pos:pos + step])
+        pos += step
+    return out
+
+
+# --------------------------------------------------
+# Worker (runs in a child process)
+# --------------------------------------------------
+def _compute_shard(args):
+    from routes.payroll import compute_payroll
+
+    week_start, week_end, week_dates, employee_ids = args
+
+    conn = get_conn()
+    try:
+        rows = fetch_payroll_rows(conn, week_start, week_end, employee_ids=employee_ids)
+    finally:
+        conn.close()
+
+    return compute_payroll(rows, week_dates)
+
+
+# --------------------------------------------------
+# Entry point
+# --------------------------------------------------
+def compute_period_payroll(
+    week_start: date,
+    week_end: date,
+    week_dates: List[date],
+    user: Optional[str] = None,
+    parallel: Optional[bool] = None,
+):
+    """
+    Compute payroll for a period.
+
+    parallel=None decides automatically (employee-days above
+    PARALLEL_THRESHOLD and more than one worker); True/False forces
+    a mode. Both modes return identical results.
+    """
+    from routes.payroll import compute_payroll
+
+    conn = get_conn()
+    try:
+        if user or parallel is False or PAYROLL_WORKERS < 2:
+            rows = fetch_payroll_rows(conn, week_start, week_end, user=user)
+            return compute_payroll(rows, week_dates)
+
+        employee_ids = list_payroll_employees(conn, week_start, week_end)
+
+        if parallel is None:
+            parallel = len(employee_ids) * len(week_dates) > PARALLEL_THRESHOLD
+
+        if not parallel or len(employee_ids) < 2:
+            rows = fetch_payroll_rows(conn, week_start, week_end)
+            return compute_payroll(rows, week_dates)
+    finally:
+        conn.close()
+
+    shards = _shards(employee_ids, PAYROLL_WORKERS * SHARDS_PER_WORKER)
+    jobs = [(week_start, week_end, week_dates, shard) for shard in shards]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=min(PAYROLL_WORKERS, len(jobs))) as pool:
+        # map() yields in submission order == serial employee order
+        for part in pool.map(_compute_shard, jobs):
+            results.extend(part)
+    return results
+
+
+def cached_period_payroll(
+    week_start: date,
+    week_end: date,
+    week_dates: List[date],
+    user: Optional[str] = None,
+    live: bool = False,
+):
+    """
+    compute_period_payroll() through the persistent result cache
+    (services.payroll_cache): unchanged periods are not recomputed.
+    Long periods are built from per-day rollups. Overtime policies
+    are applied to the (fresh) cached objects on every call.
+
+    Closed periods are read from their snapshot
+    (services.payroll_snapshots) unless live=True.
+    """
+    from services import overtime, payroll_cache, payroll_rollups, payroll_snapshots
+
+    if not live:
+        frozen = payroll_snapshots.snapshot_payroll(week_start, week_end, user=user)
+        if frozen is not None:
+            return frozen
+
+    if len(week_dates) >= ROLLUP_MIN_DAYS:
+        def compute():
+            return payroll_rollups.period_payroll(week_start, week_end, user=user)
+    else:
+        def compute():
+            return compute_period_payroll(week_start, week_end, week_dates, user=user)
+
+    results = payroll_cache.get_or_compute("period", week_start, week_end, user, compute)
+    return overtime.apply_policies(results, week_dates)
@@ -0,0 +1,199 @@
+# services/payroll_cache.py
+"""
+Persistent payroll result cache.
+
+compute_payroll() output is stored in SQLite (shared by gunicorn
+workers, survives restarts), one row per
+
+    (scope, week_start, week_end, user filter)
+
+where week_end stands for the week type (it is derived from it).
+Each row records the versions it was computed at:
+
+    events    SUM of event_day_versions over the query window
+              (period +/- 1 day, see services.payroll.query_window)
+    users     table_versions['users'] (names come from users)
+    schedules the schedule-cache data version
+    config    CACHE_FORMAT + configured schedule sources
+
+A row is served only while all of them still match, so an ingest
+only invalidates the periods whose window contains the new events;
+a schedule edit invalidates everything computed before it.
+
+Versions are read BEFORE computing: a write racing with the compute
+moves them on and the next read recomputes.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from dataclasses import asdict
+from datetime import date, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from db import get_conn
+from services import data_versions
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+ENABLED = os.getenv("ATT_PAYROLL_CACHE", "1") != "0"
+# Rows older than this are dropped (recomputed on next view)
+MAX_AGE_DAYS = int(os.getenv("ATT_PAYROLL_CACHE_DAYS", "60"))
+
+# Bump when compute_payroll() output changes shape or rules
+CACHE_FORMAT = 2
+
+_tables_ready = False
+
+
+def ensure_payroll_cache_tables(cur):
+    data_versions.ensure_event_version_tables(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_cache (
+            scope            TEXT NOT NULL,
+            week_start       TEXT NOT NULL,
+            week_end         TEXT NOT NULL,
+            user_filter      TEXT NOT NULL,
+            events_version   INTEGER NOT NULL,
+            users_version    INTEGER NOT NULL,
+            schedule_version INTEGER NOT NULL,
+            config           TEXT NOT NULL,
+            payload          TEXT NOT NULL,
+            created_at       TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (scope, week_start, week_end, user_filter)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payroll_cache_created
+        ON payroll_cache(created_at)
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_payroll_cache_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+# --------------------------------------------------
+# Keys / versions
+# --------------------------------------------------
+def _config() -> str:
+    from services.schedule_engine import configured_sources
+    return f"{CACHE_FORMAT}:{','.join(configured_sources())}"
+
+
+def _versions(conn, week_start: date, week_end: date) -> Tuple[int, int, int]:
+    return (
+        data_versions.events_version(
+            conn,
+            (week_start - timedelta(days=1)).isoformat(),
+            (week_end + timedelta(days=1)).isoformat(),
+        ),
+        data_versions.table_version(conn, "users"),
+        data_versions.current("schedules"),
+    )
+
+
+def period_versions(week_start: date, week_end: date) -> Tuple:
+    """(events, users, schedules, config) a period's results depend on."""
+    conn = _conn()
+    try:
+        return (*_versions(conn, week_start, week_end), _config())
+    finally:
+        conn.close()
+
+
+def _dump(results) -> str:
+    return json.dumps([asdict(emp) for emp in results], separators=(",", ":"))
+
+
+def _load(payload: str):
+    from routes.payroll import EmpRec
+    return [EmpRec(**d) for d in json.loads(payload)]
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+def get_or_compute(
+    scope: str,
+    week_start: date,
+    week_end: date,
+    user: Optional[str],
+    compute: Callable[[], List],
+) -> List:
+    """
+    Cached compute() result for a period. scope names the row source
+    (callers computing from different queries must not share rows).
+    Always returns fresh EmpRec objects: callers may mutate them.
+    """
+    if not ENABLED:
+        return compute()
+
+    key = (scope, week_start.isoformat(), week_end.isoformat(), user or "")
+    config = _config()
+
+    try:
+        conn = _conn()
+    except sqlite3.Error as e:
+        print(f"[payroll_cache] disabled for this request: {e}")
+        return compute()
+
+    try:
+        versions = _versions(conn, week_start, week_end)
+        row = conn.execute(
+            """
+            SELECT events_version, users_version, schedule_version, config, payload
+            FROM payroll_cache
+            WHERE scope = ? AND week_start = ? AND week_end = ? AND user_filter = ?
+            """,
+            key,
+        ).fetchone()
+        if row and tuple(row[:3]) == versions and row[3] == config:
+            return _load(row[4])
+
+        results = compute()
+
+        try:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO payroll_cache (
+                    scope, week_start, week_end, user_filter,
+                    events_version, users_version, schedule_version,
+                    config, payload
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (*key, *versions, config, _dump(results)),
+            )
+            conn.execute(
+                "DELETE FROM payroll_cache WHERE created_at < datetime('now', ?)",
+                (f"-{MAX_AGE_DAYS} days",),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            # Cache write failures never fail the page (e.g. database locked)
+            conn.rollback()
+            print(f"[payroll_cache] store failed: {e}")
+
+        return results
+    finally:
+        conn.close()
+
+
+def clear():
+    """Drop every cached result (e.g. after changing payroll rules)."""
+    conn = _conn()
+    try:
+        conn.execute("DELETE FROM payroll_cache")
+        conn.commit()
+    finally:
+        conn.close()
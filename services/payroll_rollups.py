@@ -0,0 +1,334 @@
+# services/payroll_rollups.py
+"""
+Per-day payroll rollups for long pay periods.
+
+compute_payroll() is independent per employee-day: a day's result
+only depends on that day's punches and schedule. Long periods
+(bi-weekly, semi-monthly, monthly, custom) are therefore assembled
+from stored day results instead of re-scanning a month of events:
+
+    payroll_day_rollups   (day, employee_id) -> day dict + unrounded hours
+    payroll_rollup_days   day -> versions the day was built at
+
+A day is rebuilt only when its versions moved: events dated
+day-1..day+1 (offset timestamps can land on a neighbouring local
+date), users, schedules or the cache config. Runs of stale days
+above the payroll PARALLEL_THRESHOLD are computed across the process
+pool, sharded by employee as in services/payroll.py. Period totals are the
+sum of the unrounded hours in date order, exactly like
+compute_payroll().
+
+Rows exist for every employee with events dated within one day of
+the row's day, so a period lists the same employees as the weekly
+event query (period +/- 1 day); other days are blank days.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from db import get_conn
+from services import data_versions
+from services.payroll import (
+    PARALLEL_THRESHOLD,
+    PAYROLL_WORKERS,
+    SHARDS_PER_WORKER,
+    _emp_sort_key,
+    _shards,
+    fetch_payroll_rows,
+    list_payroll_employees,
+)
+
+_tables_ready = False
+
+
+def ensure_payroll_rollup_tables(cur):
+    data_versions.ensure_event_version_tables(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_day_rollups (
+            day           TEXT NOT NULL,
+            employee_id   TEXT NOT NULL,
+            name          TEXT,
+            regular_hours REAL NOT NULL,
+            ot_hours      REAL NOT NULL,
+            day_json      TEXT NOT NULL,
+            PRIMARY KEY (day, employee_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payroll_day_rollups_emp
+        ON payroll_day_rollups(employee_id, day)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_rollup_days (
+            day              TEXT PRIMARY KEY,
+            events_version   INTEGER NOT NULL,
+            users_version    INTEGER NOT NULL,
+            schedule_version INTEGER NOT NULL,
+            config           TEXT NOT NULL,
+            built_at         TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_payroll_rollup_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+# --------------------------------------------------
+# Versions / staleness
+# --------------------------------------------------
+def _day_versions(conn, start: date, end: date) -> Dict[str, Tuple]:
+    """day -> (events, users, schedules, config) it must be built at."""
+    from services.payroll_cache import _config
+
+    per_day = dict(conn.execute(
+        "SELECT day, version FROM event_day_versions WHERE day BETWEEN ? AND ?",
+        ((start - timedelta(days=1)).isoformat(), (end + timedelta(days=1)).isoformat()),
+    ).fetchall())
+    users_v = data_versions.table_version(conn, "users")
+    sched_v = data_versions.current("schedules")
+    config = _config()
+
+    out = {}
+    for d in _days(start, end):
+        events_v = sum(
+            per_day.get((d + timedelta(days=k)).isoformat(), 0) for k in (-1, 0, 1)
+        )
+        out[d.isoformat()] = (events_v, users_v, sched_v, config)
+    return out
+
+
+def _stale_runs(conn, wanted: Dict[str, Tuple]) -> List[Tuple[date, date]]:
+    """Contiguous [start, end] runs of days whose rollup is missing or stale."""
+    days = sorted(wanted)
+    have = {
+        r[0]: tuple(r[1:])
+        for r in conn.execute(
+            """
+            SELECT day, events_version, users_version, schedule_version, config
+            FROM payroll_rollup_days
+            WHERE day BETWEEN ? AND ?
+            """,
+            (days[0], days[-1]),
+        )
+    }
+
+    runs: List[Tuple[date, date]] = []
+    for ds in days:
+        if have.get(ds) == wanted[ds]:
+            continue
+        d = date.fromisoformat(ds)
+        if runs and runs[-1][1] == d - timedelta(days=1):
+            runs[-1] = (runs[-1][0], d)
+        else:
+            runs.append((d, d))
+    return runs
+
+
+# --------------------------------------------------
+# Build
+# --------------------------------------------------
+def _day_rows(conn, start: date, end: date, employee_ids=None) -> list:
+    """
+    payroll_day_rollups rows for [start, end]; employee_ids limits them
+    to a shard (entries as from list_payroll_employees()).
+    """
+    from routes.payroll import payroll_day
+    from services.schedule_engine import configured_sources, resolve_schedules
+    from services.timestamps import parse_local
+
+    days = _days(start, end)
+    rows = fetch_payroll_rows(conn, start, end, employee_ids=employee_ids)
+
+    # Same normalization as compute_payroll()
+    events: Dict[str, Dict[date, List[dict]]] = {}
+    near: Dict[str, set] = {}
+    names: Dict[str, str] = {}
+    for r in rows:
+        emp_id = str(r["employee_id"] or "").strip()
+        ts = parse_local(r["timestamp"])
+        if not emp_id or not ts:
+            continue
+        events.setdefault(emp_id, {}).setdefault(ts.date(), []).append({
+            "employee_id": emp_id,
+            "event_time": ts,
+            "name": r["name"] or "",
+        })
+        if r["name"] and emp_id not in names:
+            names[emp_id] = r["name"]
+        try:
+            raw_day = date.fromisoformat(str(r["timestamp"])[:10])
+        except ValueError:
+            raw_day = ts.date()
+        near.setdefault(emp_id, set()).update(
+            raw_day + timedelta(days=k) for k in (-1, 0, 1)
+        )
+
+    schedules = resolve_schedules(events.keys(), days, configured_sources())
+
+    out = []
+    for emp_id, daymap in events.items():
+        for d in days:
+            if d not in near[emp_id]:
+                continue
+            day, rhrs, ohrs = payroll_day(daymap.get(d, []), schedules.get(emp_id, d))
+            out.append((
+                d.isoformat(), emp_id, names.get(emp_id, ""),
+                rhrs, ohrs, json.dumps(day, separators=(",", ":")),
+            ))
+    return out
+
+
+def _shard_rows(args):
+    """Worker (child process): _day_rows() for one employee shard."""
+    start, end, employee_ids = args
+    conn = get_conn()
+    try:
+        return _day_rows(conn, start, end, employee_ids)
+    finally:
+        conn.close()
+
+
+def _build(conn, start: date, end: date, wanted: Dict[str, Tuple]):
+    days = _days(start, end)
+
+    # Large runs (a first monthly build, a schedule change) are computed
+    # across the payroll process pool, sharded by employee like
+    # compute_period_payroll(); rows are written here in one transaction.
+    employee_ids = []
+    if PAYROLL_WORKERS >= 2:
+        employee_ids = list_payroll_employees(conn, start, end)
+    if len(employee_ids) >= 2 and len(employee_ids) * len(days) > PARALLEL_THRESHOLD:
+        shards = _shards(employee_ids, PAYROLL_WORKERS * SHARDS_PER_WORKER)
+        out = []
+        with ProcessPoolExecutor(max_workers=min(PAYROLL_WORKERS, len(shards))) as pool:
+            for part in pool.map(_shard_rows, [(start, end, shard) for shard in shards]):
+                out.extend(part)
+    else:
+        out = _day_rows(conn, start, end)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "DELETE FROM payroll_day_rollups WHERE day BETWEEN ? AND ?",
+            (start.isoformat(), end.isoformat()),
+        )
+        conn.executemany(
+            """
+            INSERT INTO payroll_day_rollups
+                (day, employee_id, name, regular_hours, ot_hours, day_json)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            out,
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO payroll_rollup_days
+                (day, events_version, users_version, schedule_version, config)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(d.isoformat(), *wanted[d.isoformat()]) for d in days],
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def refresh(start: date, end: date) -> int:
+    """Rebuild stale days in [start, end]. Returns the number of days rebuilt."""
+    if start > end:
+        return 0
+
+    conn = _conn()
+    try:
+        wanted = _day_versions(conn, start, end)
+        rebuilt = 0
+        for run_start, run_end in _stale_runs(conn, wanted):
+            _build(conn, run_start, run_end, wanted)
+            rebuilt += (run_end - run_start).days + 1
+        return rebuilt
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Period assembly
+# --------------------------------------------------
+def period_payroll(start: date, end: date, user: Optional[str] = None):
+    """
+    compute_payroll() result for [start, end] assembled from day
+    rollups (stale days are rebuilt first).
+    """
+    from routes.payroll import EmpRec, payroll_day
+    from services.schedule_engine import configured_sources, resolve_schedules
+
+    refresh(start, end)
+
+    sql = """
+        SELECT day, employee_id, name, regular_hours, ot_hours, day_json
+        FROM payroll_day_rollups
+        WHERE day BETWEEN ? AND ?
+    """
+    params: list = [start.isoformat(), end.isoformat()]
+    if user:
+        sql += " AND employee_id = ?"
+        params.append(str(user).strip())
+
+    conn = _conn()
+    try:
+        rows = conn.execute(sql + " ORDER BY day", params).fetchall()
+    finally:
+        conn.close()
+
+    by_emp: Dict[str, Dict[str, sqlite3.Row]] = {}
+    for r in rows:
+        by_emp.setdefault(r["employee_id"], {})[r["day"]] = r
+
+    days = _days(start, end)
+    schedules = None
+    results = []
+
+    for emp_id in sorted(by_emp, key=_emp_sort_key):
+        stored = by_emp[emp_id]
+        name = next((r["name"] for r in stored.values() if r["name"]), emp_id)
+        emp = EmpRec(employee_id=emp_id, name=name)
+
+        reg_total = 0.0
+        ot_total = 0.0
+        for d in days:
+            ds = d.isoformat()
+            r = stored.get(ds)
+            if r is not None:
+                day, rhrs, ohrs = json.loads(r["day_json"]), r["regular_hours"], r["ot_hours"]
+            else:
+                # No punches nearby: blank day, depends on the schedule only
+                if schedules is None:
+                    schedules = resolve_schedules(by_emp.keys(), days, configured_sources())
+                day, rhrs, ohrs = payroll_day([], schedules.get(emp_id, d))
+
+            reg_total += rhrs
+            ot_total += ohrs
+            emp.days[ds] = day
+
+        emp.total_regular = round(reg_total, 2)
+        emp.total_ot = round(ot_total, 2)
+        emp.total_all = round(reg_total + ot_total, 2)
+        results.append(emp)
+
+    return results
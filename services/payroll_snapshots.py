@@ -0,0 +1,408 @@
+# services/payroll_snapshots.py
+"""
+Closed-period payroll snapshots.
+
+Closing a period freezes its computed payroll (after overtime
+policies) into
+
+    payroll_periods            one row per closed (week_start, week_end),
+                               with the data versions at close time
+    payroll_snapshot_employees totals per employee
+    payroll_snapshot_days      per-day values and flags per employee
+
+From then on cached_period_payroll() serves the period from the
+snapshot (one indexed read, no event scan), so late events, schedule
+or policy edits no longer change a closed period's numbers. Whether
+they would is answered by reconcile(): the live recomputation diffed
+against the snapshot. has_drift() is the cheap check (data versions
+moved since close) used to decide whether a reconcile is worthwhile.
+
+Snapshots are company-wide; a user filter is applied on read.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import date
+from typing import Dict, List, Optional
+
+from db import get_conn
+
+DAY_FIELDS = ("in", "out", "hours", "ot", "flags")
+
+_tables_ready = False
+
+
+def ensure_payroll_snapshot_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_periods (
+            id               INTEGER PRIMARY KEY AUTOINCREMENT,
+            week_start       TEXT NOT NULL,
+            week_end         TEXT NOT NULL,
+            events_version   INTEGER NOT NULL,
+            users_version    INTEGER NOT NULL,
+            schedule_version INTEGER NOT NULL,
+            employees        INTEGER NOT NULL DEFAULT 0,
+            total_regular    REAL NOT NULL DEFAULT 0,
+            total_ot         REAL NOT NULL DEFAULT 0,
+            total_all        REAL NOT NULL DEFAULT 0,
+            closed_by        TEXT,
+            closed_at        TEXT NOT NULL DEFAULT (datetime('now')),
+            note             TEXT,
+            UNIQUE (week_start, week_end)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_snapshot_employees (
+            period_id       INTEGER NOT NULL,
+            employee_id     TEXT NOT NULL,
+            seq             INTEGER NOT NULL,
+            name            TEXT,
+            total_regular   REAL NOT NULL,
+            total_ot        REAL NOT NULL,
+            total_all       REAL NOT NULL,
+            overtime_policy TEXT,
+            ot_daily        REAL NOT NULL DEFAULT 0,
+            ot_weekly       REAL NOT NULL DEFAULT 0,
+            ot_weekend      REAL NOT NULL DEFAULT 0,
+            ot_holiday      REAL NOT NULL DEFAULT 0,
+            paid_hours      REAL,
+            PRIMARY KEY (period_id, employee_id),
+            FOREIGN KEY (period_id) REFERENCES payroll_periods(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_snapshot_days (
+            period_id   INTEGER NOT NULL,
+            employee_id TEXT NOT NULL,
+            day         TEXT NOT NULL,
+            in_time     TEXT NOT NULL,
+            out_time    TEXT NOT NULL,
+            hours       TEXT NOT NULL,
+            ot          TEXT NOT NULL,
+            hours_dec   REAL NOT NULL,
+            ot_dec      REAL NOT NULL,
+            worked_sec  INTEGER NOT NULL,
+            flags       TEXT NOT NULL,
+            PRIMARY KEY (period_id, employee_id, day),
+            FOREIGN KEY (period_id) REFERENCES payroll_periods(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_payroll_snapshot_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+# --------------------------------------------------
+# Periods
+# --------------------------------------------------
+def get_period(week_start: date, week_end: date) -> Optional[dict]:
+    """The closed period row, or None when the period is open."""
+    conn = _conn()
+    try:
+        row = conn.execute(
+            "SELECT * FROM payroll_periods WHERE week_start = ? AND week_end = ?",
+            (week_start.isoformat(), week_end.isoformat()),
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def list_periods(limit: int = 50) -> List[dict]:
+    conn = _conn()
+    try:
+        return [
+            dict(r)
+            for r in conn.execute(
+                "SELECT * FROM payroll_periods ORDER BY week_start DESC, week_end DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        ]
+    finally:
+        conn.close()
+
+
+def close_period(
+    week_start: date,
+    week_end: date,
+    week_dates: List[date],
+    closed_by: Optional[str] = None,
+    note: Optional[str] = None,
+) -> dict:
+    """
+    Freeze the period's current payroll. Raises ValueError when it
+    is already closed.
+    """
+    from services.payroll import cached_period_payroll
+    from services.payroll_cache import _versions
+
+    if get_period(week_start, week_end):
+        raise ValueError(f"Period {week_start} to {week_end} is already closed")
+
+    # Versions first: a write racing with the compute shows up as drift
+    conn = _conn()
+    try:
+        versions = _versions(conn, week_start, week_end)
+    finally:
+        conn.close()
+
+    results = cached_period_payroll(week_start, week_end, week_dates, live=True)
+
+    emp_rows = []
+    day_rows = []
+    for seq, emp in enumerate(results):
+        emp_rows.append((
+            emp.employee_id, seq, emp.name,
+            emp.total_regular, emp.total_ot, emp.total_all,
+            emp.overtime_policy, emp.ot_daily, emp.ot_weekly,
+            emp.ot_weekend, emp.ot_holiday, emp.paid_hours,
+        ))
+        for ds, rec in emp.days.items():
+            day_rows.append((
+                emp.employee_id, ds,
+                rec["in"], rec["out"], rec["hours"], rec["ot"],
+                rec["hours_dec"], rec["ot_dec"], rec.get("worked_sec", 0),
+                ",".join(rec["flags"]),
+            ))
+
+    conn = _conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """
+                INSERT INTO payroll_periods (
+                    week_start, week_end,
+                    events_version, users_version, schedule_version,
+                    employees, total_regular, total_ot, total_all,
+                    closed_by, note
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    week_start.isoformat(), week_end.isoformat(), *versions,
+                    len(results),
+                    round(sum(e.total_regular for e in results), 2),
+                    round(sum(e.total_ot for e in results), 2),
+                    round(sum(e.total_all for e in results), 2),
+                    closed_by, note,
+                ),
+            )
+            period_id = cur.lastrowid
+            conn.executemany(
+                """
+                INSERT INTO payroll_snapshot_employees (
+                    period_id, employee_id, seq, name,
+                    total_regular, total_ot, total_all,
+                    overtime_policy, ot_daily, ot_weekly, ot_weekend, ot_holiday,
+                    paid_hours
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(period_id, *r) for r in emp_rows],
+            )
+            conn.executemany(
+                """
+                INSERT INTO payroll_snapshot_days (
+                    period_id, employee_id, day,
+                    in_time, out_time, hours, ot,
+                    hours_dec, ot_dec, worked_sec, flags
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(period_id, *r) for r in day_rows],
+            )
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            raise ValueError(f"Period {week_start} to {week_end} is already closed") from e
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+    return get_period(week_start, week_end)
+
+
+def reopen_period(week_start: date, week_end: date) -> bool:
+    """Drop a period's snapshot (live computation again). False if it was open."""
+    period = get_period(week_start, week_end)
+    if not period:
+        return False
+
+    conn = _conn()
+    try:
+        conn.execute("DELETE FROM payroll_snapshot_days WHERE period_id = ?", (period["id"],))
+        conn.execute("DELETE FROM payroll_snapshot_employees WHERE period_id = ?", (period["id"],))
+        conn.execute("DELETE FROM payroll_periods WHERE id = ?", (period["id"],))
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+# --------------------------------------------------
+# Reads
+# --------------------------------------------------
+def snapshot_payroll(week_start: date, week_end: date, user: Optional[str] = None):
+    """
+    The frozen EmpRec list of a closed period (payroll order), or
+    None when the period is open.
+    """
+    from routes.payroll import EmpRec
+
+    conn = _conn()
+    try:
+        period = conn.execute(
+            "SELECT id FROM payroll_periods WHERE week_start = ? AND week_end = ?",
+            (week_start.isoformat(), week_end.isoformat()),
+        ).fetchone()
+        if period is None:
+            return None
+
+        emp_sql = "SELECT * FROM payroll_snapshot_employees WHERE period_id = ?"
+        day_sql = "SELECT * FROM payroll_snapshot_days WHERE period_id = ?"
+        params: list = [period["id"]]
+        if user:
+            emp_sql += " AND employee_id = ?"
+            day_sql += " AND employee_id = ?"
+            params.append(str(user).strip())
+
+        emps = conn.execute(emp_sql + " ORDER BY seq", params).fetchall()
+        days = conn.execute(day_sql + " ORDER BY employee_id, day", params).fetchall()
+    finally:
+        conn.close()
+
+    by_emp: Dict[str, Dict[str, dict]] = {}
+    for r in days:
+        by_emp.setdefault(r["employee_id"], {})[r["day"]] = {
+            "in": r["in_time"],
+            "out": r["out_time"],
+            "hours": r["hours"],
+            "ot": r["ot"],
+            "hours_dec": r["hours_dec"],
+            "ot_dec": r["ot_dec"],
+            "flags": r["flags"].split(",") if r["flags"] else [],
+            "worked_sec": r["worked_sec"],
+        }
+
+    return [
+        EmpRec(
+            employee_id=r["employee_id"],
+            name=r["name"],
+            days=by_emp.get(r["employee_id"], {}),
+            total_regular=r["total_regular"],
+            total_ot=r["total_ot"],
+            total_all=r["total_all"],
+            overtime_policy=r["overtime_policy"],
+            ot_daily=r["ot_daily"],
+            ot_weekly=r["ot_weekly"],
+            ot_weekend=r["ot_weekend"],
+            ot_holiday=r["ot_holiday"],
+            paid_hours=r["paid_hours"],
+        )
+        for r in emps
+    ]
+
+
+def has_drift(period: dict) -> bool:
+    """Did events / users / schedules of the period change since close?"""
+    from services.payroll_cache import _versions
+
+    conn = _conn()
+    try:
+        versions = _versions(
+            conn,
+            date.fromisoformat(period["week_start"]),
+            date.fromisoformat(period["week_end"]),
+        )
+    finally:
+        conn.close()
+    return versions != (
+        period["events_version"], period["users_version"], period["schedule_version"]
+    )
+
+
+# --------------------------------------------------
+# Reconciliation
+# --------------------------------------------------
+def _totals(emp) -> dict:
+    return {
+        "total_regular": emp.total_regular,
+        "total_ot": emp.total_ot,
+        "total_all": emp.total_all,
+    }
+
+
+def _day(rec: Optional[dict]) -> Optional[dict]:
+    return {k: rec[k] for k in DAY_FIELDS} if rec else None
+
+
+def reconcile(week_start: date, week_end: date, week_dates: List[date]) -> Optional[dict]:
+    """
+    Live recomputation vs the snapshot of a closed period (None when
+    open). Lists employees added / removed since close and, for the
+    others, changed totals and days.
+    """
+    from services.payroll import cached_period_payroll
+
+    period = get_period(week_start, week_end)
+    if not period:
+        return None
+
+    frozen = {e.employee_id: e for e in snapshot_payroll(week_start, week_end)}
+    live = {
+        e.employee_id: e
+        for e in cached_period_payroll(week_start, week_end, week_dates, live=True)
+    }
+
+    changed = []
+    for emp_id, old in frozen.items():
+        new = live.get(emp_id)
+        if new is None:
+            continue
+        days = []
+        for d in week_dates:
+            ds = d.isoformat()
+            a, b = _day(old.days.get(ds)), _day(new.days.get(ds))
+            if a != b:
+                days.append({"date": ds, "snapshot": a, "live": b})
+        if days or _totals(old) != _totals(new):
+            changed.append({
+                "employee_id": emp_id,
+                "name": old.name,
+                "snapshot": _totals(old),
+                "live": _totals(new),
+                "days": days,
+            })
+
+    added = [
+        {"employee_id": e.employee_id, "name": e.name, "live": _totals(e)}
+        for emp_id, e in live.items() if emp_id not in frozen
+    ]
+    removed = [
+        {"employee_id": e.employee_id, "name": e.name, "snapshot": _totals(e)}
+        for emp_id, e in frozen.items() if emp_id not in live
+    ]
+
+    def _sum(emps, key):
+        return round(sum(getattr(e, key) for e in emps), 2)
+
+    return {
+        "period": period,
+        "in_sync": not (changed or added or removed),
+        "snapshot_totals": {k: period[k] for k in ("total_regular", "total_ot", "total_all")},
+        "live_totals": {k: _sum(live.values(), k) for k in ("total_regular", "total_ot", "total_all")},
+        "changed": changed,
+        "added": added,
+        "removed": removed,
+    }
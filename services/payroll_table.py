@@ -0,0 +1,255 @@
+# services/payroll_table.py
+"""
+Payroll table rows for the JSON API (/payroll/api/rows).
+
+Rows come from cached_period_payroll() (persistent result cache), are
+filtered (user, department, flag, text search), sorted, and paged with
+a keyset cursor:
+
+    cursor = opaque token of the last row's (sort value, employee id)
+
+A page is the rows strictly after the cursor in the requested order,
+so pages stay stable while the period's results change underneath
+(no skipped / repeated rows from shifting offsets).
+
+The filtered, sorted rows of a first page are kept in memory (last
+MEMO_SIZE queries per process) while the period's data versions are
+unchanged, so scrolling does not reload and re-sort the whole period
+for every page.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db import get_conn
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+SORT_FIELDS = ("name", "employee_id", "total_regular", "total_ot", "total_all")
+
+# Sorted pages kept per process (query -> rows)
+MEMO_SIZE = 8
+
+_memo: "OrderedDict[tuple, tuple]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+# --------------------------------------------------
+# Lookups
+# --------------------------------------------------
+def user_attrs() -> Dict[str, Tuple[int, Optional[int]]]:
+    """employee_id -> (is_active, department_id); schema tolerant."""
+    conn = get_conn()
+    try:
+        try:
+            rows = conn.execute(
+                "SELECT employee_id, is_active, department_id FROM users"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # No departments schema
+            rows = conn.execute(
+                "SELECT employee_id, is_active, NULL AS department_id FROM users"
+            ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        str(r["employee_id"]): (int(r["is_active"] if r["is_active"] is not None else 1), r["department_id"])
+        for r in rows
+        if r["employee_id"] is not None
+    }
+
+
+def list_departments() -> List[Tuple[int, str]]:
+    """Active departments as (id, name); [] without the departments table."""
+    conn = get_conn()
+    try:
+        return [
+            (r["id"], r["name"])
+            for r in conn.execute(
+                "SELECT id, name FROM departments WHERE COALESCE(is_active, 1) = 1 ORDER BY name"
+            ).fetchall()
+        ]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Keys / cursor
+# --------------------------------------------------
+def _emp_key(eid: str) -> list:
+    # Numeric ids first, in numeric order (same order as the payroll);
+    # the raw id keeps "012" and "12" apart
+    return [0, int(eid), eid] if eid.isdigit() else [1, 0, eid]
+
+
+def _sort_key(emp, sort: str) -> list:
+    if sort == "name":
+        primary = (emp.name or "").casefold()
+    elif sort == "employee_id":
+        primary = 0
+    else:
+        primary = float(getattr(emp, sort) or 0)
+    return [primary, _emp_key(emp.employee_id)]
+
+
+def encode_cursor(key: list) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    """Raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not (isinstance(key, list) and len(key) == 2 and isinstance(key[1], list)):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+# --------------------------------------------------
+# Rows
+# --------------------------------------------------
+def _row(emp, week_dates: Sequence[date], attrs) -> dict:
+    is_active, department_id = attrs.get(emp.employee_id, (1, None))
+    days = []
+    for d in week_dates:
+        rec = emp.days.get(d.isoformat())
+        days.append(
+            {
+                "in": rec["in"],
+                "out": rec["out"],
+                "hours": rec["hours"],
+                "ot": rec["ot"],
+                "flags": rec["flags"],
+            }
+            if rec else None
+        )
+    return {
+        "employee_id": emp.employee_id,
+        "name": emp.name,
+        "is_active": is_active,
+        "department_id": department_id,
+        "days": days,
+        "total_regular": emp.total_regular,
+        "total_ot": emp.total_ot,
+        "total_all": emp.total_all,
+        "overtime_policy": emp.overtime_policy,
+        "paid_hours": emp.paid_hours,
+    }
+
+
+def _has_flag(emp, flag: str) -> bool:
+    return any(flag in (rec.get("flags") or ()) for rec in emp.days.values())
+
+
+def _sorted_rows(week_start, week_end, week_dates, user, department_id, flag, q, sort):
+    """(sorted [(key, emp)], flags in the period, user attrs) of a query."""
+    from services.payroll import cached_period_payroll
+
+    results = cached_period_payroll(week_start, week_end, week_dates, user=user or None)
+    attrs = user_attrs()
+
+    # Flags present in the period (before the flag filter), for the picker
+    flags = sorted({
+        f for emp in results for rec in emp.days.values() for f in (rec.get("flags") or ())
+    })
+
+    if department_id is not None:
+        results = [e for e in results if attrs.get(e.employee_id, (1, None))[1] == department_id]
+    if flag:
+        results = [e for e in results if _has_flag(e, flag)]
+    if q:
+        needle = q.strip().casefold()
+        results = [
+            e for e in results
+            if needle in (e.name or "").casefold() or needle in e.employee_id.casefold()
+        ]
+
+    keyed = sorted(((_sort_key(e, sort), e) for e in results), key=lambda t: t[0])
+    return keyed, flags, attrs
+
+
+def payroll_page_rows(
+    week_start: date,
+    week_end: date,
+    week_dates: List[date],
+    user: Optional[str] = None,
+    department_id: Optional[int] = None,
+    flag: Optional[str] = None,
+    q: Optional[str] = None,
+    sort: str = "employee_id",
+    desc: bool = False,
+    limit: int = PAGE_SIZE,
+    after: Optional[str] = None,
+) -> dict:
+    """
+    One keyset page of the payroll table. Raises ValueError on a bad
+    sort field or cursor.
+    """
+    from services import payroll_cache
+
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    cursor = decode_cursor(after) if after else None
+
+    key = (
+        week_start, week_end, user or "", department_id, flag or "", (q or "").strip().casefold(),
+        sort, payroll_cache.period_versions(week_start, week_end),
+    )
+    with _memo_lock:
+        hit = _memo.get(key) if cursor else None
+    if hit is None:
+        keyed, flags, attrs = _sorted_rows(
+            week_start, week_end, week_dates, user, department_id, flag, q, sort
+        )
+        hit = (keyed, [k for k, _ in keyed], flags, attrs)
+        with _memo_lock:
+            _memo[key] = hit
+            _memo.move_to_end(key)
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+    keyed, keys, flags, attrs = hit
+
+    try:
+        if not desc:
+            start = bisect_right(keys, cursor) if cursor else 0
+            page = keyed[start:start + limit]
+            more = start + limit < len(keyed)
+        else:
+            end = bisect_left(keys, cursor) if cursor else len(keyed)
+            page = keyed[max(0, end - limit):end][::-1]
+            more = end - limit > 0
+    except TypeError as e:
+        # Cursor from another sort field
+        raise ValueError("Invalid cursor") from e
+
+    rows = [_row(e, week_dates, attrs) for _, e in page]
+
+    return {
+        "week_start": week_start.isoformat(),
+        "week_end": week_end.isoformat(),
+        "dates": [d.isoformat() for d in week_dates],
+        "total": len(keyed),
+        "flags": flags,
+        "sort": sort,
+        "order": "desc" if desc else "asc",
+        "limit": limit,
+        "rows": rows,
+        "next": encode_cursor(page[-1][0]) if page and more else None,
+    }
@@ -1,11 +1,18 @@
 from datetime import timedelta
 from dateutil import parser as dtparser
-from openpyxl import Workbook
 from flask import g
+from openpyxl.utils import get_column_letter
 from db import get_conn
+from services.timestamps import parse_iso
+from services.xlsx_export import XlsxStream
 
 
 def export_fifo_excel(output_path, start_date, end_date, week_dates=None):
+    """Write the FIFO workbook to a path or binary file object."""
+    build_fifo_export(start_date, end_date, week_dates).save(output_path)
+
+
+def build_fifo_export(start_date, end_date, week_dates=None) -> XlsxStream:
     start_dt = dtparser.parse(start_date).date()
     end_dt = dtparser.parse(end_date).date()
 
@@ -41,41 +48,36 @@ def export_fifo_excel(output_path, start_date, end_date, week_dates=None):
     for r in rows:
         emp = r["employee_id"]
         data.setdefault(emp, {"name": r["name"], "days": {}})
+        # Wall clock as punched (offset values keep their own clock)
+        first_in = parse_iso(r["first_in"])
+        last_out = parse_iso(r["last_out"])
         data[emp]["days"][r["day"]] = {
-            "in": dtparser.parse(r["first_in"]).strftime("%H:%M") if r["first_in"] else "",
-            "out": dtparser.parse(r["last_out"]).strftime("%H:%M") if r["last_out"] else "",
+            "in": first_in.strftime("%H:%M") if first_in else "",
+            "out": last_out.strftime("%H:%M") if last_out else "",
         }
 
     T = getattr(g, "T", {})
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "FIFO Weekly"
-
-    ws.append([T.get("employee_id", "Employee ID"), T.get("name", "Name")])
+    xl = XlsxStream("FIFO Weekly")
 
+    header1 = [T.get("employee_id", "Employee ID"), T.get("name", "Name")]
     col = 3
     for d in week_dates:
-        ws.merge_cells(start_row=1, start_column=col, end_row=1, end_column=col + 1)
-        ws.cell(row=1, column=col, value=d.strftime("%a %d/%m"))
+        xl.merge(f"{get_column_letter(col)}1:{get_column_letter(col + 1)}1")
+        header1.extend([d.strftime("%a %d/%m"), None])
         col += 2
+    xl.append(header1)
 
-    ws.append(["", ""])
-    col = 3
+    header2 = ["", ""]
     for _ in week_dates:
-        ws.cell(row=2, column=col, value=T.get("first_in", "First IN"))
-        ws.cell(row=2, column=col + 1, value=T.get("last_out", "Last OUT"))
-        col += 2
+        header2.extend([T.get("first_in", "First IN"), T.get("last_out", "Last OUT")])
+    xl.append(header2)
 
-    row_idx = 3
     for emp in sorted(data, key=lambda x: int(x) if str(x).isdigit() else x):
-        ws.cell(row=row_idx, column=1, value=emp)
-        ws.cell(row=row_idx, column=2, value=data[emp]["name"])
-        col = 3
+        row = [emp, data[emp]["name"]]
         for d in week_dates:
             rec = data[emp]["days"].get(d.isoformat())
-            ws.cell(row=row_idx, column=col, value=rec["in"] if rec else "")
-            ws.cell(row=row_idx, column=col + 1, value=rec["out"] if rec else "")
-            col += 2
-        row_idx += 1
+            row.append(rec["in"] if rec else "")
+            row.append(rec["out"] if rec else "")
+        xl.append(row)
 
-    wb.save(output_path)
+    return xl
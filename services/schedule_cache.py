@@ -0,0 +1,263 @@
+# services/schedule_cache.py
+"""
+Process-wide, versioned cache of schedule definitions.
+
+Schedule tables (templates, template days, rules, shifts, shift types,
+rotations, assignments, overrides) change rarely but are read on every
+payroll / dashboard / shift lookup. They are loaded once into an
+immutable snapshot tagged with the "schedules" data version.
+
+Writers call bump_schedule_version() after committing. Every read
+checks the version with a single stat() (see services.data_versions),
+so other gunicorn workers and processes reload on their next read.
+Warm reads do no SQL.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from db import get_conn
+from services import data_versions
+
+DOMAIN = "schedules"
+
+_lock = threading.Lock()
+_snapshot: Optional["ScheduleSnapshot"] = None
+
+
+# --------------------------------------------------
+# Snapshot
+# --------------------------------------------------
+class ScheduleSnapshot:
+    """
+    Read-only view of all schedule tables at one data version.
+    Treat every returned structure as immutable.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        # schedule_templates, ordered by name
+        self.templates: List[dict] = []
+        self.templates_by_id: Dict[int, dict] = {}
+        # (employee_id, weekday) -> template-day schedule
+        self.template_days: Dict[Tuple[str, int], dict] = {}
+        # employees with a user_schedule_assignments row
+        self.template_users: set = set()
+        # template_id -> rules ordered by priority, id
+        self.rules_by_template: Dict[int, List[dict]] = {}
+        # rule_id -> shifts ordered by start_time, end_time, id
+        self.shifts_by_rule: Dict[int, List[dict]] = {}
+        # users.schedule_template_id (advanced schedules)
+        self.user_template_ids: Dict[str, int] = {}
+        # shift_types.id -> row
+        self.shift_types: Dict[int, dict] = {}
+        # shift_rotations.id -> parsed pattern
+        self.rotations: Dict[int, dict] = {}
+        # employee_id -> [(start_date, end_date, rotation_id)], newest first
+        self.assignments: Dict[str, List[Tuple[str, Optional[str], int]]] = {}
+        # (employee_id, 'YYYY-MM-DD') -> shift_type_id (None = day off)
+        self.overrides: Dict[Tuple[str, str], Optional[int]] = {}
+        # users.department_id
+        self.user_departments: Dict[str, int] = {}
+        # department_id -> [(effective_date, end_date, schedules row)],
+        # active only, latest effective date first
+        self.department_schedules: Dict[int, List[Tuple[Optional[str], Optional[str], dict]]] = {}
+
+        self._lookup = None
+        # template_id -> CompiledTemplate (advanced_schedules memo; lives
+        # and dies with this version)
+        self.compiled_templates: Dict[int, object] = {}
+
+    def schedule_lookup(self):
+        if self._lookup is None:
+            from services.schedule_templates import ScheduleLookup
+            self._lookup = ScheduleLookup(self.template_days)
+        return self._lookup
+
+
+def _int_or_none(val) -> Optional[int]:
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rows(cur, sql):
+    """Rows of an optional table ([] on a fresh / partial schema)."""
+    try:
+        return cur.execute(sql).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def _load(version: int) -> ScheduleSnapshot:
+    from services.schedule_templates import _SCHEDULE_COLUMNS, _schedule_from_row
+
+    snap = ScheduleSnapshot(version)
+    conn = get_conn()
+    cur = conn.cursor()
+
+    try:
+        # ---- templates
+        for r in _rows(cur, "SELECT id, name, description FROM schedule_templates ORDER BY name"):
+            t = dict(r)
+            snap.templates.append(t)
+            snap.templates_by_id[int(r["id"])] = t
+
+        # ---- template days (per employee)
+        for r in _rows(cur, f"""
+            SELECT {_SCHEDULE_COLUMNS}
+            FROM users u
+            JOIN user_schedule_assignments usa
+                ON usa.user_id = u.id
+            JOIN schedule_template_days td
+                ON td.template_id = usa.template_id
+            ORDER BY usa.rowid, td.rowid
+        """):
+            snap.template_days.setdefault(
+                (str(r["employee_id"]), int(r["weekday"])), _schedule_from_row(r)
+            )
+
+        for r in _rows(cur, """
+            SELECT DISTINCT u.employee_id
+            FROM users u
+            JOIN user_schedule_assignments usa ON usa.user_id = u.id
+        """):
+            snap.template_users.add(str(r["employee_id"]))
+
+        # ---- rules / shifts
+        for r in _rows(cur, """
+            SELECT id, template_id, weekdays, priority
+            FROM schedule_rules
+            ORDER BY priority ASC, id ASC
+        """):
+            snap.rules_by_template.setdefault(int(r["template_id"]), []).append(dict(r))
+
+        for r in _rows(cur, """
+            SELECT id, rule_id, start_time, end_time, grace_minutes, break_minutes
+            FROM schedule_shifts
+            ORDER BY start_time ASC, end_time ASC, id ASC
+        """):
+            snap.shifts_by_rule.setdefault(int(r["rule_id"]), []).append(dict(r))
+
+        for r in _rows(cur, """
+            SELECT employee_id, schedule_template_id
+            FROM users
+            WHERE schedule_template_id IS NOT NULL
+        """):
+            snap.user_template_ids[str(r["employee_id"])] = int(r["schedule_template_id"])
+
+        # ---- shift types / rotations
+        for r in _rows(cur, """
+            SELECT id, name, start_time, end_time, break_minutes, overnight
+            FROM shift_types
+        """):
+            snap.shift_types[int(r["id"])] = {
+                "shift_type_id": r["id"],
+                "name": r["name"],
+                "start_time": r["start_time"],
+                "end_time": r["end_time"],
+                "break_minutes": r["break_minutes"],
+                "overnight": r["overnight"],
+            }
+
+        for r in _rows(cur, "SELECT id, pattern_json FROM shift_rotations"):
+            try:
+                snap.rotations[int(r["id"])] = json.loads(r["pattern_json"])
+            except (TypeError, ValueError):
+                snap.rotations[int(r["id"])] = {}
+
+        # ---- assignments / overrides
+        for r in _rows(cur, """
+            SELECT employee_id, rotation_id, start_date, end_date
+            FROM employee_shift_assignments
+            ORDER BY start_date DESC, id ASC
+        """):
+            snap.assignments.setdefault(r["employee_id"], []).append(
+                (r["start_date"], r["end_date"], r["rotation_id"])
+            )
+
+        for r in _rows(cur, """
+            SELECT employee_id, date, shift_type_id
+            FROM employee_shift_overrides
+            ORDER BY id
+        """):
+            # First row wins, like the old per-day fetchone()
+            snap.overrides.setdefault(
+                (r["employee_id"], r["date"]), _int_or_none(r["shift_type_id"])
+            )
+
+        # ---- departments (enhancements schema, optional)
+        for r in _rows(cur, """
+            SELECT employee_id, department_id
+            FROM users
+            WHERE department_id IS NOT NULL
+        """):
+            snap.user_departments[str(r["employee_id"])] = int(r["department_id"])
+
+        for r in _rows(cur, """
+            SELECT ds.department_id, ds.effective_date, ds.end_date,
+                   s.id, s.name, s.start_time, s.end_time, s.daily_hours,
+                   s.auto_heal, s.allow_overtime,
+                   s.grace_in_minutes, s.grace_out_minutes,
+                   s.is_workday, s.is_off_day
+            FROM department_schedules ds
+            JOIN schedules s ON s.id = ds.schedule_id
+            WHERE ds.is_active = 1
+            ORDER BY COALESCE(ds.effective_date, '') DESC, ds.id DESC
+        """):
+            snap.department_schedules.setdefault(int(r["department_id"]), []).append(
+                (r["effective_date"], r["end_date"], dict(r))
+            )
+    finally:
+        conn.close()
+
+    return snap
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+def get_snapshot() -> ScheduleSnapshot:
+    """
+    Current schedule snapshot. Reloads only when the schedule
+    data version moved (any process may have bumped it).
+    """
+    global _snapshot
+
+    version = data_versions.current(DOMAIN)
+    snap = _snapshot
+    if snap is not None and snap.version == version:
+        return snap
+
+    with _lock:
+        snap = _snapshot
+        if snap is not None and snap.version == version:
+            return snap
+        # Version is read before loading: a write racing with the load
+        # bumps past it, so the next read reloads again.
+        snap = _load(version)
+        _snapshot = snap
+        return snap
+
+
+def schedule_lookup():
+    """Cached (employee_id, weekday) -> schedule lookup for all employees."""
+    return get_snapshot().schedule_lookup()
+
+
+def bump_schedule_version() -> int:
+    """Call after committing any schedule write."""
+    from services import change_feed
+    change_feed.record_schedules()
+    return data_versions.bump(DOMAIN)
+
+
+def clear_cache():
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -0,0 +1,280 @@
+# services/schedule_engine.py
+"""
+Unified schedule precedence engine.
+
+Four schedule systems coexist:
+
+  override    employee_shift_overrides        (shifts.py, one day)
+  rotation    employee_shift_assignments
+              -> shift_rotations              (shifts.py, date ranges)
+  template    user_schedule_assignments
+              -> schedule_template_days       (payroll templates)
+  advanced    users.schedule_template_id
+              -> schedule_rules / shifts      (advanced_schedules.py)
+  department  users.department_id
+              -> department_schedules
+              -> schedules                    (enhancements schema)
+
+For each (employee, date) the first source in PRECEDENCE that *claims*
+the day decides it, including when it says "day off":
+
+  override    a row exists for that date (NULL shift = day off)
+  rotation    an assignment is active on that date
+  template    the employee has a template assignment
+              (no template day for the weekday = day off)
+  advanced    the employee has an advanced template with rules
+  department  the department has an active schedule covering the date
+              (is_off_day / not is_workday = day off)
+
+resolve_schedules() resolves N employees x M dates in one call from
+the schedule cache snapshot (no SQL when warm) and returns a dense
+ScheduleGrid. Cells are read-only dicts in the get_user_schedule()
+shape plus "source", "name", "break_minutes" and "overnight", or None
+for a day off / unscheduled day.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.schedule_cache import get_snapshot
+
+PRECEDENCE: Tuple[str, ...] = ("override", "rotation", "template", "advanced", "department")
+
+# Sources payroll and the dashboard resolve through (in PRECEDENCE
+# order). Defaults to templates only, which is what payroll has always
+# used; list more sources to apply the full precedence.
+_SOURCES_ENV = os.getenv("ATT_SCHEDULE_SOURCES", "template")
+
+
+def configured_sources() -> Tuple[str, ...]:
+    wanted = {s.strip() for s in _SOURCES_ENV.split(",") if s.strip()}
+    return tuple(s for s in PRECEDENCE if s in wanted)
+
+
+# --------------------------------------------------
+# Result
+# --------------------------------------------------
+class ScheduleGrid:
+    """
+    Dense employees x dates result.
+
+    cells[i][j]   effective schedule dict or None (no shift expected)
+    sources[i][j] source that decided the cell, None = unscheduled
+    """
+
+    def __init__(self, employees: List[str], dates: List[date]):
+        self.employees = employees
+        self.dates = dates
+        self.cells: List[List[Optional[dict]]] = []
+        self.sources: List[List[Optional[str]]] = []
+        self._emp_index = {e: i for i, e in enumerate(employees)}
+        self._date_index = {d: j for j, d in enumerate(dates)}
+
+    def _pos(self, employee_id, day: date):
+        i = self._emp_index.get(str(employee_id))
+        j = self._date_index.get(day)
+        if i is None or j is None:
+            return None
+        return i, j
+
+    def get(self, employee_id, day: date) -> Optional[dict]:
+        pos = self._pos(employee_id, day)
+        return None if pos is None else self.cells[pos[0]][pos[1]]
+
+    def source(self, employee_id, day: date) -> Optional[str]:
+        pos = self._pos(employee_id, day)
+        return None if pos is None else self.sources[pos[0]][pos[1]]
+
+    def row(self, employee_id) -> List[Optional[dict]]:
+        i = self._emp_index.get(str(employee_id))
+        return [None] * len(self.dates) if i is None else self.cells[i]
+
+    def __len__(self):
+        return len(self.employees)
+
+
+# --------------------------------------------------
+# Cell builders (memoized per resolve call: cells are shared)
+# --------------------------------------------------
+def _span_hours(start_time, end_time) -> Optional[float]:
+    from advanced_schedules import _minutes
+
+    start, end = _minutes(start_time), _minutes(end_time)
+    if start is None or end is None:
+        return None
+    if end <= start:
+        end += 24 * 60
+    return round((end - start) / 60, 2)
+
+
+def _cell(source, name, start_time, end_time, daily_hours=None, auto_heal=1,
+          allow_overtime=1, grace_in=0, grace_out=0, break_minutes=0, overnight=None):
+    if overnight is None:
+        overnight = int(bool(start_time and end_time and str(end_time) <= str(start_time)))
+    return {
+        "source": source,
+        "name": name,
+        "start_time": start_time,
+        "end_time": end_time,
+        "daily_hours": daily_hours if daily_hours is not None else _span_hours(start_time, end_time),
+        "auto_heal": auto_heal,
+        "allow_overtime": allow_overtime,
+        "grace_in_minutes": grace_in,
+        "grace_out_minutes": grace_out,
+        "break_minutes": break_minutes or 0,
+        "overnight": overnight,
+    }
+
+
+class _Cells:
+    def __init__(self, snap):
+        self.snap = snap
+        self._shift_types: Dict[int, Optional[dict]] = {}
+        self._templates: Dict[int, dict] = {}
+        self._advanced: Dict[Tuple[int, int], Optional[dict]] = {}
+        self._departments: Dict[int, Optional[dict]] = {}
+
+    def shift_type(self, source, shift_type_id) -> Optional[dict]:
+        key = (source, shift_type_id)
+        if key not in self._shift_types:
+            st = self.snap.shift_types.get(shift_type_id)
+            self._shift_types[key] = _cell(
+                source, st["name"], st["start_time"], st["end_time"],
+                break_minutes=st["break_minutes"], overnight=st["overnight"],
+            ) if st else None
+        return self._shift_types[key]
+
+    def template(self, day: dict) -> dict:
+        key = id(day)
+        if key not in self._templates:
+            self._templates[key] = _cell(
+                "template", None, day["start_time"], day["end_time"],
+                daily_hours=day["daily_hours"], auto_heal=day["auto_heal"],
+                allow_overtime=day["allow_overtime"],
+                grace_in=day["grace_in_minutes"], grace_out=day["grace_out_minutes"],
+            )
+        return self._templates[key]
+
+    def advanced(self, template_id: int, weekday: int) -> Optional[dict]:
+        from advanced_schedules import get_compiled_template
+
+        key = (template_id, weekday)
+        if key not in self._advanced:
+            shifts = get_compiled_template(template_id, self.snap).by_weekday[weekday]
+            if not shifts:
+                self._advanced[key] = None
+            else:
+                # Several shifts on one day: span first start -> last end
+                first = min(shifts, key=lambda s: (s.start_min is None, s.start_min))
+                last = max(shifts, key=lambda s: (s.end_min is not None, s.end_min or 0))
+                tpl = self.snap.templates_by_id.get(template_id) or {}
+                self._advanced[key] = _cell(
+                    "advanced", tpl.get("name"), first.start_time, last.end_time,
+                    grace_in=first.grace_minutes,
+                    break_minutes=sum(s.break_minutes for s in shifts),
+                )
+        return self._advanced[key]
+
+    def department(self, row: dict) -> Optional[dict]:
+        key = row["id"]
+        if key not in self._departments:
+            off = row["is_off_day"] or not (row["is_workday"] if row["is_workday"] is not None else 1)
+            self._departments[key] = None if off else _cell(
+                "department", row["name"], row["start_time"], row["end_time"],
+                daily_hours=row["daily_hours"], auto_heal=row["auto_heal"],
+                allow_overtime=row["allow_overtime"],
+                grace_in=row["grace_in_minutes"], grace_out=row["grace_out_minutes"],
+            )
+        return self._departments[key]
+
+
+# --------------------------------------------------
+# Engine
+# --------------------------------------------------
+def resolve_schedules(
+    employee_ids: Iterable,
+    dates: Iterable[date],
+    sources: Sequence[str] = PRECEDENCE,
+    snap=None,
+) -> ScheduleGrid:
+    """
+    Effective schedule for every (employee, date), applying PRECEDENCE
+    restricted to `sources`.
+    """
+    from shifts import active_rotation, rotation_shift_type_id
+
+    snap = snap or get_snapshot()
+    employees = list(dict.fromkeys(str(e) for e in employee_ids))
+    dates = list(dates)
+    grid = ScheduleGrid(employees, dates)
+
+    use = set(sources)
+    order = [s for s in PRECEDENCE if s in use]
+    cells = _Cells(snap)
+
+    day_strs = [d.isoformat() for d in dates]
+    weekdays = [d.weekday() for d in dates]
+
+    for emp in employees:
+        # Per-employee claims, looked up once
+        rotations = snap.assignments.get(emp) if "rotation" in use else None
+        has_template = "template" in use and emp in snap.template_users
+        adv_tid = snap.user_template_ids.get(emp) if "advanced" in use else None
+        if adv_tid is not None and not snap.rules_by_template.get(adv_tid):
+            adv_tid = None
+        dept = snap.user_departments.get(emp) if "department" in use else None
+        dept_rows = snap.department_schedules.get(dept) if dept is not None else None
+
+        row_cells: List[Optional[dict]] = []
+        row_sources: List[Optional[str]] = []
+
+        for d, ds, wd in zip(dates, day_strs, weekdays):
+            cell = None
+            src = None
+            for source in order:
+                if source == "override":
+                    key = (emp, ds)
+                    if key in snap.overrides:
+                        src = source
+                        cell = cells.shift_type(source, snap.overrides[key])
+                        break
+                elif source == "rotation":
+                    if rotations:
+                        pattern = active_rotation(snap, emp, ds)
+                        if pattern is not None:
+                            src = source
+                            cell = cells.shift_type(source, rotation_shift_type_id(pattern, d))
+                            break
+                elif source == "template":
+                    if has_template:
+                        src = source
+                        day = snap.template_days.get((emp, wd))
+                        cell = cells.template(day) if day else None
+                        break
+                elif source == "advanced":
+                    if adv_tid is not None:
+                        src = source
+                        cell = cells.advanced(adv_tid, wd)
+                        break
+                elif source == "department":
+                    if dept_rows:
+                        match = None
+                        for eff, end, sched in dept_rows:
+                            if (not eff or eff <= ds) and (not end or end >= ds):
+                                match = sched
+                                break
+                        if match is not None:
+                            src = source
+                            cell = cells.department(match)
+                            break
+
+            row_cells.append(cell)
+            row_sources.append(src)
+
+        grid.cells.append(row_cells)
+        grid.sources.append(row_sources)
+
+    return grid
@@ -1,7 +1,10 @@
 import sqlite3
 import os
 from datetime import time
+from typing import Dict, Optional, Tuple
+
 from db import get_conn
+from services.schedule_cache import bump_schedule_version, get_snapshot, schedule_lookup
 
 DB_PATH = os.getenv("ATT_DB", "/var/lib/attendance/attendance.db")
 
@@ -22,22 +25,8 @@ def _parse_hhmm(val: str) -> time:
 # -------------------------------------------------
 
 def list_templates():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    rows = cur.execute(
-        """
-        SELECT id, name, description
-        FROM schedule_templates
-        ORDER BY name
-        """
-    ).fetchall()
-
-    conn.close()
-
-    # Convert rows to dicts so Jinja can use .id, .name, etc.
-    return [dict(r) for r in rows]
+    # Dicts so Jinja can use .id, .name, etc. (copies: snapshot is shared)
+    return [dict(t) for t in get_snapshot().templates]
 
 
 # -------------------------------------------------
@@ -76,43 +65,36 @@ def assign_template_to_user(employee_id: str, template_id: int | None):
 
     conn.commit()
     conn.close()
+    bump_schedule_version()
 
 
 
 def get_user_schedule(employee_id: str, weekday: int):
     """
     Resolve schedule for an employee_id on a given weekday
-    using the NEW template-based system.
+    using the NEW template-based system (served from the schedule cache).
     """
-    conn = get_conn()
-    cur = conn.cursor()
+    schedule = schedule_lookup().get(employee_id, weekday)
+    return dict(schedule) if schedule else None
 
-    row = cur.execute(
-        """
-        SELECT
-            td.start_time,
-            td.end_time,
-            td.daily_hours,
-            td.auto_heal,
-            td.allow_overtime,
-            td.grace_in_minutes,
-            td.grace_out_minutes
-        FROM users u
-        JOIN user_schedule_assignments usa
-            ON usa.user_id = u.id
-        JOIN schedule_template_days td
-            ON td.template_id = usa.template_id
-        WHERE u.employee_id = ?
-          AND td.weekday = ?
-        """,
-        (str(employee_id), int(weekday)),
-    ).fetchone()
+# -------------------------------------------------
+# Template-day rows (loaded by services/schedule_cache.py)
+# -------------------------------------------------
 
-    conn.close()
+_SCHEDULE_COLUMNS = """
+    u.employee_id,
+    td.weekday,
+    td.start_time,
+    td.end_time,
+    td.daily_hours,
+    td.auto_heal,
+    td.allow_overtime,
+    td.grace_in_minutes,
+    td.grace_out_minutes
+"""
 
-    if not row:
-        return None
 
+def _schedule_from_row(row) -> dict:
     return {
         "start_time": row["start_time"],
         "end_time": row["end_time"],
@@ -123,96 +105,260 @@ def get_user_schedule(employee_id: str, weekday: int):
         "grace_out_minutes": row["grace_out_minutes"],
     }
 
-def rebuild_template_days(template_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
 
-    # Clear old expansion
-    cur.execute(
-        "DELETE FROM schedule_template_days WHERE template_id = ?",
-        (template_id,)
+class ScheduleLookup:
+    """
+    In-memory (employee_id, weekday) -> schedule map.
+    get() returns the same dict shape as get_user_schedule().
+    """
+
+    def __init__(self, days: Dict[Tuple[str, int], dict]):
+        self._days = days
+
+    def get(self, employee_id, weekday: int) -> Optional[dict]:
+        return self._days.get((str(employee_id), int(weekday)))
+
+    def __len__(self):
+        return len(self._days)
+
+
+# -------------------------------------------------
+# Template day expansion
+# Rules + shifts are expanded into schedule_template_days. Triggers
+# on schedule_rules / schedule_shifts record every touched template in
+# schedule_template_stale, so any writer (routes, bulk imports, the
+# sqlite3 shell) marks work; rebuild_stale_template_days() then
+# regenerates every stale template in one set-based transaction
+# (template by template when one of them cannot be expanded).
+# -------------------------------------------------
+
+_EXPAND_DAYS_SQL = """
+    INSERT INTO schedule_template_days (
+        template_id,
+        weekday,
+        start_time,
+        end_time,
+        daily_hours,
+        auto_heal,
+        allow_overtime,
+        grace_in_minutes,
+        grace_out_minutes
     )
+    SELECT
+        r.template_id,
+        CAST(d.weekday AS INTEGER),
+        s.start_time,
+        s.end_time,
+        CAST(
+          (strftime('%s', s.end_time) - strftime('%s', s.start_time)) / 3600
+          AS INTEGER
+        ),
+        1, 1, 0, 0
+    FROM schedule_rules r
+    JOIN schedule_shifts s ON s.rule_id = r.id
+    JOIN (
+        SELECT '0' AS weekday UNION
+        SELECT '1' UNION
+        SELECT '2' UNION
+        SELECT '3' UNION
+        SELECT '4' UNION
+        SELECT '5' UNION
+        SELECT '6'
+    ) d
+    WHERE {where}
+      AND instr(',' || r.weekdays || ',', ',' || d.weekday || ',') > 0
+"""
+
+_STALE_SELECT = "SELECT template_id FROM schedule_template_stale"
+
+_triggers_ready = False
+
+
+def ensure_template_day_triggers(cur):
+    """
+    Create the stale-template log and its triggers. On first install,
+    templates with rules but no expanded days are marked stale (edits
+    made before the triggers existed were never logged).
+    """
+    first_install = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schedule_template_stale'"
+    ).fetchone() is None
 
-    # Rebuild from rules + shifts
     cur.execute("""
-        INSERT INTO schedule_template_days (
-            template_id,
-            weekday,
-            start_time,
-            end_time,
-            daily_hours,
-            auto_heal,
-            allow_overtime,
-            grace_in_minutes,
-            grace_out_minutes
+        CREATE TABLE IF NOT EXISTS schedule_template_stale (
+            template_id INTEGER PRIMARY KEY,
+            marked_at   TEXT NOT NULL DEFAULT (datetime('now'))
         )
-        SELECT
-            r.template_id,
-            CAST(d.weekday AS INTEGER),
-            s.start_time,
-            s.end_time,
-            CAST(
-              (strftime('%s', s.end_time) - strftime('%s', s.start_time)) / 3600
-              AS INTEGER
-            ),
-            1, 1, 0, 0
-        FROM schedule_rules r
-        JOIN schedule_shifts s ON s.rule_id = r.id
-        JOIN (
-            SELECT '0' AS weekday UNION
-            SELECT '1' UNION
-            SELECT '2' UNION
-            SELECT '3' UNION
-            SELECT '4' UNION
-            SELECT '5' UNION
-            SELECT '6'
-        ) d
-        WHERE r.template_id = ?
-          AND instr(',' || r.weekdays || ',', ',' || d.weekday || ',') > 0
-    """, (template_id,))
+    """)
+
+    for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_schedule_rules_{op.lower()}_stale
+            AFTER {op} ON schedule_rules
+            BEGIN
+                INSERT OR IGNORE INTO schedule_template_stale (template_id)
+                VALUES ({ref}.template_id);
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_schedule_shifts_{op.lower()}_stale
+            AFTER {op} ON schedule_shifts
+            BEGIN
+                INSERT OR IGNORE INTO schedule_template_stale (template_id)
+                SELECT template_id FROM schedule_rules WHERE id = {ref}.rule_id;
+            END
+        """)
+
+    # A rule moved to another template leaves the old one stale too
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_rules_move_stale
+        AFTER UPDATE OF template_id ON schedule_rules
+        BEGIN
+            INSERT OR IGNORE INTO schedule_template_stale (template_id)
+            VALUES (OLD.template_id);
+        END
+    """)
+
+    if first_install:
+        # Same test as the old lazy guard: rules but nothing expanded
+        cur.execute("""
+            INSERT OR IGNORE INTO schedule_template_stale (template_id)
+            SELECT DISTINCT r.template_id
+            FROM schedule_rules r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM schedule_template_days td
+                WHERE td.template_id = r.template_id
+            )
+        """)
+
+
+def _conn_with_triggers():
+    global _triggers_ready
+    conn = get_conn()
+    if not _triggers_ready:
+        ensure_template_day_triggers(conn.cursor())
+        conn.commit()
+        _triggers_ready = True
+    return conn
 
+
+def mark_templates_stale(template_ids=None):
+    """Mark templates for rebuild (None = all templates)."""
+    conn = _conn_with_triggers()
+    if template_ids is None:
+        conn.execute("""
+            INSERT OR IGNORE INTO schedule_template_stale (template_id)
+            SELECT id FROM schedule_templates
+        """)
+    else:
+        conn.executemany(
+            "INSERT OR IGNORE INTO schedule_template_stale (template_id) VALUES (?)",
+            [(int(t),) for t in template_ids],
+        )
     conn.commit()
     conn.close()
 
-def ensure_template_days_exist(template_id: int):
+
+def _expand_template_days(cur, template_ids):
+    marks = ",".join("?" * len(template_ids))
+    cur.execute(
+        f"DELETE FROM schedule_template_days WHERE template_id IN ({marks})",
+        template_ids,
+    )
+    cur.execute(_EXPAND_DAYS_SQL.format(where=f"r.template_id IN ({marks})"), template_ids)
+
+
+def rebuild_stale_template_days(template_ids=None) -> int:
     """
-    Defensive guard:
-    If a template has rules/shifts but no materialized days,
-    rebuild automatically.
+    Regenerate schedule_template_days for every stale template (or for
+    the stale ones among template_ids) in one transaction. Returns the
+    number of templates rebuilt.
+
+    A template whose rules cannot be expanded (two shifts on one
+    weekday break UNIQUE(template_id, weekday)) is skipped and stays
+    stale; the other templates are still rebuilt.
     """
-    conn = get_conn()
+    conn = _conn_with_triggers()
     cur = conn.cursor()
 
-    has_rules = cur.execute(
-        "SELECT 1 FROM schedule_rules WHERE template_id = ? LIMIT 1",
-        (template_id,)
-    ).fetchone()
+    sql = _STALE_SELECT
+    params = []
+    if template_ids is not None:
+        params = [int(t) for t in template_ids]
+        if not params:
+            conn.close()
+            return 0
+        sql += f" WHERE template_id IN ({','.join('?' * len(params))})"
+
+    rebuilt = []
+    try:
+        # Writers block while we rebuild; marks made meanwhile wait
+        # for the next batch instead of being lost.
+        cur.execute("BEGIN IMMEDIATE")
+        stale = [r[0] for r in cur.execute(sql, params).fetchall()]
+        if stale:
+            cur.execute("SAVEPOINT rebuild_batch")
+            try:
+                _expand_template_days(cur, stale)
+                rebuilt = stale
+            except sqlite3.IntegrityError:
+                # Fall back to one template at a time to isolate the bad ones
+                cur.execute("ROLLBACK TO rebuild_batch")
+                for template_id in stale:
+                    cur.execute("SAVEPOINT rebuild_one")
+                    try:
+                        _expand_template_days(cur, [template_id])
+                        rebuilt.append(template_id)
+                    except sqlite3.IntegrityError as e:
+                        cur.execute("ROLLBACK TO rebuild_one")
+                        print(f"[schedule_templates] template {template_id} not rebuilt: {e}")
+                    cur.execute("RELEASE rebuild_one")
+            cur.execute("RELEASE rebuild_batch")
+            cur.executemany(
+                "DELETE FROM schedule_template_stale WHERE template_id = ?",
+                [(t,) for t in rebuilt],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    has_days = cur.execute(
-        "SELECT 1 FROM schedule_template_days WHERE template_id = ? LIMIT 1",
-        (template_id,)
-    ).fetchone()
+    if rebuilt:
+        bump_schedule_version()
+    return len(rebuilt)
 
-    conn.close()
 
-    if has_rules and not has_days:
-        rebuild_template_days(template_id)
+def rebuild_all_template_days() -> int:
+    mark_templates_stale(None)
+    return rebuild_stale_template_days()
+
+
+def rebuild_template_days(template_id: int):
+    mark_templates_stale([template_id])
+    rebuild_stale_template_days()
+
+
+def ensure_template_days_exist(template_id: int):
+    """
+    Defensive guard kept for old callers: rebuild this template when
+    it is stale.
+    """
+    rebuild_stale_template_days([template_id])
 
 
 def ensure_template_days_exist_for_user(employee_id: str):
     conn = get_conn()
-    cur = conn.cursor()
-
-    row = cur.execute(
+    row = conn.execute(
         """
         SELECT usa.template_id
         FROM users u
         JOIN user_schedule_assignments usa ON usa.user_id = u.id
         WHERE u.employee_id = ?
         """,
-        (employee_id,)
+        (employee_id,),
     ).fetchone()
-
     conn.close()
 
     if row and row["template_id"]:
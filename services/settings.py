@@ -44,6 +44,10 @@ def save_company_settings(name, rfc, logo_file=None):
     if logo_file:
         _save_logo(logo_file)
 
+    # Pages embed the company header (ETags, services/http_cache.py)
+    from services import data_versions
+    data_versions.bump("settings")
+
 
 def _save_logo(file_storage):
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,321 @@
+# services/shift_calendar.py
+"""
+Materialized expected-shift calendar.
+
+shifts.get_expected_shift() resolves override -> active rotation
+assignment -> weekly / cycle pattern for one (employee, day). Range
+lookups are served from employee_shift_calendar instead, which holds
+one row per working day over a rolling horizon
+(HORIZON_PAST_DAYS back, HORIZON_FUTURE_DAYS ahead):
+
+    (employee_id, date) -> shift_type_id
+
+Days off / unassigned days have no row. shift_types is joined at read
+time, so editing a shift type needs no regeneration.
+
+Writers call refresh_employees() / refresh_rotation() after committing;
+only the affected employees (and dates) are regenerated. The horizon
+rolls forward lazily on the first use of a new day.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import get_conn
+from services.schedule_cache import get_snapshot
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+HORIZON_PAST_DAYS = int(os.getenv("ATT_SHIFT_CALENDAR_PAST_DAYS", "90"))
+HORIZON_FUTURE_DAYS = int(os.getenv("ATT_SHIFT_CALENDAR_FUTURE_DAYS", "60"))
+
+# Keep IN (...) lists well under SQLite's variable limit
+_IN_BATCH = 500
+
+_tables_ready = False
+
+
+def ensure_shift_calendar_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS employee_shift_calendar (
+            employee_id   TEXT NOT NULL,
+            date          TEXT NOT NULL,
+            shift_type_id INTEGER NOT NULL,
+            PRIMARY KEY (employee_id, date)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_shift_calendar_date
+        ON employee_shift_calendar(date, employee_id)
+    """)
+
+    # Single row: the date range currently materialized
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS shift_calendar_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            horizon_start TEXT NOT NULL,
+            horizon_end   TEXT NOT NULL
+        )
+    """)
+
+
+def _conn():
+    global _tables_ready
+    conn = get_conn()
+    if not _tables_ready:
+        ensure_shift_calendar_tables(conn.cursor())
+        conn.commit()
+        _tables_ready = True
+    return conn
+
+
+# --------------------------------------------------
+# Generation
+# --------------------------------------------------
+def horizon(today: Optional[date] = None) -> Tuple[date, date]:
+    today = today or date.today()
+    return (
+        today - timedelta(days=HORIZON_PAST_DAYS),
+        today + timedelta(days=HORIZON_FUTURE_DAYS),
+    )
+
+
+def _calendar_employees(snap) -> set:
+    """Everyone with a rotation assignment or at least one override."""
+    return set(snap.assignments) | {emp for emp, _ in snap.overrides}
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _generate(conn, snap, employee_ids: Iterable[str], start: date, end: date):
+    from shifts import resolve_shift_type_id
+
+    days = _days(start, end)
+    rows = []
+    for emp in employee_ids:
+        for d in days:
+            shift_type_id = resolve_shift_type_id(snap, emp, d)
+            if shift_type_id is not None:
+                rows.append((emp, d.isoformat(), shift_type_id))
+
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO employee_shift_calendar (employee_id, date, shift_type_id)
+        VALUES (?, ?, ?)
+        """,
+        rows,
+    )
+
+
+def _sync_horizon(conn) -> Tuple[date, date]:
+    """
+    Make the stored horizon match today's. Rolling forward only drops
+    the oldest days and generates the newest ones; a missing state row
+    (first run, failed refresh) rebuilds everything.
+    """
+    want_start, want_end = horizon()
+
+    state = conn.execute(
+        "SELECT horizon_start, horizon_end FROM shift_calendar_state WHERE id = 1"
+    ).fetchone()
+    if (
+        state
+        and state["horizon_start"] == want_start.isoformat()
+        and state["horizon_end"] == want_end.isoformat()
+    ):
+        return want_start, want_end
+
+    # Serialize with other workers rolling the same horizon
+    conn.execute("BEGIN IMMEDIATE")
+    state = conn.execute(
+        "SELECT horizon_start, horizon_end FROM shift_calendar_state WHERE id = 1"
+    ).fetchone()
+
+    snap = get_snapshot()
+    employees = _calendar_employees(snap)
+
+    have_start = date.fromisoformat(state["horizon_start"]) if state else None
+    have_end = date.fromisoformat(state["horizon_end"]) if state else None
+
+    if state is None or have_start > want_start or have_end < want_start:
+        conn.execute("DELETE FROM employee_shift_calendar")
+        _generate(conn, snap, employees, want_start, want_end)
+    else:
+        conn.execute(
+            "DELETE FROM employee_shift_calendar WHERE date < ? OR date > ?",
+            (want_start.isoformat(), want_end.isoformat()),
+        )
+        if have_end < want_end:
+            _generate(conn, snap, employees, have_end + timedelta(days=1), want_end)
+
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO shift_calendar_state (id, horizon_start, horizon_end)
+        VALUES (1, ?, ?)
+        """,
+        (want_start.isoformat(), want_end.isoformat()),
+    )
+    conn.commit()
+    return want_start, want_end
+
+
+def _invalidate():
+    """Drop the state row so the next use rebuilds the whole calendar."""
+    try:
+        conn = _conn()
+        try:
+            conn.execute("DELETE FROM shift_calendar_state")
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"[shift_calendar] invalidate failed: {e}")
+
+
+# --------------------------------------------------
+# Incremental refresh (call after committing a shift write)
+# --------------------------------------------------
+def refresh_employees(
+    employee_ids: Iterable[str],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Regenerate the calendar for some employees, optionally limited to
+    [start, end] (clamped to the horizon).
+    """
+    ids = sorted({e for e in employee_ids if e})
+    if not ids:
+        return
+
+    failed = False
+    conn = _conn()
+    try:
+        h_start, h_end = _sync_horizon(conn)
+        start = max(start or h_start, h_start)
+        end = min(end or h_end, h_end)
+        if start > end:
+            return
+
+        snap = get_snapshot()
+        for i in range(0, len(ids), _IN_BATCH):
+            batch = ids[i:i + _IN_BATCH]
+            conn.execute(
+                f"""
+                DELETE FROM employee_shift_calendar
+                WHERE employee_id IN ({','.join('?' * len(batch))})
+                  AND date BETWEEN ? AND ?
+                """,
+                [*batch, start.isoformat(), end.isoformat()],
+            )
+        _generate(conn, snap, ids, start, end)
+        conn.commit()
+    except sqlite3.Error as e:
+        # The schedule write itself is already committed: never fail the
+        # caller, rebuild the calendar on next use instead.
+        conn.rollback()
+        print(f"[shift_calendar] refresh failed, full rebuild scheduled: {e}")
+        failed = True
+    finally:
+        conn.close()
+
+    if failed:
+        _invalidate()
+
+
+def refresh_rotation(rotation_id: int):
+    """Regenerate every employee ever assigned to a rotation."""
+    snap = get_snapshot()
+    refresh_employees(
+        emp
+        for emp, assignments in snap.assignments.items()
+        if any(rid == rotation_id for _, _, rid in assignments)
+    )
+
+
+def rebuild():
+    """Full regeneration (e.g. after editing shift tables by hand)."""
+    _invalidate()
+    conn = _conn()
+    try:
+        _sync_horizon(conn)
+    finally:
+        conn.close()
+
+
+# --------------------------------------------------
+# Range lookups
+# --------------------------------------------------
+def get_expected_shifts(
+    employee_ids: Optional[Iterable[str]],
+    start: date,
+    end: date,
+) -> Dict[Tuple[str, str], dict]:
+    """
+    Expected shifts for many employees over [start, end] (None = all).
+
+    Returns {(employee_id, 'YYYY-MM-DD'): shift}, shift having the same
+    shape as shifts.get_expected_shift(). Missing keys are days off.
+    Days inside the horizon come from one indexed query per batch;
+    days outside it are resolved from the schedule cache.
+    """
+    ids = None if employee_ids is None else sorted({e for e in employee_ids if e})
+    out: Dict[Tuple[str, str], dict] = {}
+    if ids == [] or start > end:
+        return out
+
+    conn = _conn()
+    try:
+        h_start, h_end = _sync_horizon(conn)
+
+        q_start, q_end = max(start, h_start), min(end, h_end)
+        if q_start <= q_end:
+            base = """
+                SELECT c.employee_id, c.date,
+                       st.id, st.name, st.start_time, st.end_time,
+                       st.break_minutes, st.overnight
+                FROM employee_shift_calendar c
+                JOIN shift_types st ON st.id = c.shift_type_id
+                WHERE c.date BETWEEN ? AND ?
+            """
+            params = [q_start.isoformat(), q_end.isoformat()]
+            batches = [None] if ids is None else [
+                ids[i:i + _IN_BATCH] for i in range(0, len(ids), _IN_BATCH)
+            ]
+            for batch in batches:
+                sql, args = base, params
+                if batch is not None:
+                    sql += f" AND c.employee_id IN ({','.join('?' * len(batch))})"
+                    args = params + batch
+                for r in conn.execute(sql, args):
+                    out[(r[0], r[1])] = {
+                        "shift_type_id": r[2],
+                        "name": r[3],
+                        "start_time": r[4],
+                        "end_time": r[5],
+                        "break_minutes": r[6],
+                        "overnight": r[7],
+                    }
+    finally:
+        conn.close()
+
+    # Outside the materialized horizon: resolve directly
+    outside = [d for d in _days(start, end) if d < h_start or d > h_end]
+    if outside:
+        from shifts import resolve_shift_type_id
+
+        snap = get_snapshot()
+        for emp in (ids if ids is not None else sorted(_calendar_employees(snap))):
+            for d in outside:
+                st = snap.shift_types.get(resolve_shift_type_id(snap, emp, d))
+                if st:
+                    out[(emp, d.isoformat())] = dict(st)
+
+    return out
@@ -0,0 +1,101 @@
+# services/timestamps.py
+"""
+Single timestamp parsing layer.
+
+Event timestamps are stored in two shapes:
+  - 'YYYY-MM-DD HH:MM:SS'              (collector-normalized, local wall clock)
+  - 'YYYY-MM-DDTHH:MM:SS-06:00'        (raw device / API values with offset)
+
+Both are parsed without dateutil. Anything else falls back to
+dateutil so odd legacy rows keep working. Results are memoized:
+a weekly payroll sees the same few thousand strings over and over.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from dateutil import parser as dtparser
+
+CACHE_SIZE = 65536
+
+
+# --------------------------------------------------
+# Parsing
+# --------------------------------------------------
+def _fast_parse(ts: str) -> Optional[datetime]:
+    """
+    Fixed-format fast path. Returns None when the string is not
+    one of the stored shapes (caller then falls back to dateutil).
+    """
+    n = len(ts)
+    if (
+        n < 19
+        or ts[4] != "-"
+        or ts[7] != "-"
+        or ts[10] not in " T"
+        or ts[13] != ":"
+        or ts[16] != ":"
+    ):
+        return None
+
+    try:
+        if n == 19:
+            return datetime(
+                int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                int(ts[11:13]), int(ts[14:16]), int(ts[17:19]),
+            )
+        if ts[-1] in "Zz":
+            ts = ts[:-1] + "+00:00"
+        return datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_iso(ts: str) -> Optional[datetime]:
+    """
+    Parse a stored timestamp as-is (offset-aware values stay aware).
+    Returns None for empty or unparsable input.
+    """
+    if not ts:
+        return None
+
+    dt = _fast_parse(ts)
+    if dt is not None:
+        return dt
+
+    try:
+        return dtparser.parse(ts)
+    except (ValueError, OverflowError):
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_local(ts: str) -> Optional[datetime]:
+    """
+    Parse a stored timestamp into a naive local wall-clock datetime.
+    Offset-aware values are converted to server local time.
+    """
+    dt = parse_iso(ts)
+    if dt is not None and dt.tzinfo:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def normalize_ts(ts: str) -> str:
+    """
+    Canonical storage format: 'YYYY-MM-DD HH:MM:SS' local time.
+    Raises ValueError for unparsable input.
+    """
+    dt = parse_local(ts)
+    if dt is None:
+        raise ValueError(f"Invalid timestamp: {ts!r}")
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def clear_cache():
+    parse_iso.cache_clear()
+    parse_local.cache_clear()
@@ -0,0 +1,114 @@
+# services/xlsx_export.py
+"""
+Streaming XLSX export engine (openpyxl write-only mode).
+
+Rows are serialized to the worksheet's temp file as they are appended,
+so memory stays flat however many employees are exported. Styles are
+registered once per workbook as named styles and cells only reference
+them (no per-cell Font/Fill objects, no post-pass over every cell).
+
+send() saves to a unique temp file, unlinks it as soon as it is
+opened and streams it to the client: concurrent exports never share
+a path and nothing is left behind in /tmp.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import Iterable, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+DURATION_FORMAT = "[h]:mm"
+
+# Style names usable with XlsxStream.cell()
+HEADER = "att_header"
+BOLD = "att_bold"
+DURATION = "att_duration"
+INACTIVE = "att_inactive"
+INACTIVE_DURATION = "att_inactive_duration"
+
+
+def _named_styles():
+    # NamedStyle instances bind to one workbook: build fresh per export
+    center = Alignment(horizontal="center", vertical="center")
+    header_fill = PatternFill("solid", fgColor="E9ECEF")    # light gray
+    inactive_fill = PatternFill("solid", fgColor="FDECEA")  # light red
+    return [
+        NamedStyle(HEADER, font=Font(bold=True), alignment=center, fill=header_fill),
+        NamedStyle(BOLD, font=Font(bold=True)),
+        NamedStyle(DURATION, number_format=DURATION_FORMAT),
+        NamedStyle(INACTIVE, fill=inactive_fill),
+        NamedStyle(INACTIVE_DURATION, fill=inactive_fill, number_format=DURATION_FORMAT),
+    ]
+
+
+def sheet_title(title: str) -> str:
+    """Excel-safe worksheet title (max 31 chars, no []:*?/\\)."""
+    for ch in "[]:*?/\\":
+        title = title.replace(ch, "-")
+    return title[:31] or "Sheet"
+
+
+class XlsxStream:
+    """
+    One-sheet write-only workbook.
+
+    Layout (freeze panes, column widths, merged ranges) must be set
+    before the first append(); rows are then written top to bottom.
+    """
+
+    def __init__(self, title: str):
+        self.wb = Workbook(write_only=True)
+        for style in _named_styles():
+            self.wb.add_named_style(style)
+        self.ws = self.wb.create_sheet(title=sheet_title(title))
+
+    # ---- layout
+    def freeze(self, cell: str):
+        self.ws.freeze_panes = cell
+
+    def width(self, column: str, width: float):
+        self.ws.column_dimensions[column].width = width
+
+    def merge(self, cell_range: str):
+        self.ws.merged_cells.add(cell_range)
+
+    # ---- rows
+    def cell(self, value=None, style: Optional[str] = None) -> WriteOnlyCell:
+        c = WriteOnlyCell(self.ws, value=value)
+        if style:
+            c.style = style
+        return c
+
+    def append(self, row: Iterable):
+        self.ws.append(row)
+
+    # ---- output
+    def save(self, target):
+        """Save to a path or binary file object."""
+        self.wb.save(target)
+
+    def send(self, download_name: str):
+        """Flask response streaming the workbook from an unlinked temp file."""
+        from flask import send_file
+
+        fd, path = tempfile.mkstemp(prefix="att_export_", suffix=".xlsx")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                self.save(fh)
+            stream = open(path, "rb")
+        finally:
+            os.unlink(path)
+
+        return send_file(
+            stream,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype=XLSX_MIMETYPE,
+        )
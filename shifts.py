@@ -3,6 +3,9 @@ import json
 
 from flask import render_template, request, redirect, url_for, flash, g
 
+from services import shift_calendar
+from services.schedule_cache import bump_schedule_version, get_snapshot
+
 
 def ensure_shift_tables(cur):
     """
@@ -77,71 +80,19 @@ def ensure_shift_tables(cur):
     """, (json.dumps(default_pattern),))
 
 
-def get_expected_shift(get_conn, employee_id, day: date):
-    """
-    Returns a dict like:
-    {
-        "shift_type_id": 1,
-        "name": "Morning",
-        "start_time": "08:00",
-        "end_time": "16:00",
-        "break_minutes": 30,
-        "overnight": 0
-    }
-    or None if no shift is assigned.
-    """
-    if not employee_id:
-        return None
-
-    conn = get_conn()
-    cur = conn.cursor()
-
-    day_str = day.strftime("%Y-%m-%d")
-
-    # 1) Check for explicit override
-    cur.execute("""
-        SELECT st.id, st.name, st.start_time, st.end_time, st.break_minutes, st.overnight
-        FROM employee_shift_overrides o
-        LEFT JOIN shift_types st ON o.shift_type_id = st.id
-        WHERE o.employee_id = ? AND o.date = ?
-    """, (employee_id, day_str))
-    row = cur.fetchone()
-
-    if row:
-        if row[0] is None:
-            conn.close()
-            return None
-        shift = {
-            "shift_type_id": row[0],
-            "name": row[1],
-            "start_time": row[2],
-            "end_time": row[3],
-            "break_minutes": row[4],
-            "overnight": row[5],
-        }
-        conn.close()
-        return shift
-
-    # 2) Find the rotation assignment that's active for that day
-    cur.execute("""
-        SELECT r.id, r.pattern_json
-        FROM employee_shift_assignments a
-        JOIN shift_rotations r ON a.rotation_id = r.id
-        WHERE a.employee_id = ?
-          AND a.start_date <= ?
-          AND (a.end_date IS NULL OR a.end_date >= ?)
-        ORDER BY a.start_date DESC
-        LIMIT 1
-    """, (employee_id, day_str, day_str))
-
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return None
+def active_rotation(snap, employee_id, day_str):
+    """Pattern of the rotation assignment active on day_str, or None."""
+    for start_date, end_date, rotation_id in snap.assignments.get(employee_id, ()):
+        # Assignments whose rotation was deleted are skipped (old JOIN)
+        if rotation_id not in snap.rotations:
+            continue
+        if start_date <= day_str and (end_date is None or end_date >= day_str):
+            return snap.rotations[rotation_id]
+    return None
 
-    rotation_id, pattern_json = row
-    pattern = json.loads(pattern_json)
 
+def rotation_shift_type_id(pattern, day: date):
+    """Shift type id a weekly / cycle pattern gives for a day (None = off)."""
     weekday = day.weekday()  # Monday=0
     day_key = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"][weekday]
 
@@ -152,40 +103,77 @@ def get_expected_shift(get_conn, employee_id, day: date):
     elif pattern.get("type") == "cycle":
         start_str = pattern.get("start_date")
         if not start_str:
-            conn.close()
             return None
         start_dt = datetime.strptime(start_str, "%Y-%m-%d").date()
         days_diff = (day - start_dt).days
         if days_diff < 0:
-            conn.close()
             return None
         idx = days_diff % pattern["length"]
         shift_type_id = pattern["days"][idx]
 
     if not shift_type_id:
-        conn.close()
         return None  # day off
 
-    # 3) Load shift info
-    cur.execute("""
-        SELECT id, name, start_time, end_time, break_minutes, overnight
-        FROM shift_types
-        WHERE id = ?
-    """, (shift_type_id,))
-    st = cur.fetchone()
-    conn.close()
-
-    if not st:
+    # Pattern ids may be stored as strings
+    try:
+        return int(shift_type_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_shift_type_id(snap, employee_id, day: date):
+    """
+    Shift type id expected for an employee on a day, from a schedule
+    snapshot (overrides first, then the active rotation assignment).
+    None = day off / nothing assigned.
+    """
+    day_str = day.strftime("%Y-%m-%d")
+
+    # 1) Check for explicit override
+    key = (employee_id, day_str)
+    if key in snap.overrides:
+        return snap.overrides[key]
+
+    # 2) Find the rotation assignment that's active for that day
+    pattern = active_rotation(snap, employee_id, day_str)
+    if pattern is None:
         return None
 
-    return {
-        "shift_type_id": st[0],
-        "name": st[1],
-        "start_time": st[2],
-        "end_time": st[3],
-        "break_minutes": st[4],
-        "overnight": st[5],
+    return rotation_shift_type_id(pattern, day)
+
+
+def get_expected_shift(get_conn, employee_id, day: date):
+    """
+    Returns a dict like:
+    {
+        "shift_type_id": 1,
+        "name": "Morning",
+        "start_time": "08:00",
+        "end_time": "16:00",
+        "break_minutes": 30,
+        "overnight": 0
     }
+    or None if no shift is assigned.
+
+    Served from the versioned schedule cache (services.schedule_cache);
+    get_conn is kept for callers but no SQL runs when the cache is warm.
+    For date ranges use services.shift_calendar.get_expected_shifts().
+    """
+    if not employee_id:
+        return None
+
+    snap = get_snapshot()
+    st = snap.shift_types.get(resolve_shift_type_id(snap, employee_id, day))
+    return dict(st) if st else None
+
+
+def _refresh_override_day(employee_id, date_str):
+    """Regenerate one override day in the shift calendar."""
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        day = None
+    shift_calendar.refresh_employees([employee_id], day, day)
 
 
 def register_shift_routes(app, get_conn, get_all_employees):
@@ -218,6 +206,7 @@ def register_shift_routes(app, get_conn, get_all_employees):
             VALUES (?, ?, ?, ?, ?)
         """, (name, start, end, break_min, overnight))
         conn.commit()
+        bump_schedule_version()
         conn.close()
         return redirect(url_for("shift_types_list", lang=g.lang))
 
@@ -227,6 +216,7 @@ def register_shift_routes(app, get_conn, get_all_employees):
         cur = conn.cursor()
         cur.execute("DELETE FROM shift_types WHERE id=?", (id,))
         conn.commit()
+        bump_schedule_version()
         conn.close()
         return redirect(url_for("shift_types_list", lang=g.lang))
 
@@ -286,6 +276,7 @@ def register_shift_routes(app, get_conn, get_all_employees):
             VALUES (?, ?, ?)
         """, (name, ptype, json.dumps(pattern)))
         conn.commit()
+        bump_schedule_version()
         conn.close()
 
         return redirect(url_for("shift_rotations_list", lang=g.lang))
@@ -296,7 +287,9 @@ def register_shift_routes(app, get_conn, get_all_employees):
         cur = conn.cursor()
         cur.execute("DELETE FROM shift_rotations WHERE id=?", (rotation_id,))
         conn.commit()
+        bump_schedule_version()
         conn.close()
+        shift_calendar.refresh_rotation(rotation_id)
         flash("Shift rotation deleted.", "success")
         return redirect(url_for("shift_rotations_list", lang=g.lang))
 
@@ -336,7 +329,9 @@ def register_shift_routes(app, get_conn, get_all_employees):
                     VALUES (?, ?, ?, ?)
                 """, (employee_id, rotation_id, start_date, end_date))
                 conn.commit()
+                bump_schedule_version()
                 conn.close()
+                shift_calendar.refresh_employees([employee_id])
 
                 flash("Shift assignment saved.", "success")
             else:
@@ -392,11 +387,14 @@ def register_shift_routes(app, get_conn, get_all_employees):
                     "end_date": rec[4],
                 }
 
-            # 7-day preview using get_expected_shift()
+            # 7-day preview (one calendar range query)
             today = datetime.now().date()
+            week = shift_calendar.get_expected_shifts(
+                [selected_id], today, today + timedelta(days=6)
+            )
             for i in range(7):
                 d = today + timedelta(days=i)
-                shift = get_expected_shift(get_conn, selected_id, d)
+                shift = week.get((selected_id, d.isoformat()))
                 if shift:
                     label = f"{shift['name']} {shift['start_time']}–{shift['end_time']}"
                 else:
@@ -420,9 +418,15 @@ def register_shift_routes(app, get_conn, get_all_employees):
     def shifts_assignment_delete(assign_id):
         conn = get_conn()
         cur = conn.cursor()
+        row = cur.execute(
+            "SELECT employee_id FROM employee_shift_assignments WHERE id=?", (assign_id,)
+        ).fetchone()
         cur.execute("DELETE FROM employee_shift_assignments WHERE id=?", (assign_id,))
         conn.commit()
+        bump_schedule_version()
         conn.close()
+        if row:
+            shift_calendar.refresh_employees([row[0]])
         flash("Assignment deleted.", "success")
         return redirect(url_for("shift_assignments", lang=g.lang))
 
@@ -487,7 +491,9 @@ def register_shift_routes(app, get_conn, get_all_employees):
                 """, (emp_id, rotation_id, start_date))
 
             conn.commit()
+            bump_schedule_version()
             conn.close()
+            shift_calendar.refresh_employees(e.strip() for e in selected_emps)
             flash(f"Assigned rotation to {len(selected_emps)} employees.", "success")
             return redirect(url_for("shift_assignments", lang=g.lang))
 
@@ -559,6 +565,8 @@ def register_shift_routes(app, get_conn, get_all_employees):
                         d += timedelta(days=1)
 
                     conn.commit()
+                    bump_schedule_version()
+                    shift_calendar.refresh_employees([employee_id], start_dt, end_dt)
                     flash("Override(s) created.", "success")
 
         # shift types for dropdown
@@ -597,7 +605,9 @@ def register_shift_routes(app, get_conn, get_all_employees):
             VALUES (?, ?, ?)
         """, (emp, date_str, stype))
         conn.commit()
+        bump_schedule_version()
         conn.close()
+        _refresh_override_day(emp, date_str)
 
         return redirect(url_for("shift_overrides", lang=g.lang))
 
@@ -605,9 +615,15 @@ def register_shift_routes(app, get_conn, get_all_employees):
     def shifts_override_delete(override_id):
         conn = get_conn()
         cur = conn.cursor()
+        row = cur.execute(
+            "SELECT employee_id, date FROM employee_shift_overrides WHERE id=?", (override_id,)
+        ).fetchone()
         cur.execute("DELETE FROM employee_shift_overrides WHERE id=?", (override_id,))
         conn.commit()
+        bump_schedule_version()
         conn.close()
+        if row:
+            _refresh_override_day(row[0], row[1])
         flash("Override deleted.", "success")
         return redirect(url_for("shift_overrides", lang=g.lang))
 
@@ -686,7 +702,9 @@ def register_shift_routes(app, get_conn, get_all_employees):
         """, (employee_id, rotation_id, today))
 
         conn.commit()
+        bump_schedule_version()
         conn.close()
+        shift_calendar.refresh_employees([employee_id])
 
         flash("Shift updated.", "success")
         return redirect(url_for("shifts_users_page"))
@@ -14,6 +14,26 @@ LANG = {
         "apply": "Apply",
         "download_excel": "Download Excel",
         "download_pdf": "Download PDF",
+        "signature_sheets": "Signature sheets",
+        "search": "Search",
+        "all_departments": "All departments",
+        "all_flags": "All flags",
+        "loading": "Loading...",
+        "close_period": "Close period",
+        "reopen_period": "Reopen period",
+        "confirm_close_period": "Close this period? Its payroll will be frozen.",
+        "period_closed": "Period closed",
+        "period_reopened": "Period reopened",
+        "period_closed_on": "Closed on",
+        "period_late_changes": "Data changed after closing.",
+        "reconciliation": "Reconciliation",
+        "reconcile_in_sync": "The live payroll matches the closed snapshot.",
+        "snapshot": "Snapshot",
+        "live": "Live",
+        "changed_employees": "Changed",
+        "added_employees": "Added since closing",
+        "removed_employees": "Removed since closing",
+        "note": "Note",
         "start_date": "Start Date",
         "end_date": "End Date",
         "employee_id": "Employee ID",
@@ -109,6 +129,10 @@ LANG = {
         "mon_fri": "Monday to Friday",
         "mon_sat": "Monday to Saturday",
         "sun_sat": "Sunday to Saturday",
+        "biweekly": "Bi-weekly",
+        "semimonthly": "Semi-monthly",
+        "monthly": "Monthly",
+        "custom_period": "Custom period",
         "months_short": ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
                          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
         "all_users": "All users",
@@ -364,6 +388,26 @@ LANG = {
         "apply": "Aplicar",
         "download_excel": "Descargar Excel",
         "download_pdf": "Descargar PDF",
+        "signature_sheets": "Hojas de firma",
+        "search": "Buscar",
+        "all_departments": "Todos los departamentos",
+        "all_flags": "Todos los indicadores",
+        "loading": "Cargando...",
+        "close_period": "Cerrar periodo",
+        "reopen_period": "Reabrir periodo",
+        "confirm_close_period": "¿Cerrar este periodo? Su nómina quedará congelada.",
+        "period_closed": "Periodo cerrado",
+        "period_reopened": "Periodo reabierto",
+        "period_closed_on": "Cerrado el",
+        "period_late_changes": "Los datos cambiaron después del cierre.",
+        "reconciliation": "Conciliación",
+        "reconcile_in_sync": "La nómina actual coincide con la instantánea cerrada.",
+        "snapshot": "Instantánea",
+        "live": "Actual",
+        "changed_employees": "Con cambios",
+        "added_employees": "Agregados después del cierre",
+        "removed_employees": "Eliminados después del cierre",
+        "note": "Nota",
         "start_date": "Fecha de inicio",
         "end_date": "Fecha de fin",
         "employee_id": "ID Empleado",
@@ -459,6 +503,10 @@ LANG = {
         "mon_fri": "Lunes a Viernes",
         "mon_sat": "Lunes a Sabado",
         "sun_sat": "Domingo a Sabado",
+        "biweekly": "Quincenal (14 dias)",
+        "semimonthly": "Quincenal (1-15 / 16-fin)",
+        "monthly": "Mensual",
+        "custom_period": "Periodo personalizado",
         "months_short": ["Ene", "Feb", "Mar", "Abr", "May", "Jun",
                          "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"],
         "nav_users": "Usuarios",